@@ -18,12 +18,70 @@ def create_app(test_config=None):
         app.config.from_mapping(
             SQLALCHEMY_DATABASE_URI=os.getenv('DATABASE_URL', 'sqlite:///:memory:'), # Default to in-memory for safety
             SQLALCHEMY_TRACK_MODIFICATIONS=False,
+            OPENAI_BASE_URL=os.getenv('OPENAI_BASE_URL'), # e.g. the fake API in loadtest/fake_openai.py
+            SECRET_KEY=os.getenv('SECRET_KEY'), # signs session tokens; shared by all workers
             # Add other default configurations here
         )
     else:
         # load the test config if passed in
         app.config.from_mapping(test_config)
-    
+
+    # Defaults for optional features; values from test_config take precedence
+    app.config.setdefault('ANALYSIS_CACHE_ENABLED', True)
+    app.config.setdefault('ANALYSIS_CACHE_SIZE', 1024)     # max cached interpretations
+    app.config.setdefault('ANALYSIS_CACHE_TTL', 6 * 3600)  # seconds
+    app.config.setdefault('ANALYSIS_SINGLE_FLIGHT', True)  # coalesce identical in-flight requests
+    app.config.setdefault('ANALYSIS_LOCAL_FAST_PATH', True) # answer canonical times from hours.json
+    app.config.setdefault('ANALYSIS_STORE_ENABLED', True) # serve message-less times from pregenerated_analyses
+    app.config.setdefault('HOURS_DATA_DIR', os.path.join(os.path.dirname(app.root_path), 'migration_data'))
+    app.config.setdefault('ANALYSIS_BATCH_MAX_ITEMS', 50)
+    app.config.setdefault('ANALYSIS_BATCH_MAX_WORKERS', 8) # fan-out threads per batch request
+    app.config.setdefault('ANALYSIS_JOB_WORKERS', 4)       # background threads for /api/analyze/jobs
+    app.config.setdefault('ANALYSIS_JOB_QUEUE_SIZE', 100)  # queued jobs before answering 429
+    app.config.setdefault('ANALYSIS_JOB_RESULT_TTL', 600)  # seconds a finished job stays pollable
+    app.config.setdefault('OPENAI_BASE_URL', None)         # None uses the public OpenAI endpoint
+    app.config.setdefault('OPENAI_MAX_CONCURRENCY', 8)     # in-flight upstream calls per process
+    app.config.setdefault('OPENAI_TIMEOUT', 30)            # seconds per completion call
+    app.config.setdefault('OPENAI_MAX_RETRIES', 0)         # SDK retries per call; each may take OPENAI_TIMEOUT
+    app.config.setdefault('OPENAI_ACQUIRE_TIMEOUT', 5)     # seconds to wait for a free upstream slot
+    app.config.setdefault('OPENAI_BREAKER_THRESHOLD', 5)   # consecutive APIErrors before failing fast
+    app.config.setdefault('OPENAI_BREAKER_RESET', 30)      # seconds before a trial call is let through
+    app.config.setdefault('HISTORY_UNPAGINATED_COMPAT', True) # no limit/after: return the full list
+    app.config.setdefault('HISTORY_PAGE_DEFAULT_LIMIT', 50)
+    app.config.setdefault('HISTORY_PAGE_MAX_LIMIT', 200)
+    app.config.setdefault('HISTORY_BATCH_MAX_ITEMS', 500)  # items per batch create/delete request
+    app.config.setdefault('HISTORY_CACHE_ENABLED', True)
+    app.config.setdefault('HISTORY_CACHE_USERS', 1024)     # users whose serialized lists are kept
+    app.config.setdefault('HISTORY_CACHE_MAX_BYTES', 32 * 1024 * 1024) # total size of the cached bodies
+    app.config.setdefault('HISTORY_EXPORT_BATCH_SIZE', 500) # rows fetched per round trip when exporting
+    app.config.setdefault('HISTORY_WRITE_BEHIND', False)   # POST /api/history/ queues rows and answers 202
+    app.config.setdefault('HISTORY_WRITE_BEHIND_BATCH', 200) # rows per flush transaction
+    app.config.setdefault('HISTORY_WRITE_BEHIND_INTERVAL', 0.5) # seconds a row may wait for a flush
+    app.config.setdefault('HISTORY_WRITE_BEHIND_MAX_DEPTH', 10000) # queued rows before answering 503
+    app.config.setdefault('HISTORY_RETENTION_DAYS', 365)   # default age for `flask archive-history`
+    app.config.setdefault('HISTORY_DETAILS_AS_JSON', False) # return stored JSON details as objects, not strings
+    app.config.setdefault('JSON_FAST_PROVIDER', True)      # encode JSON with orjson when installed; same output either way
+    app.config.setdefault('PASSWORD_HASH_METHOD', 'scrypt')   # or 'pbkdf2:sha256'; Werkzeug method names
+    app.config.setdefault('PASSWORD_HASH_ITERATIONS', None)   # PBKDF2 iterations / scrypt N; None keeps the default
+    app.config.setdefault('PASSWORD_HASH_WORKERS', 2)      # hashing processes; 0 hashes on the request thread
+    app.config.setdefault('PASSWORD_HASH_MAX_PENDING', 32) # queued or running hashes before answering 503
+    app.config.setdefault('PASSWORD_HASH_QUEUE_TIMEOUT', 2) # seconds to wait for a free hashing slot
+    app.config.setdefault('LOGIN_THROTTLE_ENABLED', True)
+    app.config.setdefault('LOGIN_THROTTLE_IP_PER_MINUTE', 30)  # sustained login attempts per client IP
+    app.config.setdefault('LOGIN_THROTTLE_IP_BURST', 30)
+    app.config.setdefault('LOGIN_THROTTLE_USERNAME_PER_MINUTE', 5) # sustained attempts per username
+    app.config.setdefault('LOGIN_THROTTLE_USERNAME_BURST', 10)
+    app.config.setdefault('LOGIN_THROTTLE_MAX_KEYS', 100000) # tracked IPs / usernames before LRU eviction
+    app.config.setdefault('SESSION_TOKEN_MAX_AGE', 7 * 24 * 3600) # seconds a login token stays valid
+    app.config.setdefault('SESSION_TOKEN_CACHE_SIZE', 4096) # recently verified tokens kept in memory
+    app.config.setdefault('SESSION_TOKEN_REQUIRED', False) # history routes reject requests without a token
+    app.config.setdefault('SQL_PROFILE', 'basic')          # 'off', 'basic' or 'debug' (also logs every statement)
+    app.config.setdefault('SQL_QUERY_BUDGET', 10)          # statements per request before a warning is logged
+    app.config.setdefault('SQL_N_PLUS_ONE_THRESHOLD', 5)   # repeats of one statement that look like N+1
+    app.config.setdefault('SQL_SERVER_TIMING', True)       # report DB time and query counts in Server-Timing
+    app.config.setdefault('METRICS_ENABLED', True)
+    app.config.setdefault('METRICS_PATH', '/metrics')
+
     # Ensure the instance folder exists (if using instance-relative config)
     try:
         os.makedirs(app.instance_path)
@@ -33,8 +91,90 @@ def create_app(test_config=None):
     # app.config['SQLALCHEMY_DATABASE_URI'] = os.getenv('DATABASE_URL')
     # app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 
+    # ISO 8601 dates in every response; JSON_FAST_PROVIDER only picks the encoder
+    from app.services.json_provider import FastJSONProvider
+    app.json = FastJSONProvider(app)
+
     # Initialize extensions
     db.init_app(app)
+    # Registers the DDL that creates the history full-text index along with history_items
+    from app.services import search  # noqa: F401
+
+    # Request, SQL and upstream instrumentation exposed in Prometheus format at /metrics
+    from app.services import metrics
+    app.extensions['metrics'] = None
+    if app.config['METRICS_ENABLED']:
+        metrics.init_app(app)
+
+    # Per-request SQL counts, query budget, repeated / N+1 statement warnings, Server-Timing
+    from app.services import sql_profile
+    sql_profile.init_app(app, db)
+
+    # Response cache for /api/analyze/, keyed on normalized (time, message, language)
+    from app.services.cache import LRUCache
+    app.extensions['analysis_cache'] = None
+    if app.config['ANALYSIS_CACHE_ENABLED']:
+        app.extensions['analysis_cache'] = LRUCache(
+            maxsize=app.config['ANALYSIS_CACHE_SIZE'],
+            ttl=app.config['ANALYSIS_CACHE_TTL'],
+        )
+
+    # Serialized GET /api/history/<user_id> responses, tagged with the user's history version
+    from app.services.history_cache import HistoryCache
+    app.extensions['history_cache'] = None
+    if app.config['HISTORY_CACHE_ENABLED']:
+        app.extensions['history_cache'] = HistoryCache(
+            maxsize=app.config['HISTORY_CACHE_USERS'],
+            max_bytes=app.config['HISTORY_CACHE_MAX_BYTES'],
+        )
+
+    # Coalesces concurrent identical analysis requests onto one upstream call
+    from app.services.singleflight import SingleFlight
+    app.extensions['analysis_flight'] = SingleFlight() if app.config['ANALYSIS_SINGLE_FLIGHT'] else None
+
+    # Read-only index of the curated interpretations for canonical mirror hours
+    from app.services.hours import load_hours_index
+    app.extensions['hours_index'] = None
+    if app.config['ANALYSIS_LOCAL_FAST_PATH']:
+        app.extensions['hours_index'] = load_hours_index(app.config['HOURS_DATA_DIR'], app.logger)
+
+    # One pooled OpenAI client per app, shared by all request threads
+    from app.services.openai_client import OpenAIClientManager
+    app.extensions['openai_client'] = OpenAIClientManager.from_config(app.config, app.extensions['metrics'])
+
+    # Background workers for POST /api/analyze/jobs; threads start on the first job
+    from app.services.analysis import analyze, error_details
+    from app.services.jobs import JobQueue
+    app.extensions['analysis_jobs'] = JobQueue.from_config(app, analyze, error_details)
+
+    # Process pool for password hashing and verification, started on first use
+    from app.services.passwords import PasswordHasher
+    app.extensions['password_hasher'] = PasswordHasher.from_config(app.config)
+
+    # In-memory token buckets checked by /api/users/login before any password work
+    from app.services.throttle import TokenBucketLimiter
+    app.extensions['login_throttle'] = None
+    if app.config['LOGIN_THROTTLE_ENABLED']:
+        app.extensions['login_throttle'] = {
+            scope: TokenBucketLimiter(
+                rate=app.config[f'LOGIN_THROTTLE_{scope.upper()}_PER_MINUTE'] / 60,
+                burst=app.config[f'LOGIN_THROTTLE_{scope.upper()}_BURST'],
+                maxsize=app.config['LOGIN_THROTTLE_MAX_KEYS'],
+            )
+            for scope in ('ip', 'username')
+        }
+
+    # Signs the tokens issued by /api/users/login and verifies them on history routes; None without SECRET_KEY
+    from app.services.tokens import SessionTokens
+    app.extensions['session_tokens'] = SessionTokens.from_config(app)
+
+    # Optional write-behind buffer for POST /api/history/; flushed in batches and at exit
+    from app.routes.history import write_history_rows
+    from app.services.write_behind import WriteBehindBuffer
+    app.extensions['history_write_buffer'] = None
+    if app.config['HISTORY_WRITE_BEHIND']:
+        app.extensions['history_write_buffer'] = WriteBehindBuffer.from_config(
+            app, write_history_rows, group_key=lambda row: row['user_id'], metrics=app.extensions['metrics'])
 
     # Register blueprints here
     from app.routes import all_blueprints
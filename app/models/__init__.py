@@ -1,5 +1,8 @@
 from .user import User
 from .history_item import HistoryItem
+from .analysis_entry import PregeneratedAnalysis
+from .history_archive import HistoryArchive
+from .history_stat import HistoryStat
 
 # You can also define __all__ if you want to control what `from app.models import *` imports
-# __all__ = ['User', 'HistoryItem']
+# __all__ = ['User', 'HistoryItem', 'PregeneratedAnalysis', 'HistoryArchive', 'HistoryStat']
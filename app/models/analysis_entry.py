@@ -0,0 +1,17 @@
+from app import db
+from sqlalchemy import Column, Integer, String, Text, DateTime, UniqueConstraint, func
+
+class PregeneratedAnalysis(db.Model):
+    __tablename__ = 'pregenerated_analyses'
+    __table_args__ = (
+        UniqueConstraint('time', 'language', name='uq_pregenerated_analyses_time_language'),
+    )
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    time = Column(String(5), nullable=False) # Normalized "HH:MM"
+    language = Column(String(8), nullable=False) # "en" or "fr"
+    analysis = Column(Text, nullable=False)
+    created_at = Column(DateTime, nullable=False, server_default=func.now())
+
+    def __repr__(self):
+        return f'<PregeneratedAnalysis {self.time} ({self.language})>'
@@ -0,0 +1,25 @@
+from app import db
+from sqlalchemy import Column, Integer, DateTime, LargeBinary, ForeignKey, Index, func
+from sqlalchemy.orm import deferred
+
+class HistoryArchive(db.Model):
+    """A batch of one user's old history items, moved out of history_items by archive-history.
+
+    `payload` is the zlib-compressed JSON list of the archived items; it is deferred so
+    listing a user's archives never loads it.
+    """
+    __tablename__ = 'history_archives'
+    __table_args__ = (
+        Index('ix_history_archives_user_newest', 'user_id', 'newest_saved_at'),
+    )
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    user_id = Column(Integer, ForeignKey('users.id'), nullable=False)
+    item_count = Column(Integer, nullable=False)
+    oldest_saved_at = Column(DateTime, nullable=False)
+    newest_saved_at = Column(DateTime, nullable=False)
+    payload = deferred(Column(LargeBinary(16 * 1024 * 1024), nullable=False)) # MEDIUMBLOB on MySQL
+    created_at = Column(DateTime, nullable=False, server_default=func.now())
+
+    def __repr__(self):
+        return f'<HistoryArchive {self.id} for User {self.user_id} ({self.item_count} items)>'
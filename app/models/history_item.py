@@ -1,9 +1,14 @@
 from app import db
-from sqlalchemy import Column, Integer, String, Text, DateTime, ForeignKey, func
+from sqlalchemy import Column, Integer, String, Text, DateTime, ForeignKey, Index, func
 from sqlalchemy.orm import relationship
 
 class HistoryItem(db.Model):
     __tablename__ = 'history_items'
+    __table_args__ = (
+        # Matches the list query: WHERE user_id = ? ORDER BY saved_at DESC, id DESC (plus keyset paging),
+        # so MySQL can walk the index instead of filesorting. Also serves the user_id foreign key.
+        Index('ix_history_items_user_saved_at_id', 'user_id', 'saved_at', 'id'),
+    )
 
     id = Column(Integer, primary_key=True, autoincrement=True)
     user_id = Column(Integer, ForeignKey('users.id'), nullable=False)
@@ -0,0 +1,19 @@
+from app import db
+from sqlalchemy import Column, Integer, String, ForeignKey
+
+class HistoryStat(db.Model):
+    """Rollup of a user's history: how many items fall in one bucket of one dimension.
+
+    Dimensions are 'time' (the mirror time as saved), 'type' and 'day' (UTC date of
+    saved_at, ISO format); weeks are summed from days at read time. Rows are updated
+    in the same transaction as the history change (see app.services.history_stats).
+    """
+    __tablename__ = 'history_stats'
+
+    user_id = Column(Integer, ForeignKey('users.id'), primary_key=True)
+    dimension = Column(String(8), primary_key=True)
+    bucket = Column(String(80), primary_key=True)
+    count = Column(Integer, nullable=False, default=0)
+
+    def __repr__(self):
+        return f'<HistoryStat {self.user_id} {self.dimension}={self.bucket}: {self.count}>'
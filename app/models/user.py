@@ -7,8 +7,11 @@ class User(db.Model):
 
     id = Column(Integer, primary_key=True, autoincrement=True)
     username = Column(String(80), unique=True, nullable=False)
-    password = Column(String(120), nullable=False)
+    password = Column(String(255), nullable=False) # scrypt hashes are 162 characters
     email = Column(String(120), unique=True, nullable=False)
+    # Bumped in the same transaction as every change to the user's history; backs the
+    # ETag of GET /api/history/<user_id>
+    history_version = Column(Integer, nullable=False, default=0, server_default='0')
 
     # Relationship to HistoryItem
     history_items = relationship('HistoryItem', backref='user', lazy=True)
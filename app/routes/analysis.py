@@ -1,68 +1,171 @@
-from flask import Blueprint, request, jsonify, current_app
-import os
-import openai # Placeholder for the actual library name if different
+import json
+from concurrent.futures import ThreadPoolExecutor
+from flask import Blueprint, Response, current_app, request, jsonify, stream_with_context, url_for
+from app.services.analysis import analyze, stream_analysis, cache_key, AnalysisError
+from app.services.jobs import QueueFullError
 
 analysis_bp = Blueprint('analysis_bp', __name__, url_prefix='/api/analyze')
 
+
+def _parse_analysis_request(data):
+    """Validate an analysis payload. Returns ((time, message, language), None) or (None, error message)."""
+    if not isinstance(data, dict):
+        return None, 'Request body must be JSON'
+
+    time_str = data.get('time')
+    message = data.get('message', None) # Optional
+    language = data.get('language', 'en') # Optional, default 'en'
+
+    if not time_str:
+        return None, 'Missing required field: time'
+    return (time_str, message, language), None
+
+
 @analysis_bp.route('/', methods=['POST'])
 def analyze_time_message():
     data = request.get_json()
     if not data:
         return jsonify({'message': 'Request body must be JSON'}), 400
 
-    time_str = data.get('time')
-    message = data.get('message', None) # Optional
-    language = data.get('language', 'en') # Optional, default 'en'
+    args, error = _parse_analysis_request(data)
+    if error:
+        return jsonify({'message': error}), 400
 
-    if not time_str:
-        return jsonify({'message': 'Missing required field: time'}), 400
+    # Prompt construction, the response cache and the OpenAI call live in app.services.analysis
+    try:
+        result = analyze(*args)
+    except AnalysisError as e:
+        return jsonify(e.to_dict()), e.status_code, e.headers()
+
+    return jsonify(result)
+
+
+def _sse(data, event=None):
+    payload = f"data: {json.dumps(data, ensure_ascii=False)}\n\n"
+    return f"event: {event}\n{payload}" if event else payload
+
+
+@analysis_bp.route('/stream', methods=['POST'])
+def stream_time_message():
+    """Same input as analyze_time_message, answered as Server-Sent Events.
 
-    api_key = os.environ.get("OPENAI_API_KEY")
-    if not api_key:
-        current_app.logger.error("OPENAI_API_KEY not set in environment.")
-        return jsonify({'message': 'OpenAI API key not configured. Please contact administrator.'}), 500
+    Each token arrives as a `data: {"delta": ...}` event, followed by a final
+    `event: done` carrying the full analysis, or `event: error` if the upstream
+    call fails mid-stream.
+    """
+    data = request.get_json()
+    if not data:
+        return jsonify({'message': 'Request body must be JSON'}), 400
 
+    args, error = _parse_analysis_request(data)
+    if error:
+        return jsonify({'message': error}), 400
+
+    # Errors before the first token (missing key, open breaker, ...) still get a regular JSON response
     try:
-        client = openai.OpenAI(api_key=api_key)
-    except Exception as e:
-        current_app.logger.error(f"Failed to initialize OpenAI client: {str(e)}")
-        return jsonify({'message': 'Failed to initialize OpenAI service.', 'error': str(e)}), 500
+        chunks = stream_analysis(*args)
+    except AnalysisError as e:
+        return jsonify(e.to_dict()), e.status_code, e.headers()
+
+    def generate():
+        parts = []
+        try:
+            for chunk in chunks:
+                parts.append(chunk)
+                yield _sse({'delta': chunk})
+            yield _sse({'analysis': ''.join(parts).strip() or None}, event='done')
+        except AnalysisError as e:
+            yield _sse(e.to_dict(), event='error')
+        finally:
+            close = getattr(chunks, 'close', None)
+            if close is not None:
+                close()
+
+    headers = {'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    return Response(stream_with_context(generate()), mimetype='text/event-stream', headers=headers)
+
+
+def _analyze_in_app_context(app, args):
+    with app.app_context():
+        try:
+            return analyze(*args), None
+        except AnalysisError as e:
+            return None, e
+
+
+@analysis_bp.route('/batch', methods=['POST'])
+def analyze_batch():
+    """Analyze a list of {time, message, language} objects in one request.
 
+    Accepts either a JSON array or {"items": [...]}. Upstream calls run concurrently on a
+    bounded thread pool; results come back in input order, each with either an
+    `analysis` or an `error` and its own `status`.
+    """
+    data = request.get_json(silent=True)
+    items = data.get('items') if isinstance(data, dict) else data
+    if not isinstance(items, list) or not items:
+        return jsonify({'message': 'Request body must be a non-empty JSON array of items'}), 400
 
-    # Construct the prompt
-    if language == 'fr':
-        message_placeholder = message if message else "Pas de message fourni"
-        prompt = f"""Analysez l'heure miroir et le message suivants. Retournez une interprétation spirituelle concise et directe, sans commencer par "Interprétation en français:" :
+    max_items = current_app.config['ANALYSIS_BATCH_MAX_ITEMS']
+    if len(items) > max_items:
+        return jsonify({'message': f'Too many items in batch (maximum is {max_items})'}), 400
 
-Heure: {time_str}
-Message: {message_placeholder}
+    results = [None] * len(items)
+    pending = {} # normalized key -> (args, [indexes]); duplicates in a batch share one call
+    for index, item in enumerate(items):
+        args, error = _parse_analysis_request(item)
+        if not isinstance(item, dict):
+            error = 'Each item must be a JSON object'
+        if error:
+            results[index] = {'index': index, 'status': 400, 'error': {'message': error}}
+            continue
+        key = cache_key(*args)
+        pending.setdefault(key, (args, []))[1].append(index)
 
-Réponse:"""
-    else: # Default to English
-        message_placeholder = message if message else "No message provided"
-        prompt = f"""Analyze the following mirror hour and message. Return a short spiritual interpretation:
+    if pending:
+        app = current_app._get_current_object()
+        workers = min(current_app.config['ANALYSIS_BATCH_MAX_WORKERS'], len(pending))
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='analysis-batch') as executor:
+            futures = [(executor.submit(_analyze_in_app_context, app, args), indexes)
+                       for args, indexes in pending.values()]
+            for future, indexes in futures:
+                result, error = future.result()
+                for index in indexes:
+                    if error is None:
+                        results[index] = {'index': index, 'status': 200, **result}
+                    else:
+                        results[index] = {'index': index, 'status': error.status_code, 'error': error.to_dict()}
 
-Time: {time_str}
-Message: {message_placeholder}
+    return jsonify({'results': results}), 200
 
-Response:"""
+
+@analysis_bp.route('/jobs', methods=['POST'])
+def create_analysis_job():
+    """Queue an analysis and return its job id immediately (202).
+
+    Poll GET /api/analyze/jobs/<job_id> for the result. Answers 429 when the queue is full.
+    """
+    data = request.get_json()
+    if not data:
+        return jsonify({'message': 'Request body must be JSON'}), 400
+
+    args, error = _parse_analysis_request(data)
+    if error:
+        return jsonify({'message': error}), 400
 
     try:
-        completion = client.chat.completions.create(
-            model="gpt-3.5-turbo",
-            messages=[
-                {"role": "system", "content": "You are a spiritual guide specializing in interpreting mirror hours and numerical synchronicities. Your analysis should be mystical, thoughtful, and personal."},
-                {"role": "user", "content": prompt}
-            ],
-            max_tokens=300,
-            temperature=0.8
-        )
-        analysis_text = completion.choices[0].message.content
-        return jsonify({"analysis": analysis_text.strip() if analysis_text else None})
-
-    except openai.APIError as e: # More specific OpenAI errors
-        current_app.logger.error(f"OpenAI API Error: {str(e)}")
-        return jsonify({'message': 'Failed to get analysis from OpenAI due to API error.', 'error': str(e)}), 503 # Service Unavailable
-    except Exception as e:
-        current_app.logger.error(f"Error during OpenAI API call: {str(e)}")
-        return jsonify({'message': 'Failed to get analysis from OpenAI.', 'error': str(e)}), 500
+        job = current_app.extensions['analysis_jobs'].submit(*args)
+    except QueueFullError as e:
+        current_app.logger.warning(str(e))
+        return jsonify({'message': 'Too many pending analysis jobs. Please retry later.'}), 429, {'Retry-After': '1'}
+
+    status_url = url_for('analysis_bp.get_analysis_job', job_id=job.id)
+    return jsonify({**job.to_dict(), 'statusUrl': status_url}), 202, {'Location': status_url}
+
+
+@analysis_bp.route('/jobs/<job_id>', methods=['GET'])
+def get_analysis_job(job_id):
+    job = current_app.extensions['analysis_jobs'].get(job_id)
+    if job is None:
+        return jsonify({'message': f'Analysis job {job_id} not found'}), 404
+    return jsonify(job.to_dict()), 200
@@ -1,7 +1,8 @@
-from flask import Blueprint, request, jsonify
-from werkzeug.security import generate_password_hash, check_password_hash
+import math
+from flask import Blueprint, current_app, request, jsonify
 from app import db
 from app.models.user import User
+from app.services.passwords import HashUnavailableError
 
 auth_bp = Blueprint('auth_bp', __name__, url_prefix='/api/users')
 
@@ -18,7 +19,11 @@ def register():
     if User.query.filter((User.username == username) | (User.email == email)).first():
         return jsonify({'message': 'User with this username or email already exists'}), 400
 
-    hashed_password = generate_password_hash(password)
+    hasher = current_app.extensions['password_hasher']
+    try:
+        hashed_password = hasher.hash(password)
+    except HashUnavailableError as e:
+        return _busy(e)
     new_user = User(username=username, email=email, password=hashed_password)
 
     try:
@@ -36,6 +41,36 @@ def register():
         return jsonify({'message': 'Failed to register user', 'error': str(e)}), 500
 
 
+def _busy(e):
+    return jsonify({'message': f'{e}. Please retry later.'}), 503, {'Retry-After': '1'}
+
+
+def _upgrade_password_hash(hasher, user, password):
+    """Re-hash a verified password with the configured method; a failure only keeps the old hash."""
+    try:
+        user.password = hasher.rehash(password)
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        current_app.logger.warning(f"Could not upgrade the password hash of user {user.id}: {str(e)}")
+
+
+def _throttle_login(username):
+    """A 429 response when this IP or username is out of login attempts, else None.
+
+    Behind a reverse proxy, wrap the app in werkzeug's ProxyFix so remote_addr is the client.
+    """
+    limiters = current_app.extensions.get('login_throttle')
+    if limiters is None:
+        return None
+    for scope, key in (('ip', request.remote_addr or ''), ('username', str(username).strip().lower())):
+        retry_after = limiters[scope].acquire(key)
+        if retry_after:
+            return jsonify({'message': 'Too many login attempts. Please retry later.'}), 429, \
+                {'Retry-After': str(max(1, math.ceil(retry_after)))}
+    return None
+
+
 @auth_bp.route('/login', methods=['POST'])
 def login():
     data = request.get_json()
@@ -45,10 +80,21 @@ def login():
     username = data['username']
     password = data['password']
 
+    # Before any database or password work, so bursts of bad attempts stay cheap
+    throttled = _throttle_login(username)
+    if throttled:
+        return throttled
+
     user = User.query.filter_by(username=username).first()
 
-    if not user or not check_password_hash(user.password, password):
-        return jsonify({'message': 'Invalid username or password'}), 401
+    hasher = current_app.extensions['password_hasher']
+    try:
+        if not user or not hasher.verify(user.password, password):
+            return jsonify({'message': 'Invalid username or password'}), 401
+        if hasher.needs_rehash(user.password):
+            _upgrade_password_hash(hasher, user, password)
+    except HashUnavailableError as e:
+        return _busy(e)
 
     # Exclude password hash from the response
     user_data = {
@@ -56,5 +102,9 @@ def login():
         'username': user.username,
         'email': user.email
     }
-    # In a real application, you would generate a session token (e.g., JWT) here.
-    return jsonify({'message': 'Login successful', 'user': user_data}), 200
+    body = {'message': 'Login successful', 'user': user_data}
+    # Sent back as `Authorization: Bearer <token>` on /api/history calls; None without SECRET_KEY
+    tokens = current_app.extensions['session_tokens']
+    if tokens is not None:
+        body.update(token=tokens.issue(user.id), expiresIn=tokens.max_age)
+    return jsonify(body), 200
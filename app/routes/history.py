@@ -1,12 +1,159 @@
-from flask import Blueprint, request, jsonify, current_app
+from flask import Blueprint, Response, request, jsonify, current_app, g, stream_with_context
+from sqlalchemy import and_, or_, insert, delete, select, update
+from sqlalchemy.orm import undefer
 from app import db
 from app.models.user import User
 from app.models.history_item import HistoryItem
+from app.models.history_archive import HistoryArchive
+from app.services import history_stats
+from app.services.json_provider import raw_json
+from app.services.tokens import InvalidTokenError
+from app.services.write_behind import BufferFullError
 from datetime import datetime
+import base64
+import hashlib
 import json # For handling details if it's an object
 
 history_bp = Blueprint('history_bp', __name__, url_prefix='/api/history')
 
+
+def _serialize_item(item):
+    return {
+        'id': item.id,
+        'userId': item.user_id,
+        'time': item.time,
+        'type': item.type,
+        'thoughts': item.thoughts,
+        'details': _details_value(item.details),
+        'saved_at': item.saved_at # the app's JSON provider writes ISO 8601
+    }
+
+
+def _details_value(details):
+    """Stored details as returned to clients: the raw text, or with HISTORY_DETAILS_AS_JSON,
+    the JSON object/array it holds, embedded without re-encoding where orjson allows
+    (plain-text details stay strings)."""
+    if not details or not current_app.config['HISTORY_DETAILS_AS_JSON'] or details[0] not in '[{':
+        return details
+    embedded = raw_json(details)
+    return details if embedded is None else embedded
+
+
+def _details_to_text(details):
+    # Handle 'details': if it's a dict/list, stringify it.
+    # The model expects Text, so a string is appropriate.
+    # Optional: Truncate details if necessary, e.g., details_str[:5000]
+    if details is None:
+        return None
+    if isinstance(details, (dict, list)):
+        # The stdlib format, not tied to the response encoder; unescaped so search sees the words
+        return json.dumps(details, ensure_ascii=False)
+    return str(details)
+
+
+def encode_cursor(item):
+    """Opaque keyset cursor for the position just after `item` in (saved_at, id) DESC order."""
+    raw = json.dumps([item.saved_at.isoformat(), item.id], separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor):
+    """Return (saved_at, id) from a cursor, or raise ValueError."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        saved_at, item_id = json.loads(raw)
+        return datetime.fromisoformat(saved_at), int(item_id)
+    except (TypeError, ValueError, UnicodeDecodeError) as e:
+        raise ValueError(f'Invalid cursor: {cursor}') from e
+
+
+def _parse_page_args(args):
+    """Return (limit, after) from the query string, or raise ValueError."""
+    max_limit = current_app.config['HISTORY_PAGE_MAX_LIMIT']
+    limit = args.get('limit', current_app.config['HISTORY_PAGE_DEFAULT_LIMIT'])
+    try:
+        limit = int(limit)
+    except (TypeError, ValueError):
+        raise ValueError('limit must be an integer')
+    if limit < 1:
+        raise ValueError('limit must be at least 1')
+    after = args.get('after')
+    return min(limit, max_limit), decode_cursor(after) if after else None
+
+
+@history_bp.before_request
+def _authenticate():
+    """Verify an `Authorization: Bearer` session token, if sent, and keep its user in g.token_user_id.
+
+    Verification is an HMAC check (or an in-memory cache hit), no database access. A
+    token only grants access to its own user's history. Requests without a token are
+    let through unless SESSION_TOKEN_REQUIRED is set.
+    """
+    g.token_user_id = None
+    tokens = current_app.extensions['session_tokens']
+    if tokens is None: # no SECRET_KEY: tokens are neither issued nor checked
+        return None
+    scheme, _, token = request.headers.get('Authorization', '').partition(' ')
+    if scheme.lower() != 'bearer' or not token.strip():
+        if current_app.config['SESSION_TOKEN_REQUIRED']:
+            return jsonify({'message': 'Missing session token'}), 401, {'WWW-Authenticate': 'Bearer'}
+        return None
+    try:
+        g.token_user_id = tokens.verify(token.strip())
+    except InvalidTokenError as e:
+        return jsonify({'message': str(e)}), 401, {'WWW-Authenticate': 'Bearer error="invalid_token"'}
+    user_id = (request.view_args or {}).get('user_id')
+    if user_id is not None:
+        return _forbidden_for_token(user_id)
+    return None
+
+
+def _forbidden_for_token(user_id):
+    """A 403 response when the request's session token belongs to another user than `user_id`, else None."""
+    token_user_id = g.get('token_user_id')
+    if token_user_id is not None and str(user_id) != str(token_user_id):
+        return jsonify({'message': 'Session token does not grant access to this user'}), 403
+    return None
+
+
+def _user_exists(user_id):
+    """True when the user exists; free when the request carries that user's session token.
+
+    Tokens are only issued to existing users, so a deleted user's tokens pass this
+    check until they expire; the history rows' foreign key still rejects their writes.
+    """
+    if g.get('token_user_id') is not None and str(user_id) == str(g.token_user_id):
+        return True
+    return db.session.query(User.id).filter_by(id=user_id).scalar() is not None
+
+
+def _bump_history_version(user_id):
+    """Invalidate the user's history ETag and cached lists; call before the commit of any history change.
+
+    Returns the number of users updated, so 0 means the user does not exist.
+    """
+    result = db.session.execute(update(User).where(User.id == user_id)
+                                .values(history_version=User.history_version + 1))
+    # Entries are version-tagged, so this only frees the memory early
+    cache = current_app.extensions.get('history_cache')
+    if cache is not None:
+        cache.invalidate(user_id)
+    return result.rowcount
+
+
+def _history_version(user_id):
+    """The user's history version, or None when the user does not exist (one indexed lookup)."""
+    return db.session.query(User.history_version).filter_by(id=user_id).scalar()
+
+
+def history_etag(user_id, version, variant='all'):
+    """ETag for one representation of a user's history: its version plus the page it covers."""
+    etag = f'{user_id}-{version}'
+    if variant != 'all':
+        etag += '-' + hashlib.sha1(variant.encode('utf-8')).hexdigest()[:12]
+    return etag
+
+
 @history_bp.route('/', methods=['POST'])
 def create_history_item():
     data = request.get_json()
@@ -14,7 +161,7 @@ def create_history_item():
     if not data:
         return jsonify({'message': 'Request body must be JSON'}), 400
 
-    user_id = data.get('userId')
+    user_id = data.get('userId') or g.token_user_id # Defaults to the session token's user
     time_str = data.get('time') # Assuming time is a string like "10:00 AM"
     item_type = data.get('type')
     thoughts = data.get('thoughts') # Optional
@@ -22,43 +169,34 @@ def create_history_item():
 
     if not all([user_id, time_str, item_type]):
         return jsonify({'message': 'Missing required fields: userId, time, type'}), 400
+    forbidden = _forbidden_for_token(user_id)
+    if forbidden:
+        return forbidden
 
-    user = User.query.get(user_id)
-    if not user:
-        return jsonify({'message': f'User with ID {user_id} not found'}), 404
-
-    # Handle 'details': if it's a dict/list, stringify it.
-    # The model expects Text, so a string is appropriate.
-    details_str = None
-    if details is not None:
-        if isinstance(details, (dict, list)):
-            details_str = json.dumps(details)
-        else:
-            details_str = str(details)
-        # Optional: Truncate details if necessary, e.g., details_str = details_str[:5000]
+    buffer = current_app.extensions.get('history_write_buffer')
+    if buffer is not None:
+        return _create_history_item_buffered(buffer, dict(data, userId=user_id))
 
     new_item = HistoryItem(
         user_id=user_id,
         time=time_str,
         type=item_type,
         thoughts=thoughts,
-        details=details_str,
+        details=_details_to_text(details),
         saved_at=datetime.utcnow() # Set saved_at to current UTC time
     )
 
     try:
+        # The version bump doubles as the user existence check, saving a SELECT
+        if not _bump_history_version(user_id):
+            db.session.rollback()
+            return jsonify({'message': f'User with ID {user_id} not found'}), 404
         db.session.add(new_item)
+        history_stats.record_items(user_id, [(time_str, item_type, new_item.saved_at)])
+        db.session.flush()
+        # Serialize before the commit expires the instance, which would cost a refresh SELECT
+        item_data = _serialize_item(new_item)
         db.session.commit()
-        # Return the created item's data
-        item_data = {
-            'id': new_item.id,
-            'userId': new_item.user_id,
-            'time': new_item.time,
-            'type': new_item.type,
-            'thoughts': new_item.thoughts,
-            'details': new_item.details, # Or json.loads(new_item.details) if it was stored as JSON string and client expects object
-            'saved_at': new_item.saved_at.isoformat()
-        }
         return jsonify({'message': 'History item created successfully', 'item': item_data}), 201
     except Exception as e:
         db.session.rollback()
@@ -66,40 +204,461 @@ def create_history_item():
         return jsonify({'message': 'Failed to create history item', 'error': str(e)}), 500
 
 
+# Column limits checked up front in write-behind mode, where the INSERT runs after the response
+_BUFFERED_LIMITS = {'time': 80, 'type': 80, 'thoughts': 500}
+
+
+def _create_history_item_buffered(buffer, data):
+    """Write-behind variant of create_history_item: validate, queue, answer 202.
+
+    The item reaches history_items (and the ETag, cache and statistics) at the next
+    buffer flush, so it can be missing from lists read in the meantime.
+    """
+    try:
+        user_id = int(data['userId'])
+    except (TypeError, ValueError):
+        return jsonify({'message': 'userId must be an integer'}), 400
+    too_long = [field for field, limit in _BUFFERED_LIMITS.items()
+                if data.get(field) is not None and len(str(data[field])) > limit]
+    if too_long:
+        return jsonify({'message': f'Fields too long: {", ".join(too_long)}'}), 400
+    if not _user_exists(user_id):
+        return jsonify({'message': f'User with ID {user_id} not found'}), 404
+
+    row = {
+        'user_id': user_id,
+        'time': str(data['time']),
+        'type': str(data['type']),
+        'thoughts': data.get('thoughts'),
+        'details': _details_to_text(data.get('details')),
+        'saved_at': datetime.utcnow(),
+    }
+    try:
+        provisional_id = buffer.append(row)
+    except BufferFullError as e:
+        return jsonify({'message': str(e) + '. Please retry later.'}), 503, {'Retry-After': '1'}
+
+    item_data = {
+        'id': None,
+        'provisionalId': provisional_id,
+        'userId': user_id,
+        'time': row['time'],
+        'type': row['type'],
+        'thoughts': row['thoughts'],
+        'details': _details_value(row['details']),
+        'saved_at': row['saved_at']
+    }
+    return jsonify({'message': 'History item accepted', 'item': item_data}), 202
+
+
+def write_history_rows(rows):
+    """Insert buffered history rows (any users) and commit them in one transaction."""
+    by_user = {}
+    for row in rows:
+        by_user.setdefault(row['user_id'], []).append(row)
+    # Bumped before the INSERT, like the batch route, so same-user writers stay serialized
+    for user_id in sorted(by_user):
+        _bump_history_version(user_id)
+    db.session.execute(insert(HistoryItem.__table__), rows)
+    for user_id, user_rows in by_user.items():
+        history_stats.record_items(user_id, [(row['time'], row['type'], row['saved_at']) for row in user_rows])
+    db.session.commit()
+
+
 @history_bp.route('/<int:user_id>', methods=['GET'])
 def get_history_by_user(user_id):
-    user = User.query.get(user_id)
-    if not user:
+    """Return a user's history, newest first.
+
+    With `limit` and/or `after` the result is one keyset page on (saved_at, id):
+    {"items": [...], "next_cursor": "..."}; pass next_cursor back as `after` for the next
+    page. Without them, the full list is returned as before while
+    HISTORY_UNPAGINATED_COMPAT is on, and the first page otherwise.
+
+    Responses carry an ETag derived from the user's history version; a matching
+    If-None-Match gets a 304 after a single lookup, without reading any history rows.
+    Serialized bodies of recently read lists are kept in the history cache under the
+    same version, so a repeat visit costs that one lookup too.
+    """
+    paginate = 'limit' in request.args or 'after' in request.args \
+        or not current_app.config['HISTORY_UNPAGINATED_COMPAT']
+    if paginate:
+        try:
+            limit, after = _parse_page_args(request.args)
+        except ValueError as e:
+            return jsonify({'message': str(e)}), 400
+
+    # The version lookup doubles as the user existence check
+    version = _history_version(user_id)
+    if version is None:
         return jsonify({'message': f'User with ID {user_id} not found'}), 404
 
-    history_items = HistoryItem.query.filter_by(user_id=user_id).order_by(HistoryItem.saved_at.desc()).all()
-    
-    items_data = []
-    for item in history_items:
-        items_data.append({
-            'id': item.id,
-            'userId': item.user_id,
-            'time': item.time,
-            'type': item.type,
-            'thoughts': item.thoughts,
-            'details': item.details, # Or json.loads(item.details) if it's a JSON string and client expects object
-            'saved_at': item.saved_at.isoformat()
-        })
-    
-    return jsonify(items_data), 200
+    # Normalized, so it also tracks HISTORY_UNPAGINATED_COMPAT and the limit defaults
+    variant = f'{limit}:{request.args.get("after", "")}' if paginate else 'all'
+    etag = history_etag(user_id, version, variant)
+    if etag in request.if_none_match:
+        response = Response(status=304)
+        response.set_etag(etag)
+        return response
+
+    cache = current_app.extensions.get('history_cache')
+    if cache is not None:
+        body = cache.get(user_id, version, variant)
+        if body is not None:
+            return _with_etag(Response(body, mimetype='application/json'), etag)
+
+    query = HistoryItem.query.filter_by(user_id=user_id).order_by(HistoryItem.saved_at.desc(), HistoryItem.id.desc())
+
+    if not paginate:
+        response = jsonify([_serialize_item(item) for item in query.all()])
+        if cache is not None:
+            cache.set(user_id, version, variant, response.get_data())
+        return _with_etag(response, etag)
+
+    if after is not None:
+        after_saved_at, after_id = after
+        query = query.filter(or_(
+            HistoryItem.saved_at < after_saved_at,
+            and_(HistoryItem.saved_at == after_saved_at, HistoryItem.id < after_id),
+        ))
+    # Fetch one extra row to know whether another page exists
+    history_items = query.limit(limit + 1).all()
+    page = history_items[:limit]
+    next_cursor = encode_cursor(page[-1]) if len(history_items) > limit else None
+
+    response = jsonify({'items': [_serialize_item(item) for item in page], 'next_cursor': next_cursor})
+    if cache is not None:
+        cache.set(user_id, version, variant, response.get_data())
+    return _with_etag(response, etag)
+
+
+@history_bp.route('/<int:user_id>/stats', methods=['GET'])
+def get_history_stats(user_id):
+    """Counts of a user's history (archived items included) by mirror time, type, day and ISO week.
+
+    Served from the history_stats rollups maintained by every write, never from a scan
+    of history_items; run `flask backfill-history-stats` once for pre-existing rows.
+    """
+    version = _history_version(user_id)
+    if version is None:
+        return jsonify({'message': f'User with ID {user_id} not found'}), 404
+    etag = history_etag(user_id, version, 'stats')
+    if etag in request.if_none_match:
+        response = Response(status=304)
+        response.set_etag(etag)
+        return response
+    return _with_etag(jsonify(history_stats.read_stats(user_id)), etag)
+
+
+@history_bp.route('/<int:user_id>/search', methods=['GET'])
+def search_history_items(user_id):
+    """Full-text search over a user's history thoughts and details, best match first.
+
+    ?q= is split into words that must all match; ?limit= and ?offset= page through the
+    ranked results, and next_offset is null on the last page.
+    """
+    from app.services.search import search_history, search_terms
+    terms = search_terms(request.args.get('q', ''))
+    if not terms:
+        return jsonify({'message': 'q must contain at least one word'}), 400
+    try:
+        limit, _ = _parse_page_args({'limit': request.args.get('limit', current_app.config['HISTORY_PAGE_DEFAULT_LIMIT'])})
+    except ValueError as e:
+        return jsonify({'message': str(e)}), 400
+    offset = request.args.get('offset', '0')
+    if not offset.isdigit():
+        return jsonify({'message': 'offset must be a non-negative integer'}), 400
+    offset = int(offset)
+
+    version = _history_version(user_id)
+    if version is None:
+        return jsonify({'message': f'User with ID {user_id} not found'}), 404
+    etag = history_etag(user_id, version, f'search:{" ".join(terms)}:{limit}:{offset}')
+    if etag in request.if_none_match:
+        response = Response(status=304)
+        response.set_etag(etag)
+        return response
+
+    # One extra row tells whether another page exists
+    items = search_history(user_id, terms, limit + 1, offset)
+    next_offset = offset + limit if len(items) > limit else None
+    return _with_etag(jsonify({'items': [_serialize_item(item) for item in items[:limit]],
+                               'next_offset': next_offset}), etag)
+
+
+def _with_etag(response, etag):
+    response.set_etag(etag)
+    # Let clients keep the body but always revalidate it
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
+
+# API field name -> column, for the export projection
+EXPORT_FIELDS = {
+    'id': HistoryItem.id,
+    'userId': HistoryItem.user_id,
+    'time': HistoryItem.time,
+    'type': HistoryItem.type,
+    'thoughts': HistoryItem.thoughts,
+    'details': HistoryItem.details,
+    'saved_at': HistoryItem.saved_at,
+}
+
+
+def _export_rows(user_id, names, batch_size):
+    """Yield JSON-ready dicts for a user's history in batches of `batch_size` rows.
+
+    Each batch is its own keyset query on (saved_at, id), walking the
+    (user_id, saved_at, id) index from the previous batch's last row, so only one
+    batch is in memory whatever the driver. Server-side cursors would not do: the
+    mysqlconnector dialect buffers whole results. Selects plain columns, so rows
+    are never hydrated into HistoryItem objects.
+    """
+    stmt = select(HistoryItem.saved_at, HistoryItem.id, *(EXPORT_FIELDS[name] for name in names)) \
+        .where(HistoryItem.user_id == user_id) \
+        .order_by(HistoryItem.saved_at.desc(), HistoryItem.id.desc()) \
+        .limit(batch_size)
+    last = None
+    while True:
+        page = stmt
+        if last is not None:
+            page = stmt.where(or_(
+                HistoryItem.saved_at < last[0],
+                and_(HistoryItem.saved_at == last[0], HistoryItem.id < last[1]),
+            ))
+        rows = db.session.execute(page).all()
+        if not rows:
+            return
+        yield [dict(zip(names, row[2:])) for row in rows]
+        if len(rows) < batch_size:
+            return
+        last = rows[-1][:2]
+
+
+@history_bp.route('/<int:user_id>/export', methods=['GET'])
+def export_history(user_id):
+    """Stream a user's whole history, newest first.
+
+    ?format=ndjson (default, one JSON object per line) or ?format=json (a chunked JSON
+    array), and ?fields=id,time,... to project columns. Memory use is bounded by
+    HISTORY_EXPORT_BATCH_SIZE rows, whatever the history length.
+    """
+    export_format = request.args.get('format', 'ndjson')
+    if export_format not in ('ndjson', 'json'):
+        return jsonify({'message': 'format must be ndjson or json'}), 400
+
+    names = [name for name in request.args.get('fields', '').split(',') if name] or list(EXPORT_FIELDS)
+    unknown = [name for name in names if name not in EXPORT_FIELDS]
+    if unknown:
+        return jsonify({'message': f'Unknown fields: {", ".join(unknown)}'}), 400
+
+    if not _user_exists(user_id):
+        return jsonify({'message': f'User with ID {user_id} not found'}), 404
+
+    batches = _export_rows(user_id, names, current_app.config['HISTORY_EXPORT_BATCH_SIZE'])
+    dumps = current_app.json.dumps
+
+    def generate_ndjson():
+        for batch in batches:
+            yield ''.join(dumps(row) + '\n' for row in batch)
+
+    def generate_json():
+        yield '['
+        first = True
+        for batch in batches:
+            chunk = ','.join(dumps(row) for row in batch)
+            if chunk:
+                yield chunk if first else ',' + chunk
+                first = False
+        yield ']'
+
+    if export_format == 'ndjson':
+        body, mimetype = generate_ndjson(), 'application/x-ndjson'
+    else:
+        body, mimetype = generate_json(), 'application/json'
+    headers = {'Content-Disposition': f'attachment; filename=history-{user_id}.{export_format}'}
+    return Response(stream_with_context(body), mimetype=mimetype, headers=headers)
+
+
+def _serialize_archive(archive):
+    return {
+        'id': archive.id,
+        'item_count': archive.item_count,
+        'oldest_saved_at': archive.oldest_saved_at,
+        'newest_saved_at': archive.newest_saved_at,
+    }
+
+
+@history_bp.route('/<int:user_id>/archives', methods=['GET'])
+def list_history_archives(user_id):
+    """List a user's archived history batches, newest first (metadata only)."""
+    if not _user_exists(user_id):
+        return jsonify({'message': f'User with ID {user_id} not found'}), 404
+    archives = HistoryArchive.query.filter_by(user_id=user_id) \
+        .order_by(HistoryArchive.newest_saved_at.desc(), HistoryArchive.id.desc()).all()
+    return jsonify({'archives': [_serialize_archive(archive) for archive in archives]}), 200
+
+
+@history_bp.route('/<int:user_id>/archives/<int:archive_id>', methods=['GET'])
+def get_history_archive(user_id, archive_id):
+    """Return the items of one archived batch, newest first, in the history list format."""
+    from app.services.retention import decompress_items
+    archive = HistoryArchive.query.filter_by(id=archive_id, user_id=user_id) \
+        .options(undefer(HistoryArchive.payload)).first()
+    if archive is None:
+        return jsonify({'message': f'Archive {archive_id} not found for user {user_id}'}), 404
+    items = [{
+        'id': item['id'],
+        'userId': user_id,
+        'time': item['time'],
+        'type': item['type'],
+        'thoughts': item['thoughts'],
+        'details': _details_value(item['details']),
+        'saved_at': item['saved_at']
+    } for item in reversed(decompress_items(archive.payload))]
+    return jsonify({'archive': _serialize_archive(archive), 'items': items}), 200
 
 
 @history_bp.route('/<int:item_id>', methods=['DELETE'])
 def delete_history_item(item_id):
     history_item = HistoryItem.query.get(item_id)
-    if not history_item:
+    # Another user's item is reported as missing to a token holder
+    if not history_item or _forbidden_for_token(history_item.user_id):
         return jsonify({'message': f'History item with ID {item_id} not found'}), 404
 
     try:
+        # users row first, like the create paths, so concurrent writers lock in one order
+        _bump_history_version(history_item.user_id)
         db.session.delete(history_item)
+        history_stats.record_items(history_item.user_id,
+                                   [(history_item.time, history_item.type, history_item.saved_at)], sign=-1)
         db.session.commit()
         return '', 204  # No content
     except Exception as e:
         db.session.rollback()
         current_app.logger.error(f"Failed to delete history item {item_id}: {str(e)}")
         return jsonify({'message': 'Failed to delete history item', 'error': str(e)}), 500
+
+
+def _parse_batch_user(data):
+    """Return (user_id, None) for a batch payload, or (None, (error body, status))."""
+    if not isinstance(data, dict):
+        return None, ({'message': 'Request body must be JSON'}, 400)
+    user_id = data.get('userId') or g.token_user_id
+    if not user_id:
+        return None, ({'message': 'Missing required field: userId'}, 400)
+    if g.token_user_id is not None and str(user_id) != str(g.token_user_id):
+        return None, ({'message': 'Session token does not grant access to this user'}, 403)
+    # The owning user is validated once for the whole batch
+    if not _user_exists(user_id):
+        return None, ({'message': f'User with ID {user_id} not found'}, 404)
+    return user_id, None
+
+
+@history_bp.route('/batch', methods=['POST'])
+def create_history_items_batch():
+    """Create many history items for one user in a single INSERT and a single commit.
+
+    Body: {"userId": 1, "items": [{"time", "type", "thoughts"?, "details"?}, ...]}.
+    The batch is all-or-nothing: any invalid item rejects the whole request.
+    """
+    data = request.get_json(silent=True)
+    items = data.get('items') if isinstance(data, dict) else None
+    if not isinstance(items, list) or not items:
+        return jsonify({'message': 'Request body must contain a non-empty items array'}), 400
+
+    max_items = current_app.config['HISTORY_BATCH_MAX_ITEMS']
+    if len(items) > max_items:
+        return jsonify({'message': f'Too many items in batch (maximum is {max_items})'}), 400
+
+    invalid = [index for index, item in enumerate(items)
+               if not isinstance(item, dict) or not item.get('time') or not item.get('type')]
+    if invalid:
+        return jsonify({'message': 'Missing required fields: time, type', 'invalidIndexes': invalid}), 400
+
+    user_id, error = _parse_batch_user(data)
+    if error:
+        return jsonify(error[0]), error[1]
+
+    # Whole seconds, so the read-back below matches on MySQL DATETIME columns too
+    saved_at = datetime.utcnow().replace(microsecond=0)
+    rows = [{
+        'user_id': user_id,
+        'time': item['time'],
+        'type': item['type'],
+        'thoughts': item.get('thoughts'),
+        'details': _details_to_text(item.get('details')),
+        'saved_at': saved_at,
+    } for item in items]
+
+    try:
+        # First, so the row lock it takes on users serializes this user's writers
+        # until the commit: no other batch can add rows the read-back below would see
+        _bump_history_version(user_id)
+        # executemany of a single INSERT; MySQL drivers send it as one multi-row INSERT
+        db.session.execute(insert(HistoryItem.__table__), rows)
+        # MySQL has no INSERT ... RETURNING, so read the new ids back through the
+        # (user_id, saved_at, id) index; under the lock this batch's rows are the newest
+        ids = db.session.query(HistoryItem.id).filter_by(user_id=user_id, saved_at=saved_at) \
+            .order_by(HistoryItem.id.desc()).limit(len(rows)).all()
+        ids = sorted(row[0] for row in ids)
+        history_stats.record_items(user_id, [(row['time'], row['type'], saved_at) for row in rows])
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        current_app.logger.error(f"Failed to create history items batch: {str(e)}")
+        return jsonify({'message': 'Failed to create history items', 'error': str(e)}), 500
+
+    items_data = [{
+        'id': item_id,
+        'userId': row['user_id'],
+        'time': row['time'],
+        'type': row['type'],
+        'thoughts': row['thoughts'],
+        'details': _details_value(row['details']),
+        'saved_at': row['saved_at']
+    } for item_id, row in zip(ids, rows)]
+    return jsonify({'message': f'{len(items_data)} history items created successfully', 'items': items_data}), 201
+
+
+@history_bp.route('/batch', methods=['DELETE'])
+def delete_history_items_batch():
+    """Delete many of one user's history items with a single DELETE ... WHERE id IN (...).
+
+    Body: {"userId": 1, "ids": [1, 2, 3]}. Ids that do not exist or belong to another
+    user are ignored; the response reports how many rows were deleted. The rows are
+    read (and locked) first so the statistics rollups can be decremented.
+    """
+    data = request.get_json(silent=True)
+    ids = data.get('ids') if isinstance(data, dict) else None
+    if not isinstance(ids, list) or not ids or not all(isinstance(item_id, int) and not isinstance(item_id, bool) for item_id in ids):
+        return jsonify({'message': 'Request body must contain a non-empty ids array of integers'}), 400
+
+    max_items = current_app.config['HISTORY_BATCH_MAX_ITEMS']
+    if len(ids) > max_items:
+        return jsonify({'message': f'Too many ids in batch (maximum is {max_items})'}), 400
+
+    user_id, error = _parse_batch_user(data)
+    if error:
+        return jsonify(error[0]), error[1]
+
+    try:
+        # users row first, like the create paths, so concurrent writers lock in one order
+        _bump_history_version(user_id)
+        doomed = db.session.execute(
+            select(HistoryItem.id, HistoryItem.time, HistoryItem.type, HistoryItem.saved_at)
+            .where(HistoryItem.user_id == user_id, HistoryItem.id.in_(set(ids))).with_for_update()).all()
+        deleted = 0
+        if doomed:
+            deleted = db.session.execute(
+                delete(HistoryItem).where(HistoryItem.id.in_([row.id for row in doomed]))
+                .execution_options(synchronize_session=False)).rowcount
+            history_stats.record_items(user_id, [(row.time, row.type, row.saved_at) for row in doomed], sign=-1)
+            db.session.commit()
+        else:
+            db.session.rollback() # nothing deleted: keep the version, and the ETag, unchanged
+    except Exception as e:
+        db.session.rollback()
+        current_app.logger.error(f"Failed to delete history items batch: {str(e)}")
+        return jsonify({'message': 'Failed to delete history items', 'error': str(e)}), 500
+
+    return jsonify({'message': 'History items deleted', 'deleted': deleted}), 200
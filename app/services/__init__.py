@@ -0,0 +1 @@
+# Application services shared by the route blueprints (caching, upstream clients, ...)
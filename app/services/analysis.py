@@ -0,0 +1,272 @@
+import re
+from flask import current_app
+from sqlalchemy.exc import SQLAlchemyError
+import openai
+from app import db
+from app.models.analysis_entry import PregeneratedAnalysis
+from app.services.openai_client import OpenAIConfigError, UpstreamUnavailableError
+from app.services.hours import local_interpretation
+
+SYSTEM_PROMPT = "You are a spiritual guide specializing in interpreting mirror hours and numerical synchronicities. Your analysis should be mystical, thoughtful, and personal."
+
+# Accepts "11:11", "9:09", "11h11" or "11.11" and normalizes to zero-padded "HH:MM"
+_TIME_RE = re.compile(r'^\s*(\d{1,2})\s*[:hH.]\s*(\d{2})\s*$')
+_CLOCK_TIME_RE = re.compile(r'^([01]\d|2[0-3]):[0-5]\d$')
+
+
+class AnalysisError(Exception):
+    """Raised when an interpretation cannot be produced. Carries the HTTP status to report."""
+
+    def __init__(self, message, status_code=500, error=None, retry_after=None):
+        super().__init__(message)
+        self.message = message
+        self.status_code = status_code
+        self.error = error
+        self.retry_after = retry_after
+
+    def to_dict(self):
+        body = {'message': self.message}
+        if self.error is not None:
+            body['error'] = self.error
+        return body
+
+    def headers(self):
+        return {'Retry-After': str(self.retry_after)} if self.retry_after else {}
+
+
+def error_details(e):
+    """Return (status_code, error dict) for an exception raised by analyze()."""
+    if isinstance(e, AnalysisError):
+        return e.status_code, e.to_dict()
+    current_app.logger.error(f"Unexpected error during analysis: {str(e)}")
+    return 500, {'message': 'Failed to get analysis from OpenAI.', 'error': str(e)}
+
+
+def normalize_time(time_str):
+    time_str = str(time_str)
+    match = _TIME_RE.match(time_str)
+    if match:
+        return f"{int(match.group(1)):02d}:{match.group(2)}"
+    return time_str.strip()
+
+
+def normalize_message(message):
+    if not message:
+        return None
+    # Collapse runs of whitespace so trivially different messages share a cache entry
+    return ' '.join(str(message).split()) or None
+
+
+def normalize_language(language):
+    # Only French has its own prompt; everything else falls back to English
+    return 'fr' if str(language or 'en').strip().lower() == 'fr' else 'en'
+
+
+def cache_key(time_str, message, language):
+    """Build the normalized (time, message, language) key used by the response cache."""
+    message = normalize_message(message)
+    return (normalize_time(time_str), message.casefold() if message else '', normalize_language(language))
+
+
+def build_prompt(time_str, message, language):
+    """Build the user prompt for the given mirror hour, in English or French."""
+    if language == 'fr':
+        message_placeholder = message if message else "Pas de message fourni"
+        return f"""Analysez l'heure miroir et le message suivants. Retournez une interprétation spirituelle concise et directe, sans commencer par "Interprétation en français:" :
+
+Heure: {time_str}
+Message: {message_placeholder}
+
+Réponse:"""
+    # Default to English
+    message_placeholder = message if message else "No message provided"
+    return f"""Analyze the following mirror hour and message. Return a short spiritual interpretation:
+
+Time: {time_str}
+Message: {message_placeholder}
+
+Response:"""
+
+
+def build_messages(time_str, message, language):
+    """Build the chat messages sent to the completion API."""
+    return [
+        {"role": "system", "content": SYSTEM_PROMPT},
+        {"role": "user", "content": build_prompt(time_str, message, language)}
+    ]
+
+
+def get_analysis_cache():
+    return current_app.extensions.get('analysis_cache')
+
+
+def get_single_flight():
+    return current_app.extensions.get('analysis_flight')
+
+
+def get_hours_index():
+    return current_app.extensions.get('hours_index')
+
+
+def _local_result(time_str, message, language):
+    # Canonical mirror hours without a free-text message are answered from the curated index
+    index = get_hours_index()
+    if index is None or message:
+        return None
+    return local_interpretation(index, time_str, language)
+
+
+def _stored_result(time_str, message, language):
+    # Message-less requests for any HH:MM are answered from the pre-generated store (see manage.py)
+    if message or not current_app.config['ANALYSIS_STORE_ENABLED'] or not _CLOCK_TIME_RE.match(time_str):
+        return None
+    try:
+        analysis_text = db.session.query(PregeneratedAnalysis.analysis).filter_by(
+            time=time_str, language=language).scalar()
+    except SQLAlchemyError as e:
+        db.session.rollback()
+        current_app.logger.error(f"Failed to read pre-generated analysis: {str(e)}")
+        return None
+    if not analysis_text:
+        return None
+    return {"analysis": analysis_text, "source": "store"}
+
+
+def get_client_manager():
+    return current_app.extensions['openai_client']
+
+
+def _upstream_error(e):
+    """Translate an exception from the OpenAI call into the AnalysisError reported to clients."""
+    if isinstance(e, OpenAIConfigError):
+        current_app.logger.error(str(e))
+        return AnalysisError('OpenAI API key not configured. Please contact administrator.', 500)
+    if isinstance(e, UpstreamUnavailableError):
+        # Circuit open or too many calls in flight: fail fast instead of queueing the worker
+        current_app.logger.warning(f"OpenAI call rejected: {str(e)}")
+        return AnalysisError('OpenAI service is temporarily unavailable. Please retry later.', 503,
+                             error=str(e), retry_after=e.retry_after)
+    if isinstance(e, openai.APIError): # More specific OpenAI errors
+        current_app.logger.error(f"OpenAI API Error: {str(e)}")
+        return AnalysisError('Failed to get analysis from OpenAI due to API error.', 503, error=str(e)) # Service Unavailable
+    current_app.logger.error(f"Error during OpenAI API call: {str(e)}")
+    return AnalysisError('Failed to get analysis from OpenAI.', 500, error=str(e))
+
+
+def _completion_kwargs(time_str, message, language):
+    return dict(
+        model="gpt-3.5-turbo",
+        messages=build_messages(time_str, message, language),
+        max_tokens=300,
+        temperature=0.8
+    )
+
+
+def _request_completion(time_str, message, language):
+    try:
+        completion = get_client_manager().create_completion(**_completion_kwargs(time_str, message, language))
+    except Exception as e:
+        raise _upstream_error(e)
+
+    analysis_text = completion.choices[0].message.content
+    return {"analysis": analysis_text.strip() if analysis_text else None}
+
+
+def generate_analysis(time_str, message=None, language='en'):
+    """Ask OpenAI for a fresh interpretation, bypassing the local index, cache and store."""
+    return _request_completion(normalize_time(time_str), normalize_message(message), normalize_language(language))
+
+
+def analyze(time_str, message=None, language='en'):
+    """Return the interpretation for a mirror hour.
+
+    Canonical times without a message come from the curated hours index, repeats from
+    the response cache and other message-less times from the pre-generated store; only
+    the rest goes to OpenAI. Raises AnalysisError when the interpretation cannot be produced.
+    """
+    message = normalize_message(message)
+    language = normalize_language(language)
+    time_str = normalize_time(time_str)
+
+    local = _local_result(time_str, message, language)
+    if local is not None:
+        return local
+
+    cache = get_analysis_cache()
+    key = cache_key(time_str, message, language)
+    if cache is not None:
+        cached = cache.get(key)
+        if cached is not None:
+            return cached
+
+    stored = _stored_result(time_str, message, language)
+    if stored is not None:
+        if cache is not None:
+            cache.set(key, stored)
+        return stored
+
+    def fetch():
+        # Re-check: a call for this key may have finished between the miss above and now
+        if cache is not None:
+            cached = cache.peek(key)
+            if cached is not None:
+                return cached
+        result = _request_completion(time_str, message, language)
+        if cache is not None and result.get('analysis'):
+            cache.set(key, result)
+        return result
+
+    # Identical requests arriving while one is in flight wait for it instead of calling OpenAI
+    flight = get_single_flight()
+    if flight is None:
+        return fetch()
+    return flight.do(key, fetch)
+
+
+def stream_analysis(time_str, message=None, language='en'):
+    """Start a streamed interpretation and return an iterator of text chunks.
+
+    Errors that happen before the first token raise AnalysisError right away; errors
+    mid-stream raise AnalysisError from the iterator. Cache hits are replayed as a single
+    chunk, and a completed stream is stored in the response cache.
+    """
+    message = normalize_message(message)
+    language = normalize_language(language)
+    time_str = normalize_time(time_str)
+
+    local = _local_result(time_str, message, language)
+    if local is not None:
+        return iter([local['analysis']])
+
+    cache = get_analysis_cache()
+    key = cache_key(time_str, message, language)
+    if cache is not None:
+        cached = cache.get(key)
+        if cached is not None and cached.get('analysis'):
+            return iter([cached['analysis']])
+
+    stored = _stored_result(time_str, message, language)
+    if stored is not None:
+        return iter([stored['analysis']])
+
+    try:
+        stream = get_client_manager().stream_completion(**_completion_kwargs(time_str, message, language))
+    except Exception as e:
+        raise _upstream_error(e)
+    return _collect_stream(stream, cache, key)
+
+
+def _collect_stream(stream, cache, key):
+    parts = []
+    try:
+        for chunk in stream:
+            parts.append(chunk)
+            yield chunk
+    except Exception as e:
+        raise _upstream_error(e)
+    finally:
+        stream.close()
+
+    analysis_text = ''.join(parts).strip()
+    if cache is not None and analysis_text:
+        cache.set(key, {"analysis": analysis_text})
@@ -0,0 +1,88 @@
+import threading
+from collections import OrderedDict
+
+
+class HistoryCache:
+    """Serialized history responses for recently active users, bounded by users and bytes.
+
+    Entries are keyed on user id and tagged with the user's history version; a lookup with
+    any other version is a miss, so a write committed by another process can never be
+    served stale. Each user holds one body per variant (the full list, each page).
+    The least recently used user is evicted when either bound is exceeded.
+    """
+
+    def __init__(self, maxsize=1024, max_bytes=32 * 1024 * 1024):
+        self.maxsize = maxsize
+        self.max_bytes = max_bytes
+        self._data = OrderedDict()  # user_id -> (version, {variant: body})
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    @staticmethod
+    def _weight(variants):
+        return sum(len(body) for body in variants.values())
+
+    def get(self, user_id, version, variant='all'):
+        with self._lock:
+            entry = self._data.get(user_id)
+            body = entry[1].get(variant) if entry is not None and entry[0] == version else None
+            if body is None:
+                self.misses += 1
+                return None
+            self._data.move_to_end(user_id)
+            self.hits += 1
+            return body
+
+    def set(self, user_id, version, variant, body):
+        if self.maxsize <= 0 or len(body) > self.max_bytes:
+            return
+        with self._lock:
+            entry = self._data.pop(user_id, None)
+            variants = {}
+            if entry is not None:
+                self._bytes -= self._weight(entry[1])
+                if entry[0] == version:
+                    variants = entry[1]
+            variants[variant] = body
+            self._data[user_id] = (version, variants)
+            self._bytes += self._weight(variants)
+            while len(self._data) > self.maxsize or self._bytes > self.max_bytes:
+                _, (_, evicted) = self._data.popitem(last=False)
+                self._bytes -= self._weight(evicted)
+                self.evictions += 1
+
+    def invalidate(self, user_id):
+        """Drop everything cached for a user; called after their history changes."""
+        with self._lock:
+            entry = self._data.pop(user_id, None)
+            if entry is not None:
+                self._bytes -= self._weight(entry[1])
+                self.invalidations += 1
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self._bytes = 0
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self):
+        """Return a snapshot of the cache counters, including its size in bytes and hit ratio."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'users': len(self._data),
+                'maxsize': self.maxsize,
+                'bytes': self._bytes,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': self.hits / lookups if lookups else 0.0,
+                'evictions': self.evictions,
+                'invalidations': self.invalidations,
+            }
@@ -0,0 +1,101 @@
+from collections import Counter
+from datetime import date
+from sqlalchemy import delete, func, select, update
+from sqlalchemy.dialects import mysql, sqlite
+from app import db
+from app.models import HistoryArchive, HistoryItem, HistoryStat
+
+DIMENSIONS = ('time', 'type', 'day')
+
+
+def _buckets(time_str, item_type, saved_at):
+    day = saved_at.date() if hasattr(saved_at, 'date') else date.fromisoformat(str(saved_at)[:10])
+    # JSON numbers are accepted for time/type, and stored as their text
+    return (('time', str(time_str)[:80]), ('type', str(item_type)[:80]), ('day', day.isoformat()))
+
+
+def item_deltas(items, sign=1):
+    """Counter of (dimension, bucket) -> change for items given as (time, type, saved_at)."""
+    deltas = Counter()
+    for time_str, item_type, saved_at in items:
+        for key in _buckets(time_str, item_type, saved_at):
+            deltas[key] += sign
+    return deltas
+
+
+def apply_deltas(user_id, deltas):
+    """Add `deltas` to the user's rollup rows in the current transaction.
+
+    A single multi-row upsert (ON CONFLICT on SQLite, ON DUPLICATE KEY on MySQL); when
+    counts went down, buckets that reached zero are then deleted.
+    """
+    rows = [{'user_id': user_id, 'dimension': dimension, 'bucket': bucket, 'count': change}
+            for (dimension, bucket), change in deltas.items() if change]
+    if not rows:
+        return
+    table = HistoryStat.__table__
+    dialect = db.engine.dialect.name
+    if dialect == 'sqlite':
+        stmt = sqlite.insert(table).values(rows)
+        db.session.execute(stmt.on_conflict_do_update(
+            index_elements=[table.c.user_id, table.c.dimension, table.c.bucket],
+            set_={'count': table.c.count + stmt.excluded['count']}))
+    elif dialect == 'mysql':
+        stmt = mysql.insert(table).values(rows)
+        db.session.execute(stmt.on_duplicate_key_update(count=table.c.count + stmt.inserted['count']))
+    else:
+        for row in rows:
+            result = db.session.execute(update(table).where(
+                table.c.user_id == user_id, table.c.dimension == row['dimension'], table.c.bucket == row['bucket'])
+                .values(count=table.c.count + row['count']))
+            if not result.rowcount:
+                db.session.execute(table.insert().values(row))
+    if any(row['count'] < 0 for row in rows):
+        db.session.execute(delete(table).where(table.c.user_id == user_id, table.c.count <= 0))
+
+
+def record_items(user_id, items, sign=1):
+    """Count items (time, type, saved_at) in (sign=1) or out of (sign=-1) the user's rollups."""
+    apply_deltas(user_id, item_deltas(items, sign))
+
+
+def read_stats(user_id):
+    """The user's rollups as {'total', 'by_time', 'by_type', 'by_day', 'by_week'}; reads only history_stats."""
+    stats = {dimension: {} for dimension in DIMENSIONS}
+    for dimension, bucket, count in db.session.execute(
+            select(HistoryStat.dimension, HistoryStat.bucket, HistoryStat.count)
+            .where(HistoryStat.user_id == user_id)):
+        if dimension in stats and count > 0:
+            stats[dimension][bucket] = count
+
+    by_week = Counter()
+    for day, count in stats['day'].items():
+        year, week, _ = date.fromisoformat(day).isocalendar()
+        by_week[f'{year}-W{week:02d}'] += count
+    by_day = dict(sorted(stats['day'].items()))
+    return {
+        'total': sum(stats['type'].values()),
+        'by_time': dict(sorted(stats['time'].items(), key=lambda item: (-item[1], item[0]))),
+        'by_type': dict(sorted(stats['type'].items(), key=lambda item: (-item[1], item[0]))),
+        'by_day': by_day,
+        'by_week': dict(sorted(by_week.items())),
+    }
+
+
+def rebuild_user_stats(user_id):
+    """Recompute one user's rollups from history_items and their archives, in the current transaction."""
+    from app.services.retention import decompress_items
+    deltas = Counter()
+    for dimension, column in (('time', HistoryItem.time), ('type', HistoryItem.type),
+                              ('day', func.date(HistoryItem.saved_at))):
+        for bucket, count in db.session.execute(
+                select(column, func.count()).where(HistoryItem.user_id == user_id).group_by(column)):
+            key = (dimension, str(bucket)[:80] if dimension != 'day' else str(bucket)[:10])
+            deltas[key] += count
+    # Archived items still count towards the user's statistics
+    for (payload,) in db.session.execute(select(HistoryArchive.payload).where(HistoryArchive.user_id == user_id)):
+        deltas.update(item_deltas((item['time'], item['type'], item['saved_at']) for item in decompress_items(payload)))
+
+    db.session.execute(delete(HistoryStat).where(HistoryStat.user_id == user_id))
+    apply_deltas(user_id, deltas)
+    return sum(count for (dimension, _), count in deltas.items() if dimension == 'type')
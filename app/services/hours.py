@@ -0,0 +1,67 @@
+import json
+import os
+from types import MappingProxyType
+
+# Curated interpretation files and the language each one holds
+HOURS_FILES = {
+    'en': 'hours.json',
+    'fr': 'hours.fr.json',
+}
+
+
+def _freeze(value):
+    if isinstance(value, dict):
+        return MappingProxyType({key: _freeze(item) for key, item in value.items()})
+    if isinstance(value, list):
+        return tuple(_freeze(item) for item in value)
+    return value
+
+
+def _thaw(value):
+    if isinstance(value, MappingProxyType):
+        return {key: _thaw(item) for key, item in value.items()}
+    if isinstance(value, tuple):
+        return [_thaw(item) for item in value]
+    return value
+
+
+def load_hours_index(data_dir, logger=None):
+    """Load the curated mirror-hour interpretations into a read-only index.
+
+    Returns a mapping of (time, language) -> frozen interpretation. Missing or unreadable
+    files are skipped so the app still starts (those times simply go to OpenAI).
+    """
+    index = {}
+    for language, filename in HOURS_FILES.items():
+        path = os.path.join(data_dir, filename)
+        try:
+            with open(path, encoding='utf-8') as f:
+                hours = json.load(f)
+        except (OSError, ValueError) as e:
+            if logger is not None:
+                logger.warning(f"Could not load mirror hour interpretations from {path}: {str(e)}")
+            continue
+        for time_str, interpretation in hours.items():
+            index[(time_str, language)] = _freeze(interpretation)
+    return MappingProxyType(index)
+
+
+def summarize(interpretation):
+    """Flatten a curated interpretation into the single `analysis` string the API returns."""
+    spiritual = interpretation.get('spiritual', {})
+    parts = [spiritual.get('description'), spiritual.get('guidance')]
+    text = ' '.join(part for part in parts if part)
+    title = spiritual.get('title')
+    return f"{title}: {text}" if title and text else (title or text or None)
+
+
+def local_interpretation(index, time_str, language):
+    """Return the API response for a canonical time, or None if the index has no entry."""
+    interpretation = index.get((time_str, language))
+    if interpretation is None:
+        return None
+    return {
+        "analysis": summarize(interpretation),
+        "interpretation": _thaw(interpretation),
+        "source": "local",
+    }
@@ -0,0 +1,148 @@
+import queue
+import threading
+import time
+import uuid
+
+
+class QueueFullError(Exception):
+    pass
+
+
+class Job:
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+
+    def __init__(self, args):
+        self.id = uuid.uuid4().hex
+        self.args = args
+        self.status = self.QUEUED
+        self.result = None
+        self.error = None # (status_code, error dict) when the job failed
+        self.created_at = time.time()
+        self.finished_at = None
+
+    def to_dict(self):
+        data = {'jobId': self.id, 'status': self.status}
+        if self.status == self.DONE:
+            data['result'] = self.result
+        elif self.status == self.FAILED:
+            data['statusCode'], data['error'] = self.error
+        return data
+
+
+class JobQueue:
+    """Bounded queue of analysis jobs served by a pool of background worker threads.
+
+    Workers are started on the first submit and run `handler(*job.args)` inside an app
+    context. `handler` either returns the result or raises; `on_error(exc)` converts the
+    exception into the (status_code, error dict) stored on the job. Finished jobs are kept
+    for `result_ttl` seconds. Jobs live in this process only, so with several gunicorn
+    workers the status must be polled through a sticky route or a single worker.
+    """
+
+    def __init__(self, app, handler, on_error, workers=4, max_depth=100, result_ttl=600):
+        self.app = app
+        self.handler = handler
+        self.on_error = on_error
+        self.workers = workers
+        self.result_ttl = result_ttl
+        self._queue = queue.Queue(maxsize=max_depth)
+        self._jobs = {}
+        self._lock = threading.Lock()
+        self._threads = []
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+
+    @classmethod
+    def from_config(cls, app, handler, on_error):
+        return cls(
+            app, handler, on_error,
+            workers=app.config['ANALYSIS_JOB_WORKERS'],
+            max_depth=app.config['ANALYSIS_JOB_QUEUE_SIZE'],
+            result_ttl=app.config['ANALYSIS_JOB_RESULT_TTL'],
+        )
+
+    def submit(self, *args):
+        self._ensure_workers()
+        self._prune()
+        job = Job(args)
+        with self._lock:
+            self._jobs[job.id] = job
+        try:
+            self._queue.put_nowait(job)
+        except queue.Full:
+            with self._lock:
+                del self._jobs[job.id]
+                self.rejected += 1
+            raise QueueFullError('Analysis job queue is full')
+        return job
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def _ensure_workers(self):
+        if len(self._threads) >= self.workers:
+            return
+        with self._lock:
+            while len(self._threads) < self.workers:
+                thread = threading.Thread(target=self._work, name=f'analysis-job-{len(self._threads)}', daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def _prune(self):
+        cutoff = time.time() - self.result_ttl
+        with self._lock:
+            expired = [job_id for job_id, job in self._jobs.items()
+                       if job.finished_at is not None and job.finished_at < cutoff]
+            for job_id in expired:
+                del self._jobs[job_id]
+
+    def _work(self):
+        while True:
+            job = self._queue.get()
+            if job is None: # shutdown sentinel
+                self._queue.task_done()
+                return
+            job.status = Job.RUNNING
+            with self.app.app_context():
+                try:
+                    job.result = self.handler(*job.args)
+                    job.status = Job.DONE
+                except Exception as e:
+                    job.error = self.on_error(e)
+                    job.status = Job.FAILED
+            job.finished_at = time.time()
+            with self._lock:
+                if job.status == Job.DONE:
+                    self.completed += 1
+                else:
+                    self.failed += 1
+            self._queue.task_done()
+
+    def join(self):
+        """Block until every queued job has been processed."""
+        self._queue.join()
+
+    def shutdown(self):
+        for _ in self._threads:
+            self._queue.put(None)
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
+
+    def stats(self):
+        with self._lock:
+            running = sum(1 for job in self._jobs.values() if job.status == Job.RUNNING)
+            return {
+                'depth': self._queue.qsize(),
+                'max_depth': self._queue.maxsize,
+                'workers': len(self._threads),
+                'running': running,
+                'completed': self.completed,
+                'failed': self.failed,
+                'rejected': self.rejected,
+            }
@@ -0,0 +1,80 @@
+import json
+from datetime import date
+
+from flask import current_app
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:  # optional: fall back to the stdlib encoder
+    orjson = None
+
+_ORJSON_OPTIONS = orjson.OPT_NON_STR_KEYS if orjson is not None else 0
+
+
+def raw_json(text):
+    """Wrap already-encoded JSON `text` so responses embed it verbatim, or None if it is not valid JSON.
+
+    With an orjson that has Fragment (3.9+) the text is only validated and spliced into
+    the response, never re-encoded; otherwise, and for the stdlib encoder, it is decoded
+    and embedded as a value.
+    """
+    provider = current_app.json
+    try:
+        value = provider.loads(text)
+    except ValueError:
+        return None
+    fragment = getattr(orjson, 'Fragment', None)
+    if fragment is not None and getattr(provider, 'use_orjson', False):
+        return fragment(text)
+    return value
+
+
+class FastJSONProvider(DefaultJSONProvider):
+    """App JSON provider that writes dates as ISO 8601, encoding with orjson when allowed.
+
+    Dates and datetimes are written as ISO 8601 (orjson does this natively; the stdlib
+    path matches it), so routes can return model values without calling isoformat().
+    orjson is used when it is installed and JSON_FAST_PROVIDER is on; either way the
+    output is the same JSON. Keys keep insertion order. Calls with extra
+    json.dumps/json.loads arguments, and pretty-printed debug responses, go through
+    the stdlib.
+    """
+
+    sort_keys = False
+
+    def __init__(self, app):
+        super().__init__(app)
+        self.use_orjson = app.config.get('JSON_FAST_PROVIDER', True)
+
+    def _orjson(self):
+        return orjson is not None and self.use_orjson
+
+    @staticmethod
+    def default(o):
+        if isinstance(o, date):
+            return o.isoformat()
+        fragment = getattr(orjson, 'Fragment', None)
+        if fragment is not None and isinstance(o, fragment):
+            # A raw_json() value reaching the stdlib encoder (e.g. pretty-printed debug output)
+            contents = o.contents
+            return json.loads(contents.decode('utf-8') if isinstance(contents, bytes) else contents)
+        return DefaultJSONProvider.default(o)
+
+    def dumps(self, obj, **kwargs):
+        if not self._orjson() or kwargs:
+            return super().dumps(obj, **kwargs)
+        return orjson.dumps(obj, default=self.default, option=_ORJSON_OPTIONS).decode('utf-8')
+
+    def loads(self, s, **kwargs):
+        if not self._orjson() or kwargs:
+            return super().loads(s, **kwargs)
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        if not self._orjson() or (self.compact is None and self._app.debug) or self.compact is False:
+            return super().response(*args, **kwargs)
+        obj = self._prepare_response_obj(args, kwargs)
+        # Bytes straight into the response, skipping the str round trip
+        body = orjson.dumps(obj, default=self.default, option=_ORJSON_OPTIONS | orjson.OPT_APPEND_NEWLINE)
+        return self._app.response_class(body, mimetype=self.mimetype)
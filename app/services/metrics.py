@@ -0,0 +1,247 @@
+import threading
+import time
+from flask import Response, current_app, g, request
+from app.services.sql_profile import get_profile
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in labels) + '}'
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    type = 'counter'
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels.get(name, '') for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        key = tuple(labels.get(name, '') for name in self.labelnames)
+        return self._values.get(key, 0)
+
+    def samples(self):
+        with self._lock:
+            items = list(self._values.items())
+        for key, value in items:
+            yield self.name, tuple(zip(self.labelnames, key)), value
+
+
+class Histogram:
+    type = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets)) + (float('inf'),)
+        self._values = {} # label values -> [bucket counts..., sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(labels.get(name, '') for name in self.labelnames)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [0] * len(self.buckets) + [0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[i] += 1
+            state[-2] += value
+            state[-1] += 1
+
+    def count(self, **labels):
+        key = tuple(labels.get(name, '') for name in self.labelnames)
+        state = self._values.get(key)
+        return state[-1] if state else 0
+
+    def samples(self):
+        with self._lock:
+            items = [(key, list(state)) for key, state in self._values.items()]
+        for key, state in items:
+            labels = tuple(zip(self.labelnames, key))
+            for bound, bucket_count in zip(self.buckets, state):
+                yield self.name + '_bucket', labels + (('le', _format_value(bound)),), bucket_count
+            yield self.name + '_sum', labels, state[-2]
+            yield self.name + '_count', labels, state[-1]
+
+
+class MetricsRegistry:
+    """In-process metrics rendered in the Prometheus text format.
+
+    Counters and histograms are updated on the hot path; `collectors` are callables that
+    return (name, type, help, [(labels, value), ...]) tuples read at scrape time, which is
+    how caches, queues and the circuit breaker report their current state. Values are per
+    process: with several gunicorn workers, scrape each one or use a shared registry.
+    """
+
+    def __init__(self):
+        self._metrics = {}
+        self._collectors = []
+        self._lock = threading.Lock()
+
+    def _register(self, metric):
+        with self._lock:
+            existing = self._metrics.get(metric.name)
+            if existing is not None:
+                return existing
+            self._metrics[metric.name] = metric
+            return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self._register(Counter(name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def get(self, name):
+        return self._metrics.get(name)
+
+    def add_collector(self, collector):
+        self._collectors.append(collector)
+
+    def render(self):
+        lines = []
+        for metric in list(self._metrics.values()):
+            lines.append(f'# HELP {metric.name} {metric.documentation}')
+            lines.append(f'# TYPE {metric.name} {metric.type}')
+            for name, labels, value in metric.samples():
+                lines.append(f'{name}{_format_labels(labels)} {_format_value(value)}')
+        for collector in self._collectors:
+            for name, metric_type, documentation, samples in collector():
+                lines.append(f'# HELP {name} {documentation}')
+                lines.append(f'# TYPE {name} {metric_type}')
+                for labels, value in samples:
+                    lines.append(f'{name}{_format_labels(tuple(labels.items()))} {_format_value(value)}')
+        return '\n'.join(lines) + '\n'
+
+
+def get_metrics():
+    return current_app.extensions.get('metrics')
+
+
+def _route_label():
+    return request.url_rule.rule if request.url_rule is not None else 'unmatched'
+
+
+def _before_request():
+    g._metrics_started = time.perf_counter()
+
+
+def _after_request(response):
+    started = g.pop('_metrics_started', None)
+    if started is None:
+        return response
+    registry = current_app.extensions['metrics']
+    route = _route_label()
+    registry.get('http_request_duration_seconds').observe(
+        time.perf_counter() - started, method=request.method, route=route, status=str(response.status_code))
+    # Counted by the request's SQL profile, the one set of SQLAlchemy timing hooks
+    profile = get_profile()
+    registry.get('db_statements_per_request').observe(profile.statements if profile else 0, route=route)
+    registry.get('db_seconds_per_request').observe(profile.seconds if profile else 0.0, route=route)
+    return response
+
+
+def _component_stats(app):
+    """Scrape-time gauges for the analysis and history caches, queues and the OpenAI client."""
+    metrics = []
+    cache = app.extensions.get('analysis_cache')
+    if cache is not None:
+        stats = cache.stats()
+        metrics.append(('analysis_cache_entries', 'gauge', 'Entries in the analysis response cache.',
+                        [({}, stats['size'])]))
+        metrics.append(('analysis_cache_events_total', 'counter', 'Analysis response cache lookups and removals.',
+                        [({'event': name}, stats[name]) for name in ('hits', 'misses', 'evictions', 'expirations')]))
+    history_cache = app.extensions.get('history_cache')
+    if history_cache is not None:
+        stats = history_cache.stats()
+        metrics.append(('history_cache_users', 'gauge', 'Users with cached history lists.',
+                        [({}, stats['users'])]))
+        metrics.append(('history_cache_bytes', 'gauge', 'Size of the cached history response bodies.',
+                        [({}, stats['bytes'])]))
+        metrics.append(('history_cache_events_total', 'counter', 'History cache lookups and removals.',
+                        [({'event': name}, stats[name]) for name in ('hits', 'misses', 'evictions', 'invalidations')]))
+    write_buffer = app.extensions.get('history_write_buffer')
+    if write_buffer is not None:
+        stats = write_buffer.stats()
+        metrics.append(('history_write_buffer_depth', 'gauge', 'History rows waiting for a write-behind flush.',
+                        [({}, stats['depth'] + stats['in_flight'])]))
+        metrics.append(('history_write_buffer_rows_total', 'counter', 'Buffered history rows by outcome.',
+                        [({'outcome': name}, stats[name]) for name in ('written', 'failed', 'rejected')]))
+    flight = app.extensions.get('analysis_flight')
+    if flight is not None:
+        stats = flight.stats()
+        metrics.append(('analysis_single_flight_total', 'counter', 'Upstream calls started (leader) or joined (coalesced).',
+                        [({'role': 'leader'}, stats['leaders']), ({'role': 'coalesced'}, stats['coalesced'])]))
+    jobs = app.extensions.get('analysis_jobs')
+    if jobs is not None:
+        stats = jobs.stats()
+        metrics.append(('analysis_job_queue_depth', 'gauge', 'Analysis jobs waiting for a worker.',
+                        [({}, stats['depth'])]))
+        metrics.append(('analysis_jobs_total', 'counter', 'Analysis jobs by outcome.',
+                        [({'outcome': name}, stats[name]) for name in ('completed', 'failed', 'rejected')]))
+    login_throttle = app.extensions.get('login_throttle')
+    if login_throttle is not None:
+        metrics.append(('login_throttled_total', 'counter', 'Login attempts rejected by the token buckets.',
+                        [({'scope': scope}, limiter.stats()['throttled']) for scope, limiter in login_throttle.items()]))
+    manager = app.extensions.get('openai_client')
+    if manager is not None:
+        stats = manager.stats()
+        metrics.append(('openai_in_flight_requests', 'gauge', 'OpenAI calls currently in flight.',
+                        [({}, stats['in_flight'])]))
+        metrics.append(('openai_circuit_open', 'gauge', '1 while the OpenAI circuit breaker rejects calls.',
+                        [({}, 0 if stats['breaker_state'] == 'closed' else 1)]))
+        metrics.append(('openai_rejected_total', 'counter', 'OpenAI calls rejected by the concurrency limit.',
+                        [({}, stats['rejected'])]))
+    return metrics
+
+
+def metrics_view():
+    return Response(current_app.extensions['metrics'].render(), mimetype='text/plain; version=0.0.4')
+
+
+def init_app(app):
+    """Create the registry, hook request timing and add GET /metrics.
+
+    Per-request SQL counts come from sql_profile, whose hooks are installed whenever
+    metrics are enabled.
+    """
+    registry = MetricsRegistry()
+    app.extensions['metrics'] = registry
+
+    registry.histogram('http_request_duration_seconds', 'Request latency by route.', ('method', 'route', 'status'))
+    registry.histogram('db_statements_per_request', 'SQL statements executed per request.', ('route',), COUNT_BUCKETS)
+    registry.histogram('db_seconds_per_request', 'Time spent in SQL per request.', ('route',))
+    registry.histogram('openai_request_duration_seconds', 'Latency of OpenAI completion calls.', ('mode', 'outcome'))
+    registry.counter('openai_tokens_total', 'Tokens reported in completion usage.', ('kind',))
+    registry.histogram('history_write_flush_seconds', 'Duration of history write-behind flushes.')
+    registry.add_collector(lambda: _component_stats(app))
+
+    app.before_request(_before_request)
+    app.after_request(_after_request)
+
+    app.add_url_rule(app.config['METRICS_PATH'], 'metrics', metrics_view, methods=['GET'])
+    return registry
@@ -0,0 +1,294 @@
+import os
+import threading
+import time
+import openai
+
+
+class UpstreamUnavailableError(Exception):
+    """Raised instead of calling OpenAI when the call would only tie up a worker thread."""
+
+    def __init__(self, message, retry_after=None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class CircuitOpenError(UpstreamUnavailableError):
+    pass
+
+
+class ConcurrencyLimitError(UpstreamUnavailableError):
+    pass
+
+
+class OpenAIConfigError(Exception):
+    pass
+
+
+def is_outage(error):
+    """True when an openai.APIError says the upstream is failing, not that the request was bad.
+
+    Connection errors, timeouts, 429s and 5xx responses count against the breaker; other
+    4xx responses (e.g. a 400 for an over-long message) are the caller's doing and must
+    not open the circuit for everyone.
+    """
+    if isinstance(error, openai.APIStatusError):
+        return error.status_code >= 500 or error.status_code in (408, 429)
+    return True
+
+
+def _report_api_error(breaker, error):
+    if is_outage(error):
+        breaker.record_failure()
+    else:
+        breaker.release_trial()
+
+
+class CircuitBreaker:
+    """Consecutive-failure circuit breaker.
+
+    After `failure_threshold` failures in a row the circuit opens and calls are rejected
+    for `reset_timeout` seconds. Then a single trial call is let through (half-open):
+    success closes the circuit, failure opens it again.
+    """
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, failure_threshold=5, reset_timeout=30):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = None
+        self.times_opened = 0
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+
+    def before_call(self):
+        with self._lock:
+            if self.state == self.CLOSED:
+                return
+            remaining = self.opened_at + self.reset_timeout - time.monotonic()
+            if self.state == self.OPEN and remaining <= 0:
+                self.state = self.HALF_OPEN
+            if self.state == self.HALF_OPEN and not self._trial_in_flight:
+                self._trial_in_flight = True
+                return
+            raise CircuitOpenError('OpenAI circuit breaker is open', retry_after=max(1, int(remaining + 0.5)))
+
+    def record_success(self):
+        with self._lock:
+            self.state = self.CLOSED
+            self.failures = 0
+            self._trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self._trial_in_flight = False
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                if self.state != self.OPEN:
+                    self.times_opened += 1
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+
+    def release_trial(self):
+        # The trial call ended without a verdict (e.g. a non-API error); let another one through
+        with self._lock:
+            self._trial_in_flight = False
+
+
+class OpenAIClientManager:
+    """Process-wide owner of the OpenAI client.
+
+    Keeps a single client (and therefore a single pooled HTTP connection pool) for the app,
+    caps the number of in-flight upstream calls, applies a per-call timeout and trips a
+    circuit breaker after repeated upstream failures (see is_outage) so requests fail
+    fast during an outage.
+    The SDK's own retries are off by default (max_retries=0): each retry would hold the
+    concurrency slot for another full timeout and hide failures from the breaker.
+    """
+
+    def __init__(self, max_concurrency=8, timeout=30, acquire_timeout=5,
+                 failure_threshold=5, reset_timeout=30, base_url=None, metrics=None, max_retries=0):
+        self.metrics = metrics
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.acquire_timeout = acquire_timeout
+        self.base_url = base_url
+        self.breaker = CircuitBreaker(failure_threshold, reset_timeout)
+        self.max_concurrency = max_concurrency
+        self._semaphore = threading.BoundedSemaphore(max_concurrency)
+        self._client = None
+        self._client_lock = threading.Lock()
+        self._in_flight = 0
+        self._counter_lock = threading.Lock()
+        self.rejected = 0
+
+    @classmethod
+    def from_config(cls, config, metrics=None):
+        return cls(
+            max_concurrency=config['OPENAI_MAX_CONCURRENCY'],
+            timeout=config['OPENAI_TIMEOUT'],
+            acquire_timeout=config['OPENAI_ACQUIRE_TIMEOUT'],
+            failure_threshold=config['OPENAI_BREAKER_THRESHOLD'],
+            reset_timeout=config['OPENAI_BREAKER_RESET'],
+            base_url=config.get('OPENAI_BASE_URL'),
+            metrics=metrics,
+            max_retries=config['OPENAI_MAX_RETRIES'],
+        )
+
+    def get_client(self):
+        if self._client is not None:
+            return self._client
+        with self._client_lock:
+            if self._client is None:
+                api_key = os.environ.get("OPENAI_API_KEY")
+                if not api_key:
+                    raise OpenAIConfigError("OPENAI_API_KEY not set in environment.")
+                kwargs = {'api_key': api_key, 'max_retries': self.max_retries}
+                if self.base_url:
+                    kwargs['base_url'] = self.base_url
+                self._client = openai.OpenAI(**kwargs)
+            return self._client
+
+    def _acquire(self):
+        if not self._semaphore.acquire(timeout=self.acquire_timeout):
+            with self._counter_lock:
+                self.rejected += 1
+            raise ConcurrencyLimitError('Too many concurrent OpenAI requests', retry_after=1)
+        with self._counter_lock:
+            self._in_flight += 1
+
+    def _release(self):
+        with self._counter_lock:
+            self._in_flight -= 1
+        self._semaphore.release()
+
+    @property
+    def in_flight(self):
+        return self._in_flight
+
+    def create_completion(self, **kwargs):
+        """Call chat.completions.create through the breaker, the concurrency cap and the timeout."""
+        client = self.get_client()
+        self.breaker.before_call()
+        try:
+            self._acquire()
+        except ConcurrencyLimitError:
+            self.breaker.release_trial()
+            raise
+        started = time.perf_counter()
+        try:
+            completion = client.chat.completions.create(timeout=self.timeout, **kwargs)
+        except openai.APIError as e:
+            _report_api_error(self.breaker, e)
+            self.observe('complete', 'api_error', started)
+            raise
+        except Exception:
+            self.breaker.release_trial()
+            self.observe('complete', 'error', started)
+            raise
+        finally:
+            self._release()
+        self.breaker.record_success()
+        self.observe('complete', 'ok', started, getattr(completion, 'usage', None))
+        return completion
+
+    def observe(self, mode, outcome, started, usage=None):
+        """Record call latency and, when the response reports it, token usage."""
+        if self.metrics is None:
+            return
+        self.metrics.get('openai_request_duration_seconds').observe(
+            time.perf_counter() - started, mode=mode, outcome=outcome)
+        tokens = self.metrics.get('openai_tokens_total')
+        for kind in ('prompt_tokens', 'completion_tokens'):
+            count = getattr(usage, kind, None)
+            if isinstance(count, int):
+                tokens.inc(count, kind=kind.replace('_tokens', ''))
+
+    def stream_completion(self, **kwargs):
+        """Start a streamed chat completion and return a CompletionStream of text deltas.
+
+        Connection errors are raised here, before the first token; the upstream slot is
+        held until the stream is exhausted or closed.
+        """
+        client = self.get_client()
+        self.breaker.before_call()
+        try:
+            self._acquire()
+        except ConcurrencyLimitError:
+            self.breaker.release_trial()
+            raise
+        started = time.perf_counter()
+        try:
+            stream = client.chat.completions.create(stream=True, timeout=self.timeout, **kwargs)
+        except openai.APIError as e:
+            _report_api_error(self.breaker, e)
+            self.observe('stream', 'api_error', started)
+            self._release()
+            raise
+        except Exception:
+            self.breaker.release_trial()
+            self.observe('stream', 'error', started)
+            self._release()
+            raise
+        return CompletionStream(self, stream, started)
+
+    def stats(self):
+        return {
+            'in_flight': self._in_flight,
+            'max_concurrency': self.max_concurrency,
+            'rejected': self.rejected,
+            'breaker_state': self.breaker.state,
+            'breaker_failures': self.breaker.failures,
+            'breaker_times_opened': self.breaker.times_opened,
+        }
+
+
+class CompletionStream:
+    """Iterator over the text deltas of a streamed completion.
+
+    Reports the outcome to the circuit breaker and frees the upstream slot exactly once,
+    whether the stream finishes, fails or is closed early (e.g. the client disconnected).
+    """
+
+    def __init__(self, manager, stream, started):
+        self._manager = manager
+        self._stream = stream
+        self._started = started
+        self._finished = False
+
+    def __iter__(self):
+        try:
+            for chunk in self._stream:
+                if not chunk.choices:
+                    continue
+                delta = chunk.choices[0].delta.content
+                if delta:
+                    yield delta
+        except openai.APIError as e:
+            self._finish(lambda: _report_api_error(self._manager.breaker, e), 'api_error')
+            raise
+        except Exception:
+            self._finish(self._manager.breaker.release_trial, 'error')
+            raise
+        self._finish(self._manager.breaker.record_success, 'ok')
+
+    def _finish(self, report, outcome):
+        if self._finished:
+            return
+        self._finished = True
+        report()
+        self._manager.observe('stream', outcome, self._started)
+        self._manager._release()
+        close = getattr(self._stream, 'close', None)
+        if close is not None:
+            try:
+                close()
+            except Exception:
+                pass
+
+    def close(self):
+        self._finish(self._manager.breaker.release_trial, 'closed')
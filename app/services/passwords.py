@@ -0,0 +1,144 @@
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from werkzeug import security
+from werkzeug.security import check_password_hash, generate_password_hash
+
+
+class HashUnavailableError(Exception):
+    """Password hashing cannot run right now; callers answer 503."""
+
+
+class HashQueueFullError(HashUnavailableError):
+    pass
+
+
+def normalize_method(method, iterations=None):
+    """Full Werkzeug method string for `method`, as it appears at the start of stored hashes.
+
+    `iterations` fills in the work factor when the method does not name one: PBKDF2
+    iterations, or the scrypt cost parameter N.
+    """
+    parts = method.split(':')
+    if parts[0] == 'pbkdf2':
+        hash_name = parts[1] if len(parts) > 1 else 'sha256'
+        rounds = parts[2] if len(parts) > 2 else iterations or getattr(security, 'DEFAULT_PBKDF2_ITERATIONS', 600000)
+        return f'pbkdf2:{hash_name}:{rounds}'
+    if parts[0] == 'scrypt':
+        if len(parts) > 1:
+            return method
+        return f'scrypt:{iterations or 2 ** 15}:8:1'
+    raise ValueError(f'Unsupported password hash method: {method}')
+
+
+class PasswordHasher:
+    """Runs password hashing and verification on a pool of worker processes.
+
+    Key derivation holds the GIL for hundreds of milliseconds, so doing it on request
+    threads stalls every other request in the worker; in child processes it does not.
+    At most `max_pending` calls are queued or running: a caller that cannot get a slot
+    within `queue_timeout` seconds gets HashQueueFullError instead of waiting behind a
+    burst. If a worker dies (e.g. OOM-killed) the broken pool is replaced and the call
+    retried once; a second failure raises HashUnavailableError. With workers=0 the work
+    runs inline (for tests and single-user tools).
+    """
+
+    def __init__(self, method='scrypt', iterations=None, workers=2, max_pending=32, queue_timeout=2.0):
+        self.method = normalize_method(method, iterations)
+        self.workers = workers
+        self.queue_timeout = queue_timeout
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._executor = None
+        self._lock = threading.Lock()
+        self.hashed = 0
+        self.verified = 0
+        self.rehashed = 0
+        self.rejected = 0
+        self.restarts = 0
+
+    @classmethod
+    def from_config(cls, config):
+        return cls(
+            method=config['PASSWORD_HASH_METHOD'],
+            iterations=config['PASSWORD_HASH_ITERATIONS'],
+            workers=config['PASSWORD_HASH_WORKERS'],
+            max_pending=config['PASSWORD_HASH_MAX_PENDING'],
+            queue_timeout=config['PASSWORD_HASH_QUEUE_TIMEOUT'],
+        )
+
+    def _get_executor(self):
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    # spawn, not fork: the app process already runs worker threads
+                    self._executor = ProcessPoolExecutor(max_workers=self.workers,
+                                                         mp_context=multiprocessing.get_context('spawn'))
+        return self._executor
+
+    def _run(self, fn, *args):
+        if self.workers <= 0:
+            return fn(*args)
+        if not self._slots.acquire(timeout=self.queue_timeout):
+            with self._lock:
+                self.rejected += 1
+            raise HashQueueFullError('Too many password checks in progress')
+        try:
+            for _ in range(2): # once more on a fresh pool if a worker died
+                executor = self._get_executor()
+                try:
+                    return executor.submit(fn, *args).result()
+                except BrokenProcessPool as e:
+                    self._discard_executor(executor)
+                    error = e
+            raise HashUnavailableError('Password hashing workers are unavailable') from error
+        finally:
+            self._slots.release()
+
+    def _discard_executor(self, executor):
+        """Forget a broken pool so the next call starts a new one (unless another thread already did)."""
+        with self._lock:
+            if self._executor is executor:
+                self._executor = None
+                self.restarts += 1
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    def hash(self, password):
+        result = self._run(generate_password_hash, password, self.method)
+        with self._lock:
+            self.hashed += 1
+        return result
+
+    def verify(self, pwhash, password):
+        result = self._run(check_password_hash, pwhash, password)
+        with self._lock:
+            self.verified += 1
+        return result
+
+    def needs_rehash(self, pwhash):
+        """True when `pwhash` was made with another method or work factor than the configured one."""
+        return pwhash.split('$', 1)[0] != self.method
+
+    def rehash(self, password):
+        result = self.hash(password)
+        with self._lock:
+            self.rehashed += 1
+        return result
+
+    def shutdown(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'method': self.method,
+                'workers': self.workers,
+                'hashed': self.hashed,
+                'verified': self.verified,
+                'rehashed': self.rehashed,
+                'rejected': self.rejected,
+                'restarts': self.restarts,
+            }
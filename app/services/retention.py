@@ -0,0 +1,84 @@
+import json
+import zlib
+from datetime import date
+from flask import current_app
+from sqlalchemy import delete, func, select, update
+from app import db
+from app.models import User, HistoryItem, HistoryArchive
+
+_ARCHIVED_COLUMNS = ('id', 'time', 'type', 'thoughts', 'details', 'saved_at')
+
+
+def _encode_default(o):
+    if isinstance(o, date):
+        return o.isoformat()
+    raise TypeError(f'Object of type {type(o).__name__} is not JSON serializable')
+
+
+def compress_items(rows):
+    """Archive payload for `rows`: zlib-compressed JSON with ISO 8601 dates.
+
+    Encoded with the stdlib rather than the app's JSON provider, so the stored format
+    does not depend on response settings.
+    """
+    return zlib.compress(json.dumps(rows, default=_encode_default, ensure_ascii=False,
+                                    separators=(',', ':')).encode('utf-8'))
+
+
+def decompress_items(payload):
+    return json.loads(zlib.decompress(payload))
+
+
+def count_archivable(cutoff):
+    """(items, users) saved before `cutoff` that archive_history() would move."""
+    return db.session.query(func.count(HistoryItem.id), func.count(func.distinct(HistoryItem.user_id))) \
+        .filter(HistoryItem.saved_at < cutoff).one()
+
+
+def archive_history(cutoff, batch_size=1000, on_batch=None):
+    """Move history items saved before `cutoff` into compressed HistoryArchive rows.
+
+    Users are processed one at a time and their old items in batches of `batch_size`,
+    oldest first, through the (user_id, saved_at, id) index. Each batch becomes one
+    archive row and is written, deleted from history_items and committed in a single
+    transaction, so an interrupted run loses nothing and can be started again. The
+    user's history version is bumped, which invalidates ETags and cached lists.
+    Returns (items archived, archive rows written).
+    """
+    table = HistoryItem.__table__
+    columns = [table.c[name] for name in _ARCHIVED_COLUMNS]
+    user_ids = db.session.scalars(
+        select(HistoryItem.user_id).where(HistoryItem.saved_at < cutoff).distinct().order_by(HistoryItem.user_id)).all()
+
+    items = archives = 0
+    for user_id in user_ids:
+        while True:
+            rows = db.session.execute(
+                select(*columns)
+                .where(table.c.user_id == user_id, table.c.saved_at < cutoff)
+                .order_by(table.c.saved_at, table.c.id)
+                .limit(batch_size)).mappings().all()
+            if not rows:
+                break
+            db.session.add(HistoryArchive(
+                user_id=user_id,
+                item_count=len(rows),
+                oldest_saved_at=rows[0]['saved_at'],
+                newest_saved_at=rows[-1]['saved_at'],
+                payload=compress_items([dict(row) for row in rows]),
+            ))
+            db.session.execute(delete(HistoryItem).where(HistoryItem.id.in_([row['id'] for row in rows]))
+                               .execution_options(synchronize_session=False))
+            db.session.execute(update(User).where(User.id == user_id)
+                               .values(history_version=User.history_version + 1))
+            db.session.commit()
+            cache = current_app.extensions.get('history_cache')
+            if cache is not None:
+                cache.invalidate(user_id)
+            items += len(rows)
+            archives += 1
+            if on_batch is not None:
+                on_batch(user_id, len(rows))
+            if len(rows) < batch_size:
+                break
+    return items, archives
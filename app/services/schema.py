@@ -0,0 +1,61 @@
+from sqlalchemy import inspect, text
+from sqlalchemy.schema import CreateColumn
+
+
+def _add_column_sql(table, column, dialect):
+    column_sql = CreateColumn(column).compile(dialect=dialect)
+    return f'ALTER TABLE {dialect.identifier_preparer.format_table(table)} ADD COLUMN {column_sql}'
+
+
+def pending_schema_changes(engine, metadata):
+    """List the changes needed to bring an existing database up to the models.
+
+    Returns (description, apply) pairs, where apply(connection) performs the change.
+    Only additive changes are handled: missing tables, missing nullable (or defaulted)
+    columns, missing indexes and the full-text index. Nothing is ever dropped or rewritten.
+    """
+    inspector = inspect(engine)
+    existing_tables = set(inspector.get_table_names())
+    changes = []
+
+    for table in metadata.sorted_tables:
+        if table.name not in existing_tables:
+            changes.append((f'create table {table.name}',
+                            lambda conn, table=table: table.create(bind=conn)))
+            continue
+
+        existing_columns = {column['name'] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name in existing_columns:
+                continue
+            if not column.nullable and column.server_default is None:
+                changes.append((f'SKIPPED column {table.name}.{column.name}: NOT NULL without a server default '
+                                f'needs a manual migration', None))
+                continue
+            sql = _add_column_sql(table, column, engine.dialect)
+            changes.append((f'add column {table.name}.{column.name}',
+                            lambda conn, sql=sql: conn.execute(text(sql))))
+
+        existing_indexes = {index['name'] for index in inspector.get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name not in existing_indexes:
+                changes.append((f'create index {index.name} on {table.name}',
+                                lambda conn, index=index: index.create(bind=conn)))
+
+    # Full-text search structures live outside the model metadata (FTS5 table, FULLTEXT index)
+    from app.services.search import fulltext_schema_changes
+    changes.extend(fulltext_schema_changes(engine, inspector))
+    return changes
+
+
+def apply_schema_changes(engine, metadata, dry_run=False):
+    """Apply pending_schema_changes() and return their descriptions."""
+    changes = pending_schema_changes(engine, metadata)
+    if not dry_run:
+        for _, apply in changes:
+            if apply is None:
+                continue
+            # One transaction per change: MySQL commits DDL implicitly anyway
+            with engine.begin() as conn:
+                apply(conn)
+    return [description for description, _ in changes]
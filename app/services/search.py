@@ -0,0 +1,89 @@
+import re
+from sqlalchemy import DDL, column, event, inspect, table, text
+from app import db
+from app.models.history_item import HistoryItem
+
+FTS_TABLE = 'history_items_fts'
+FULLTEXT_INDEX = 'ft_history_items_thoughts_details'
+
+_TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+# SQLite: an external-content FTS5 table over history_items, kept in sync by triggers, so
+# every write path (ORM, Core batch inserts, bulk deletes, archiving) updates the index
+_SQLITE_DDL = (
+    f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5("
+    f"thoughts, details, content='history_items', content_rowid='id', "
+    f"tokenize='unicode61 remove_diacritics 2')",
+    f"CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ai AFTER INSERT ON history_items BEGIN "
+    f"INSERT INTO {FTS_TABLE}(rowid, thoughts, details) VALUES (new.id, new.thoughts, new.details); END",
+    f"CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ad AFTER DELETE ON history_items BEGIN "
+    f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, thoughts, details) "
+    f"VALUES ('delete', old.id, old.thoughts, old.details); END",
+    f"CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_au AFTER UPDATE ON history_items BEGIN "
+    f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, thoughts, details) "
+    f"VALUES ('delete', old.id, old.thoughts, old.details); "
+    f"INSERT INTO {FTS_TABLE}(rowid, thoughts, details) VALUES (new.id, new.thoughts, new.details); END",
+)
+# MySQL: InnoDB maintains FULLTEXT indexes itself on every insert, update and delete
+_MYSQL_DDL = (f'ALTER TABLE history_items ADD FULLTEXT INDEX {FULLTEXT_INDEX} (thoughts, details)',)
+
+
+for _statement in _SQLITE_DDL:
+    event.listen(HistoryItem.__table__, 'after_create', DDL(_statement).execute_if(dialect='sqlite'))
+event.listen(HistoryItem.__table__, 'before_drop', DDL(f'DROP TABLE IF EXISTS {FTS_TABLE}').execute_if(dialect='sqlite'))
+for _statement in _MYSQL_DDL:
+    event.listen(HistoryItem.__table__, 'after_create', DDL(_statement).execute_if(dialect='mysql'))
+
+
+def fulltext_schema_changes(engine, inspector=None):
+    """(description, apply) pairs that add the full-text index to an existing history_items table."""
+    inspector = inspector or inspect(engine)
+    if 'history_items' not in inspector.get_table_names():
+        return [] # created together with the table
+    dialect = engine.dialect.name
+    if dialect == 'sqlite' and FTS_TABLE not in inspector.get_table_names():
+        def apply(conn):
+            for statement in _SQLITE_DDL:
+                conn.execute(text(statement))
+            # Index the rows that already exist
+            conn.execute(text(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')"))
+        return [(f'create full-text table {FTS_TABLE}', apply)]
+    if dialect == 'mysql' and FULLTEXT_INDEX not in {index['name'] for index in inspector.get_indexes('history_items')}:
+        return [(f'create full-text index {FULLTEXT_INDEX} on history_items',
+                 lambda conn: conn.execute(text(_MYSQL_DDL[0])))]
+    return []
+
+
+def search_terms(query):
+    """The word tokens of a user query; punctuation and search operators are dropped."""
+    return _TOKEN_RE.findall(query)
+
+
+def search_history(user_id, terms, limit, offset=0):
+    """One page of a user's history items matching every term, best match first.
+
+    Returns HistoryItem objects. Uses FTS5 bm25() ranking on SQLite and InnoDB
+    FULLTEXT relevance on MySQL; other databases fall back to a substring scan
+    ordered by recency.
+    """
+    dialect = db.engine.dialect.name
+    order = [HistoryItem.id.desc()]
+    if dialect == 'sqlite':
+        # Each term quoted, so FTS5 reads them as plain words joined by AND
+        match = ' '.join(f'"{term}"' for term in terms)
+        fts = table(FTS_TABLE, column('rowid'), column('rank')) # rank is bm25(), lower is better
+        query = HistoryItem.query.join(fts, fts.c.rowid == HistoryItem.id) \
+            .filter(HistoryItem.user_id == user_id, text(f'{FTS_TABLE} MATCH :match')) \
+            .order_by(fts.c.rank, *order).params(match=match)
+    elif dialect == 'mysql':
+        # Boolean mode with every term required, matching the SQLite semantics
+        against = 'MATCH (history_items.thoughts, history_items.details) AGAINST (:against IN BOOLEAN MODE)'
+        query = HistoryItem.query.filter(HistoryItem.user_id == user_id, text(against)) \
+            .order_by(text(f'{against} DESC'), *order).params(against=' '.join(f'+{term}' for term in terms))
+    else:
+        query = HistoryItem.query.filter(HistoryItem.user_id == user_id)
+        for term in terms:
+            pattern = f'%{term}%'
+            query = query.filter(HistoryItem.thoughts.ilike(pattern) | HistoryItem.details.ilike(pattern))
+        query = query.order_by(HistoryItem.saved_at.desc(), *order)
+    return query.limit(limit).offset(offset).all()
@@ -0,0 +1,132 @@
+import time
+from flask import current_app, g, has_request_context, request
+from sqlalchemy import event
+
+MODES = ('off', 'basic', 'debug')
+
+
+class RequestSQLProfile:
+    """SQL statements run while serving one request.
+
+    Statements are grouped twice: by (statement, parameters), where a count above one is
+    a redundant query (the same row fetched again), and by statement text alone, where
+    many executions with different parameters is the N+1 shape of a lazy relationship
+    loaded in a loop. With analyze=False (SQL_PROFILE 'off', kept for the metrics) only
+    the count and time are tracked.
+    """
+
+    def __init__(self, analyze=True):
+        self.started = time.perf_counter()
+        self.analyze = analyze
+        self.statements = 0
+        self.seconds = 0.0
+        self.log = [] # (statement, parameters, seconds), debug mode only
+        self._by_call = {}
+        self._by_statement = {}
+
+    def record(self, statement, parameters, elapsed, executemany=False, keep=False):
+        self.statements += 1
+        self.seconds += elapsed
+        if keep:
+            self.log.append((statement, parameters, elapsed))
+        if executemany or not self.analyze:
+            return
+        key = (statement, repr(parameters))
+        self._by_call[key] = self._by_call.get(key, 0) + 1
+        self._by_statement[statement] = self._by_statement.get(statement, 0) + 1
+
+    def repeated(self):
+        """[(statement, parameters repr, count)] for statements run more than once with the same parameters."""
+        return [(statement, parameters, count) for (statement, parameters), count in self._by_call.items() if count > 1]
+
+    def n_plus_one(self, threshold):
+        """[(statement, count)] for statements run at least `threshold` times with varying parameters."""
+        return [(statement, count) for statement, count in self._by_statement.items() if count >= threshold]
+
+
+def get_profile():
+    """The current request's profile, or None outside a profiled request."""
+    return g.get('_sql_profile') if has_request_context() else None
+
+
+def _before_request():
+    g._sql_profile = RequestSQLProfile(analyze=current_app.config['SQL_PROFILE'] != 'off')
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if context is not None:
+        context._sql_profile_started = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = getattr(context, '_sql_profile_started', None)
+    profile = get_profile()
+    if started is None or profile is None:
+        return
+    profile.record(statement, parameters, time.perf_counter() - started, executemany,
+                   keep=current_app.config['SQL_PROFILE'] == 'debug')
+
+
+def _shorten(statement, limit=200):
+    statement = ' '.join(statement.split())
+    return statement if len(statement) <= limit else statement[:limit] + '...'
+
+
+def _after_request(response):
+    # Left on g: the metrics after_request hook runs later and reads the same profile
+    profile = get_profile()
+    if profile is None or not profile.analyze:
+        return response
+    config = current_app.config
+    logger = current_app.logger
+    label = f'{request.method} {request.path}'
+
+    budget = config['SQL_QUERY_BUDGET']
+    if budget and profile.statements > budget:
+        logger.warning(f'{label} ran {profile.statements} SQL statements (budget {budget}) '
+                       f'in {profile.seconds * 1000:.1f} ms')
+    repeated = profile.repeated()
+    for statement, parameters, count in repeated:
+        logger.warning(f'{label} repeated an identical SQL statement {count}x: {_shorten(statement)} {parameters}')
+    suspects = profile.n_plus_one(config['SQL_N_PLUS_ONE_THRESHOLD'])
+    for statement, count in suspects:
+        logger.warning(f'{label} ran the same SQL {count}x with varying parameters (possible N+1): '
+                       f'{_shorten(statement)}')
+    if config['SQL_PROFILE'] == 'debug':
+        for statement, parameters, seconds in profile.log:
+            logger.debug(f'{label} SQL {seconds * 1000:.2f} ms: {_shorten(statement, 1000)} {parameters!r}')
+
+    if config['SQL_SERVER_TIMING']:
+        total = (time.perf_counter() - profile.started) * 1000
+        timing = [f'db;dur={profile.seconds * 1000:.2f};desc="{profile.statements} queries"']
+        if repeated:
+            timing.append(f'db-repeated;desc="{sum(count - 1 for _, _, count in repeated)} redundant"')
+        if suspects:
+            timing.append(f'db-n-plus-one;desc="{len(suspects)} statements"')
+        timing.append(f'app;dur={total:.2f}')
+        response.headers.add('Server-Timing', ', '.join(timing))
+    return response
+
+
+def init_app(app, db):
+    """Profile the SQL of every request according to SQL_PROFILE ('off', 'basic' or 'debug').
+
+    'basic' counts statements and DB time, logs requests over SQL_QUERY_BUDGET, flags
+    repeated and N+1-shaped statements and adds a Server-Timing header; 'debug' also
+    logs every statement at DEBUG level. These are the app's only SQL timing hooks:
+    the per-request SQL metrics read the same profile, so with METRICS_ENABLED the
+    statements are still counted when SQL_PROFILE is 'off'.
+    """
+    mode = app.config['SQL_PROFILE']
+    if mode not in MODES:
+        raise ValueError(f'SQL_PROFILE must be one of {", ".join(MODES)}, not {mode!r}')
+    if mode == 'off' and not app.config['METRICS_ENABLED']:
+        return
+
+    app.before_request(_before_request)
+    app.after_request(_after_request)
+
+    with app.app_context():
+        for engine in db.engines.values():
+            event.listen(engine, 'before_cursor_execute', _before_cursor_execute)
+            event.listen(engine, 'after_cursor_execute', _after_cursor_execute)
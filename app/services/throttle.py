@@ -0,0 +1,57 @@
+import math
+import threading
+import time
+from collections import OrderedDict
+
+
+class TokenBucketLimiter:
+    """Per-key token buckets held in a bounded, LRU-evicted map.
+
+    Each key may spend `burst` attempts at once and regains `rate` attempts per second.
+    Only keys seen recently are tracked: past `maxsize` keys the least recently used
+    bucket is dropped, which at worst forgets a partly drained bucket. Buckets live in
+    this process only, so with several gunicorn workers each enforces its own limit.
+    """
+
+    def __init__(self, rate, burst, maxsize=100000):
+        self.rate = rate
+        self.burst = burst
+        self.maxsize = maxsize
+        self._buckets = OrderedDict() # key -> (tokens, updated_at)
+        self._lock = threading.Lock()
+        self.allowed = 0
+        self.throttled = 0
+        self.evictions = 0
+
+    def acquire(self, key):
+        """Spend one token for `key`; returns 0 when allowed, else the seconds until one is available."""
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated_at = self._buckets.pop(key, (self.burst, now))
+            tokens = min(self.burst, tokens + (now - updated_at) * self.rate)
+            if tokens >= 1:
+                tokens -= 1
+                retry_after = 0
+                self.allowed += 1
+            else:
+                retry_after = (1 - tokens) / self.rate if self.rate > 0 else math.inf
+                self.throttled += 1
+            self._buckets[key] = (tokens, now)
+            while len(self._buckets) > self.maxsize:
+                self._buckets.popitem(last=False)
+                self.evictions += 1
+            return retry_after
+
+    def clear(self):
+        with self._lock:
+            self._buckets.clear()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'keys': len(self._buckets),
+                'maxsize': self.maxsize,
+                'allowed': self.allowed,
+                'throttled': self.throttled,
+                'evictions': self.evictions,
+            }
@@ -0,0 +1,70 @@
+import hashlib
+import secrets
+import time
+from itsdangerous import BadSignature, SignatureExpired, URLSafeTimedSerializer
+from app.services.cache import LRUCache
+
+
+class InvalidTokenError(Exception):
+    pass
+
+
+class SessionTokens:
+    """Signed, expiring session tokens that carry the user id.
+
+    A token is the user id plus its issue time, signed with HMAC-SHA256 under
+    SECRET_KEY, so checking one needs no database access. Tokens verified recently
+    are remembered (for at most their remaining lifetime) in an LRU, which skips the
+    decode and HMAC on repeat requests. Tokens cannot be revoked one by one: they
+    expire after `max_age` seconds, and changing SECRET_KEY invalidates all of them.
+    """
+
+    SALT = 'session-token'
+
+    def __init__(self, secret, max_age=7 * 24 * 3600, cache_size=4096):
+        self.max_age = max_age
+        self._serializer = URLSafeTimedSerializer(secret, salt=self.SALT,
+                                                  signer_kwargs={'digest_method': hashlib.sha256})
+        self._verified = LRUCache(maxsize=cache_size, ttl=max_age)
+
+    @classmethod
+    def from_config(cls, app):
+        """Tokens signed with SECRET_KEY, or None (tokens off) when it is not set.
+
+        A random per-process key would make each worker reject the others' tokens, so
+        one is only made up under TESTING. SESSION_TOKEN_REQUIRED without a key is a
+        configuration error.
+        """
+        secret = app.config.get('SECRET_KEY')
+        if not secret:
+            if app.config['SESSION_TOKEN_REQUIRED']:
+                raise ValueError('SESSION_TOKEN_REQUIRED is set but SECRET_KEY is not')
+            if not app.testing:
+                app.logger.warning('SECRET_KEY is not set; login will not issue session tokens')
+                return None
+            secret = secrets.token_hex(32)
+        return cls(secret, max_age=app.config['SESSION_TOKEN_MAX_AGE'],
+                   cache_size=app.config['SESSION_TOKEN_CACHE_SIZE'])
+
+    def issue(self, user_id):
+        return self._serializer.dumps({'uid': user_id})
+
+    def verify(self, token):
+        """Return the user id a token was issued for; raises InvalidTokenError if it is forged or expired."""
+        user_id = self._verified.get(token)
+        if user_id is not None:
+            return user_id
+        try:
+            payload, issued_at = self._serializer.loads(token, max_age=self.max_age, return_timestamp=True)
+            user_id = int(payload['uid'])
+        except SignatureExpired:
+            raise InvalidTokenError('Session token has expired')
+        except (BadSignature, KeyError, TypeError, ValueError):
+            raise InvalidTokenError('Invalid session token')
+        remaining = issued_at.timestamp() + self.max_age - time.time()
+        if remaining > 0:
+            self._verified.set(token, user_id, ttl=remaining)
+        return user_id
+
+    def stats(self):
+        return self._verified.stats()
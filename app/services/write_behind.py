@@ -0,0 +1,167 @@
+import atexit
+import threading
+import time
+import uuid
+from app import db
+
+
+class BufferFullError(Exception):
+    pass
+
+
+class WriteBehindBuffer:
+    """In-process buffer that turns many single-row writes into batched transactions.
+
+    `append(row)` only queues the row. A background thread (started on the first
+    append) hands the queued rows to `writer(rows)` inside an app context once
+    `max_batch` rows are waiting or the oldest has waited `flush_interval` seconds;
+    `writer` inserts and commits them. If a batch fails it is retried one group at a
+    time (rows sharing `group_key`), so one bad row only loses its own group.
+    Pending rows are flushed by close(), which runs at interpreter exit. Rows live in
+    this process only: a crash (not a clean shutdown) loses at most the unflushed rows.
+    """
+
+    def __init__(self, app, writer, group_key=None, max_batch=200, flush_interval=0.5, max_depth=10000,
+                 metrics=None):
+        self.app = app
+        self.writer = writer
+        self.group_key = group_key
+        self.max_batch = max_batch
+        self.flush_interval = flush_interval
+        self.max_depth = max_depth
+        self.metrics = metrics
+        self._pending = []
+        self._oldest = None # monotonic time the oldest pending row was queued
+        self._cond = threading.Condition()
+        self._flush_lock = threading.Lock()
+        self._thread = None
+        self._stopping = False
+        self.in_flight = 0
+        self.written = 0
+        self.failed = 0
+        self.rejected = 0
+        self.flushes = 0
+        self.last_flush_seconds = 0.0
+
+    @classmethod
+    def from_config(cls, app, writer, group_key=None, metrics=None):
+        buffer = cls(
+            app, writer, group_key,
+            max_batch=app.config['HISTORY_WRITE_BEHIND_BATCH'],
+            flush_interval=app.config['HISTORY_WRITE_BEHIND_INTERVAL'],
+            max_depth=app.config['HISTORY_WRITE_BEHIND_MAX_DEPTH'],
+            metrics=metrics,
+        )
+        atexit.register(buffer.close)
+        return buffer
+
+    def append(self, row):
+        """Queue a row and return its provisional id; raises BufferFullError at max_depth."""
+        with self._cond:
+            if self._stopping:
+                raise BufferFullError('History write buffer is shutting down')
+            if len(self._pending) >= self.max_depth:
+                self.rejected += 1
+                raise BufferFullError('History write buffer is full')
+            if not self._pending:
+                self._oldest = time.monotonic()
+            self._pending.append(row)
+            self._cond.notify()
+        self._ensure_thread()
+        return f'pending-{uuid.uuid4().hex}'
+
+    def _ensure_thread(self):
+        if self._thread is not None:
+            return
+        with self._cond:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='history-write-behind', daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._stopping and len(self._pending) < self.max_batch:
+                    if not self._pending:
+                        self._cond.wait()
+                        continue
+                    remaining = self._oldest + self.flush_interval - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+                stopping = self._stopping
+            self.flush()
+            if stopping:
+                return
+
+    def flush(self):
+        """Write every pending row now, in batches of max_batch; returns the number written."""
+        written = 0
+        with self._flush_lock:
+            while True:
+                with self._cond:
+                    batch = self._pending[:self.max_batch]
+                    del self._pending[:self.max_batch]
+                    self._oldest = time.monotonic() if self._pending else None
+                    self.in_flight = len(batch)
+                if not batch:
+                    return written
+                written += self._write(batch)
+                self.in_flight = 0
+
+    def _write(self, batch):
+        started = time.perf_counter()
+        written = 0
+        with self.app.app_context():
+            try:
+                self.writer(batch)
+                written = len(batch)
+            except Exception as e:
+                db.session.rollback()
+                self.app.logger.error(f'History write-behind flush of {len(batch)} rows failed, '
+                                      f'retrying per group: {str(e)}')
+                written = self._write_groups(batch)
+        elapsed = time.perf_counter() - started
+        self.flushes += 1
+        self.written += written
+        self.failed += len(batch) - written
+        self.last_flush_seconds = elapsed
+        if self.metrics is not None:
+            self.metrics.get('history_write_flush_seconds').observe(elapsed)
+        return written
+
+    def _write_groups(self, batch):
+        groups = {}
+        for row in batch:
+            groups.setdefault(self.group_key(row) if self.group_key else id(row), []).append(row)
+        written = 0
+        for key, rows in groups.items():
+            try:
+                self.writer(rows)
+                written += len(rows)
+            except Exception as e:
+                db.session.rollback()
+                self.app.logger.error(f'Dropped {len(rows)} buffered history rows ({key}): {str(e)}')
+        return written
+
+    def close(self):
+        """Stop the flusher thread after it writes everything still pending."""
+        with self._cond:
+            self._stopping = True
+            self._cond.notify_all()
+        if self._thread is not None:
+            self._thread.join()
+        self.flush()
+
+    def stats(self):
+        with self._cond:
+            return {
+                'depth': len(self._pending),
+                'max_depth': self.max_depth,
+                'in_flight': self.in_flight,
+                'written': self.written,
+                'failed': self.failed,
+                'rejected': self.rejected,
+                'flushes': self.flushes,
+                'last_flush_seconds': self.last_flush_seconds,
+            }
@@ -0,0 +1 @@
+# Load-testing tools: a fake OpenAI API and a load generator for /api/analyze/
@@ -0,0 +1,209 @@
+"""Stand-in for the OpenAI chat-completions API, for offline load testing.
+
+Serves POST /v1/chat/completions (plain and `stream=True`) with a configurable latency
+distribution and injected failures. Point the backend at it with:
+
+    python loadtest/fake_openai.py --port 8089 --latency-ms 800 --jitter-ms 300 --error-rate 0.01
+    OPENAI_BASE_URL=http://127.0.0.1:8089/v1 OPENAI_API_KEY=fake python run.py
+"""
+import argparse
+import json
+import math
+import random
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+LOREM = ("The mirror hour you noticed is a gentle nudge from the universe to pause and listen. "
+         "Its repeated digits reflect a moment of alignment between your intentions and your path. "
+         "Trust what you felt when you saw it and let it guide your next step.")
+
+
+class FakeOpenAIConfig:
+    def __init__(self, latency_ms=500.0, jitter_ms=0.0, distribution='fixed', error_rate=0.0,
+                 rate_limit_rate=0.0, tokens_per_second=50.0, seed=None):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.distribution = distribution
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.tokens_per_second = tokens_per_second
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+
+    def sample_latency(self):
+        """Seconds to wait before the response (or the first streamed token)."""
+        with self.lock:
+            mean, jitter = self.latency_ms, self.jitter_ms
+            if self.distribution == 'uniform':
+                value = self.random.uniform(mean - jitter, mean + jitter)
+            elif self.distribution == 'normal':
+                value = self.random.gauss(mean, jitter)
+            elif self.distribution == 'lognormal' and mean > 0:
+                # Parameterized so the distribution's mean and standard deviation match the options
+                sigma2 = math.log(1 + (jitter / mean) ** 2)
+                value = self.random.lognormvariate(math.log(mean) - sigma2 / 2, math.sqrt(sigma2))
+            else:
+                value = mean
+        return max(0.0, value) / 1000.0
+
+    def roll(self, rate):
+        with self.lock:
+            return self.random.random() < rate
+
+
+class FakeOpenAIHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    server_version = 'FakeOpenAI/1.0'
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+    def _send_json(self, status, body, headers=None):
+        payload = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        try:
+            body = json.loads(self.rfile.read(length) or b'{}')
+        except ValueError:
+            return self._send_json(400, {'error': {'message': 'Invalid JSON body', 'type': 'invalid_request_error'}})
+
+        if self.path.rstrip('/') not in ('/v1/chat/completions', '/chat/completions'):
+            return self._send_json(404, {'error': {'message': f'Unknown path {self.path}', 'type': 'invalid_request_error'}})
+
+        config = self.server.config
+        stats = self.server.stats
+        time.sleep(config.sample_latency())
+
+        if config.roll(config.rate_limit_rate):
+            with config.lock: # handlers run on ThreadingHTTPServer threads
+                stats['rate_limited'] += 1
+            return self._send_json(429, {'error': {'message': 'Rate limit reached (injected)', 'type': 'rate_limit_error'}},
+                                   headers={'Retry-After': '1'})
+        if config.roll(config.error_rate):
+            with config.lock:
+                stats['errors'] += 1
+            return self._send_json(500, {'error': {'message': 'Internal error (injected)', 'type': 'server_error'}})
+
+        with config.lock:
+            stats['completions'] += 1
+        model = body.get('model', 'gpt-3.5-turbo')
+        words = LOREM.split(' ')[:max(1, int(body.get('max_tokens') or 300))]
+        prompt_tokens = sum(len(str(message.get('content', '')).split()) for message in body.get('messages', []))
+        if body.get('stream'):
+            return self._stream(model, words)
+
+        self._send_json(200, {
+            'id': f'chatcmpl-{uuid.uuid4().hex}',
+            'object': 'chat.completion',
+            'created': int(time.time()),
+            'model': model,
+            'choices': [{
+                'index': 0,
+                'message': {'role': 'assistant', 'content': ' '.join(words)},
+                'finish_reason': 'stop',
+            }],
+            'usage': {
+                'prompt_tokens': prompt_tokens,
+                'completion_tokens': len(words),
+                'total_tokens': prompt_tokens + len(words),
+            },
+        })
+
+    def _stream(self, model, words):
+        completion_id = f'chatcmpl-{uuid.uuid4().hex}'
+        created = int(time.time())
+        delay = 1.0 / self.server.config.tokens_per_second if self.server.config.tokens_per_second > 0 else 0
+
+        def chunk(delta, finish_reason=None):
+            data = {
+                'id': completion_id,
+                'object': 'chat.completion.chunk',
+                'created': created,
+                'model': model,
+                'choices': [{'index': 0, 'delta': delta, 'finish_reason': finish_reason}],
+            }
+            return f'data: {json.dumps(data)}\n\n'.encode('utf-8')
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Cache-Control', 'no-cache')
+        self.send_header('Connection', 'close')
+        self.end_headers()
+        self.close_connection = True
+        self.wfile.write(chunk({'role': 'assistant', 'content': ''}))
+        for i, word in enumerate(words):
+            self.wfile.write(chunk({'content': word if i == 0 else ' ' + word}))
+            self.wfile.flush()
+            if delay:
+                time.sleep(delay)
+        self.wfile.write(chunk({}, finish_reason='stop'))
+        self.wfile.write(b'data: [DONE]\n\n')
+        self.wfile.flush()
+
+
+class FakeOpenAIServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, host='127.0.0.1', port=0, config=None, verbose=False):
+        super().__init__((host, port), FakeOpenAIHandler)
+        self.config = config or FakeOpenAIConfig()
+        self.verbose = verbose
+        self.stats = {'completions': 0, 'errors': 0, 'rate_limited': 0}
+        self._thread = None
+
+    @property
+    def base_url(self):
+        host, port = self.server_address[:2]
+        return f'http://{host}:{port}/v1'
+
+    def start(self):
+        """Serve from a background thread (used by tests and scripts)."""
+        self._thread = threading.Thread(target=self.serve_forever, name='fake-openai', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8089)
+    parser.add_argument('--latency-ms', type=float, default=500.0, help='Mean latency before the response.')
+    parser.add_argument('--jitter-ms', type=float, default=0.0, help='Spread (half-width for uniform, std dev otherwise).')
+    parser.add_argument('--distribution', choices=('fixed', 'uniform', 'normal', 'lognormal'), default='fixed')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Fraction of requests answered with 500.')
+    parser.add_argument('--rate-limit-rate', type=float, default=0.0, help='Fraction of requests answered with 429.')
+    parser.add_argument('--tokens-per-second', type=float, default=50.0, help='Streaming speed after the first token.')
+    parser.add_argument('--seed', type=int, default=None)
+    parser.add_argument('--verbose', action='store_true', help='Log every request.')
+    args = parser.parse_args()
+
+    config = FakeOpenAIConfig(args.latency_ms, args.jitter_ms, args.distribution, args.error_rate,
+                              args.rate_limit_rate, args.tokens_per_second, args.seed)
+    server = FakeOpenAIServer(args.host, args.port, config, verbose=args.verbose)
+    print(f'Fake OpenAI API listening on {server.base_url}')
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        print(f'Served: {server.stats}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,118 @@
+"""Open-loop load generator for POST /api/analyze/.
+
+Sends requests at a fixed target rate (independent of how fast responses come back) and
+reports latency percentiles and achieved throughput. Latency is measured from each
+request's scheduled send time, so client-side queueing is not hidden.
+
+    python loadtest/load_analyze.py --url http://127.0.0.1:5000/api/analyze/ --rps 50 --duration 30
+"""
+import argparse
+import json
+import math
+import random
+import threading
+import time
+import urllib.error
+import urllib.request
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+CANONICAL_TIMES = ['00:00', '01:01', '02:02', '03:03', '04:04', '05:05', '10:10', '11:11', '12:12', '13:13', '22:22']
+MESSAGES = ['I keep seeing this time', 'Should I take the new job?', 'Thinking about my family', None]
+
+
+def build_payloads(count, mix, languages, seed=None):
+    """Build `count` request bodies.
+
+    mix: 'canonical' (mirror hours, no message), 'random' (any HH:MM with a message),
+    or 'mixed' (half each).
+    """
+    rng = random.Random(seed)
+    payloads = []
+    for i in range(count):
+        kind = mix if mix != 'mixed' else ('canonical' if i % 2 == 0 else 'random')
+        if kind == 'canonical':
+            payload = {'time': rng.choice(CANONICAL_TIMES)}
+        else:
+            payload = {'time': f'{rng.randrange(24):02d}:{rng.randrange(60):02d}', 'message': rng.choice(MESSAGES)}
+        payload['language'] = rng.choice(languages)
+        payloads.append(payload)
+    return payloads
+
+
+def percentile(sorted_values, fraction):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return float('nan')
+    rank = max(1, math.ceil(fraction * len(sorted_values)))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+def send(url, payload, timeout):
+    request = urllib.request.Request(url, data=json.dumps(payload).encode('utf-8'),
+                                     headers={'Content-Type': 'application/json'}, method='POST')
+    try:
+        with urllib.request.urlopen(request, timeout=timeout) as response:
+            response.read()
+            return response.status
+    except urllib.error.HTTPError as e:
+        return e.code
+    except Exception as e:
+        return type(e).__name__
+
+
+def run(url, rps, duration, concurrency, payloads, timeout):
+    total = int(rps * duration)
+    latencies = []
+    statuses = Counter()
+    lock = threading.Lock()
+
+    def task(scheduled_at, payload):
+        status = send(url, payload, timeout)
+        elapsed = time.perf_counter() - scheduled_at
+        with lock:
+            statuses[status] += 1
+            if status == 200:
+                latencies.append(elapsed)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        for i in range(total):
+            scheduled_at = started + i / rps
+            delay = scheduled_at - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            executor.submit(task, scheduled_at, payloads[i % len(payloads)])
+    wall = time.perf_counter() - started
+    return sorted(latencies), statuses, wall, total
+
+
+def report(latencies, statuses, wall, total):
+    ok = statuses.get(200, 0)
+    print(f'requests:   {total} sent in {wall:.1f}s')
+    print(f'throughput: {ok / wall:.1f} successful req/s ({total / wall:.1f} req/s offered)')
+    print('statuses:   ' + ', '.join(f'{status}={count}' for status, count in sorted(statuses.items(), key=str)))
+    if latencies:
+        for label, fraction in (('p50', 0.50), ('p95', 0.95), ('p99', 0.99)):
+            print(f'{label}:        {percentile(latencies, fraction) * 1000:.1f} ms')
+        print(f'max:        {latencies[-1] * 1000:.1f} ms')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--url', default='http://127.0.0.1:5000/api/analyze/')
+    parser.add_argument('--rps', type=float, default=20.0, help='Target requests per second.')
+    parser.add_argument('--duration', type=float, default=30.0, help='Seconds to send for.')
+    parser.add_argument('--concurrency', type=int, default=64, help='Maximum requests in flight.')
+    parser.add_argument('--mix', choices=('canonical', 'random', 'mixed'), default='mixed')
+    parser.add_argument('--language', action='append', dest='languages', help='Repeat for several (default: en).')
+    parser.add_argument('--timeout', type=float, default=60.0, help='Per-request timeout in seconds.')
+    parser.add_argument('--seed', type=int, default=None)
+    args = parser.parse_args()
+
+    payloads = build_payloads(max(1, int(args.rps * args.duration)), args.mix, args.languages or ['en'], args.seed)
+    report(*run(args.url, args.rps, args.duration, args.concurrency, payloads, args.timeout))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,7 +1,10 @@
 import click
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime, timedelta
+from flask import current_app
 from flask.cli import with_appcontext
 from app import create_app, db
-from app.models import User, HistoryItem # Ensure models are imported
+from app.models import User, HistoryItem, PregeneratedAnalysis # Ensure models are imported
 
 @click.command('create-tables')
 @with_appcontext
@@ -19,6 +22,139 @@ def create_tables_command():
         db.create_all()
         click.echo('Database tables created successfully!')
 
+
+@click.command('migrate-schema')
+@click.option('--dry-run', is_flag=True, help='Only list the changes that would be applied.')
+@with_appcontext
+def migrate_schema_command(dry_run):
+    """Apply new tables, columns and indexes to an existing database without dropping data."""
+    from app.services.schema import apply_schema_changes
+    changes = apply_schema_changes(db.engine, db.metadata, dry_run=dry_run)
+    if not changes:
+        click.echo('Database schema is up to date.')
+        return
+    for description in changes:
+        click.echo(('Pending: ' if dry_run else 'Applied: ') + description)
+
+
+def _generate_in_app_context(app, time_str, language):
+    from app.services.analysis import generate_analysis
+    with app.app_context():
+        return generate_analysis(time_str, None, language)
+
+
+@click.command('pregenerate-analyses')
+@click.option('--language', 'languages', multiple=True, default=('en', 'fr'), show_default=True,
+              help='Language to generate; repeat the option for several.')
+@click.option('--concurrency', default=4, show_default=True, help='Concurrent OpenAI calls.')
+@click.option('--limit', type=int, default=None, help='Stop after this many new entries (for trial runs).')
+@click.option('--commit-every', default=20, show_default=True, help='Rows written per transaction.')
+@click.option('--overwrite', is_flag=True, help='Discard stored entries for these languages and start over.')
+@with_appcontext
+def pregenerate_analyses_command(languages, concurrency, limit, commit_every, overwrite):
+    """Pre-generate message-less interpretations for every HH:MM time.
+
+    Entries already in the pregenerated_analyses table are skipped, so an interrupted run
+    can simply be started again. Canonical times served from hours.json are skipped too.
+    """
+    from app.services.analysis import AnalysisError
+
+    app = current_app._get_current_object()
+    languages = [language.lower() for language in languages]
+    hours_index = app.extensions.get('hours_index') or {}
+
+    if overwrite:
+        PregeneratedAnalysis.query.filter(PregeneratedAnalysis.language.in_(languages)).delete(synchronize_session=False)
+        db.session.commit()
+
+    existing = set(db.session.query(PregeneratedAnalysis.time, PregeneratedAnalysis.language)
+                   .filter(PregeneratedAnalysis.language.in_(languages)).all())
+    todo = [(f"{hour:02d}:{minute:02d}", language)
+            for language in languages for hour in range(24) for minute in range(60)]
+    todo = [key for key in todo if key not in existing and key not in hours_index]
+    if limit is not None:
+        todo = todo[:limit]
+    click.echo(f'{len(existing)} entries already stored, {len(todo)} to generate.')
+
+    generated = failed = 0
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix='pregenerate') as executor:
+        futures = {executor.submit(_generate_in_app_context, app, time_str, language): (time_str, language)
+                   for time_str, language in todo}
+        # Results are written from this thread only; workers just talk to OpenAI
+        for future in as_completed(futures):
+            time_str, language = futures[future]
+            try:
+                result = future.result()
+            except AnalysisError as e:
+                failed += 1
+                click.echo(f'Failed {time_str} ({language}): {e.message} {e.error or ""}'.rstrip(), err=True)
+                continue
+            if not result.get('analysis'):
+                failed += 1
+                continue
+            db.session.add(PregeneratedAnalysis(time=time_str, language=language, analysis=result['analysis']))
+            generated += 1
+            if generated % commit_every == 0:
+                db.session.commit()
+    db.session.commit()
+    click.echo(f'Generated {generated} interpretations ({failed} failed).')
+
+
+@click.command('archive-history')
+@click.option('--older-than-days', type=int, default=None,
+              help='Archive items saved more than this many days ago (default: HISTORY_RETENTION_DAYS).')
+@click.option('--batch-size', default=1000, show_default=True, help='Items per archive row and transaction.')
+@click.option('--dry-run', is_flag=True, help='Only report how many items would be archived.')
+@with_appcontext
+def archive_history_command(older_than_days, batch_size, dry_run):
+    """Move old history items into compressed per-user archive rows.
+
+    Archived items leave the history list but stay readable through
+    /api/history/<user_id>/archives. Safe to interrupt and run again.
+    """
+    from app.services.retention import archive_history, count_archivable
+    if older_than_days is None:
+        older_than_days = current_app.config['HISTORY_RETENTION_DAYS']
+    cutoff = datetime.utcnow() - timedelta(days=older_than_days)
+
+    if dry_run:
+        items, users = count_archivable(cutoff)
+        click.echo(f'{items} history items from {users} users saved before {cutoff:%Y-%m-%d %H:%M} would be archived.')
+        return
+
+    items, archives = archive_history(
+        cutoff, batch_size,
+        on_batch=lambda user_id, count: click.echo(f'Archived {count} items for user {user_id}.'))
+    click.echo(f'Archived {items} history items into {archives} archive rows.')
+
+
+@click.command('backfill-history-stats')
+@click.option('--user-id', 'user_ids', type=int, multiple=True, help='Only rebuild these users; repeat for several.')
+@with_appcontext
+def backfill_history_stats_command(user_ids):
+    """Rebuild the history_stats rollups from history_items and the archives.
+
+    Needed once for rows written before the rollups existed; each user is rebuilt and
+    committed on its own, so the command can be re-run safely.
+    """
+    from app.services.history_stats import rebuild_user_stats
+    user_ids = user_ids or [user_id for (user_id,) in db.session.query(User.id).order_by(User.id)]
+    total = 0
+    for user_id in user_ids:
+        total += rebuild_user_stats(user_id)
+        db.session.commit()
+    click.echo(f'Rebuilt history statistics for {len(user_ids)} users ({total} items).')
+
+
+# Commands registered on the app's CLI by run.py
+all_commands = (
+    create_tables_command,
+    migrate_schema_command,
+    pregenerate_analyses_command,
+    archive_history_command,
+    backfill_history_stats_command,
+)
+
 if __name__ == '__main__':
     # This setup allows running `python manage.py create-tables`
     # It requires Flask to be installed and discoverable.
@@ -95,7 +231,4 @@ def main():
 # And `app.models.__init__` ensures they are loaded.
 # The `db.create_all()` command will then create tables for all registered models.
 # The application context `with current_app.app_context():` is crucial.
-# The `@with_appcontext` decorator handles this for Flask CLI commands.The `manage.py` file now defines the `create-tables` command.
-To make this command runnable via `flask create-tables` (when `FLASK_APP=run.py`), I need to register this command with the Flask app instance in `run.py`.
-
-I will now modify `run.py` to include this registration.
+# The `@with_appcontext` decorator handles this for Flask CLI commands.
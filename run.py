@@ -1,8 +1,8 @@
 from app import create_app
 
-# Import the command from manage.py
+# Import the commands from manage.py
 try:
-    from manage import create_tables_command
+    from manage import all_commands
     commands_imported = True
 except ImportError:
     commands_imported = False
@@ -11,10 +11,11 @@ app = create_app()
 
 # Register the command with the Flask CLI runner
 if commands_imported:
-    app.cli.add_command(create_tables_command)
+    for command in all_commands:
+        app.cli.add_command(command)
 else:
-    # Optionally print a warning or log if manage.py or the command is not found
-    print("Warning: Could not import create_tables_command from manage.py. CLI command won't be available.")
+    # Optionally print a warning or log if manage.py or the commands are not found
+    print("Warning: Could not import commands from manage.py. CLI commands won't be available.")
 
 
 if __name__ == '__main__':
@@ -1,6 +1,8 @@
 import json
 import os
+import pytest
 from unittest.mock import patch, MagicMock
+from app import db
 
 # Store original API key to restore it later
 ORIGINAL_OPENAI_API_KEY = os.environ.get("OPENAI_API_KEY")
@@ -44,7 +46,7 @@ def test_analyze_success(MockOpenAI, client):
     assert data['analysis'] == "This is a mock analysis."
     
     # Check if OpenAI client was initialized and called
-    MockOpenAI.assert_called_once_with(api_key=os.environ.get("OPENAI_API_KEY"))
+    MockOpenAI.assert_called_once_with(api_key=os.environ.get("OPENAI_API_KEY"), max_retries=0)
     mock_openai_instance.chat.completions.create.assert_called_once()
 
 
@@ -134,3 +136,610 @@ def test_analyze_openai_general_exception(MockOpenAI, client):
     data = response.get_json()
     assert 'Failed to get analysis from OpenAI.' in data['message']
     assert "Generic unexpected error" in data['error']
+
+
+@patch('openai.OpenAI')
+def test_analyze_cache_hit_skips_openai(MockOpenAI, client):
+    """Test that a repeated request is served from the response cache."""
+    mock_completion_instance = MagicMock()
+    mock_completion_instance.choices = [MagicMock(message=MagicMock(content="Cached analysis."))]
+    mock_openai_instance = MockOpenAI.return_value
+    mock_openai_instance.chat.completions.create.return_value = mock_completion_instance
+
+    first = client.post('/api/analyze/', json={'time': '9:09', 'message': 'Hello  world'})
+    # Same request after normalization: zero-padded time, collapsed whitespace, different case
+    second = client.post('/api/analyze/', json={'time': '09:09 ', 'message': 'hello world', 'language': 'en'})
+
+    assert first.status_code == 200
+    assert second.status_code == 200
+    assert second.get_json()['analysis'] == "Cached analysis."
+    mock_openai_instance.chat.completions.create.assert_called_once()
+
+    stats = client.application.extensions['analysis_cache'].stats()
+    assert stats['hits'] == 1
+    assert stats['misses'] == 1
+
+
+@patch('openai.OpenAI')
+def test_analyze_cache_keyed_on_language(MockOpenAI, client):
+    """Test that the same time in another language is not served from the cache."""
+    mock_completion_instance = MagicMock()
+    mock_completion_instance.choices = [MagicMock(message=MagicMock(content="Analysis."))]
+    mock_openai_instance = MockOpenAI.return_value
+    mock_openai_instance.chat.completions.create.return_value = mock_completion_instance
+
+    client.post('/api/analyze/', json={'time': '15:15', 'message': 'Test', 'language': 'en'})
+    client.post('/api/analyze/', json={'time': '15:15', 'message': 'Test', 'language': 'fr'})
+
+    assert mock_openai_instance.chat.completions.create.call_count == 2
+
+
+@patch('openai.OpenAI')
+def test_analyze_cache_disabled(MockOpenAI):
+    """Test that ANALYSIS_CACHE_ENABLED=False sends every request upstream."""
+    from app import create_app
+    app = create_app(test_config={
+        'TESTING': True,
+        'SQLALCHEMY_DATABASE_URI': 'sqlite:///:memory:',
+        'ANALYSIS_CACHE_ENABLED': False,
+    })
+    mock_completion_instance = MagicMock()
+    mock_completion_instance.choices = [MagicMock(message=MagicMock(content="Fresh analysis."))]
+    mock_openai_instance = MockOpenAI.return_value
+    mock_openai_instance.chat.completions.create.return_value = mock_completion_instance
+
+    test_client = app.test_client()
+    test_client.post('/api/analyze/', json={'time': '16:16', 'message': 'Test'})
+    test_client.post('/api/analyze/', json={'time': '16:16', 'message': 'Test'})
+
+    assert app.extensions['analysis_cache'] is None
+    assert mock_openai_instance.chat.completions.create.call_count == 2
+
+
+@patch('openai.OpenAI')
+def test_analyze_errors_are_not_cached(MockOpenAI, client):
+    """Test that failed upstream calls are retried rather than cached."""
+    mock_openai_instance = MockOpenAI.return_value
+    mock_openai_instance.chat.completions.create.side_effect = Exception("Temporary failure")
+
+    client.post('/api/analyze/', json={'time': '17:17', 'message': 'Test'})
+    client.post('/api/analyze/', json={'time': '17:17', 'message': 'Test'})
+
+    assert mock_openai_instance.chat.completions.create.call_count == 2
+
+
+def test_lru_cache_eviction_and_ttl(monkeypatch):
+    """Test LRU eviction order and TTL expiry of the cache itself."""
+    from app.services import cache as cache_module
+    from app.services.cache import LRUCache
+
+    now = [1000.0]
+    monkeypatch.setattr(cache_module.time, 'monotonic', lambda: now[0])
+
+    cache = LRUCache(maxsize=2, ttl=10)
+    cache.set('a', 1)
+    cache.set('b', 2)
+    assert cache.get('a') == 1 # 'a' is now most recently used
+    cache.set('c', 3)          # evicts 'b'
+    assert cache.get('b') is None
+    assert cache.get('c') == 3
+
+    now[0] += 11
+    assert cache.get('a') is None
+
+    stats = cache.stats()
+    assert stats['evictions'] == 1
+    assert stats['expirations'] == 1
+
+
+@patch('openai.OpenAI')
+def test_openai_client_is_reused(MockOpenAI, client):
+    """Test that one OpenAI client is created per app and reused across requests."""
+    mock_completion_instance = MagicMock()
+    mock_completion_instance.choices = [MagicMock(message=MagicMock(content="Analysis."))]
+    mock_openai_instance = MockOpenAI.return_value
+    mock_openai_instance.chat.completions.create.return_value = mock_completion_instance
+
+    client.post('/api/analyze/', json={'time': '18:18', 'message': 'One'})
+    client.post('/api/analyze/', json={'time': '19:19', 'message': 'Two'})
+
+    MockOpenAI.assert_called_once_with(api_key=os.environ.get("OPENAI_API_KEY"), max_retries=0)
+    assert mock_openai_instance.chat.completions.create.call_count == 2
+    # Every call carries the configured per-call timeout
+    _, kwargs = mock_openai_instance.chat.completions.create.call_args
+    assert kwargs['timeout'] == client.application.config['OPENAI_TIMEOUT']
+
+
+@patch('openai.OpenAI')
+def test_circuit_breaker_fails_fast(MockOpenAI, app, client):
+    """Test that repeated APIErrors open the breaker and later requests skip OpenAI."""
+    from openai import APIError
+    app.extensions['openai_client'].breaker.failure_threshold = 2
+    mock_openai_instance = MockOpenAI.return_value
+    mock_openai_instance.chat.completions.create.side_effect = APIError("Upstream down", request=None, body=None)
+
+    for minute in ('01', '02'):
+        response = client.post('/api/analyze/', json={'time': f'20:{minute}', 'message': 'Test'})
+        assert response.status_code == 503
+
+    response = client.post('/api/analyze/', json={'time': '20:03', 'message': 'Test'})
+    assert response.status_code == 503
+    assert response.get_json()['message'] == 'OpenAI service is temporarily unavailable. Please retry later.'
+    assert 'Retry-After' in response.headers
+    assert mock_openai_instance.chat.completions.create.call_count == 2
+
+
+@patch('openai.OpenAI')
+def test_circuit_breaker_ignores_client_errors(MockOpenAI, app, client):
+    """Test that repeated 400s from OpenAI leave the breaker closed while 5xx responses open it."""
+    from openai import BadRequestError, InternalServerError
+    manager = app.extensions['openai_client']
+    manager.breaker.failure_threshold = 2
+    create = MockOpenAI.return_value.chat.completions.create
+
+    def status_error(cls, status):
+        response = MagicMock(status_code=status, headers={})
+        return cls(f'HTTP {status}', response=response, body=None)
+
+    create.side_effect = status_error(BadRequestError, 400)
+    for minute in ('01', '02', '03', '04', '05'):
+        client.post('/api/analyze/', json={'time': f'21:{minute}', 'message': 'x' * 100000})
+    assert manager.breaker.state == 'closed' and manager.breaker.failures == 0
+    assert create.call_count == 5
+
+    create.side_effect = status_error(InternalServerError, 500)
+    for minute in ('06', '07'):
+        client.post('/api/analyze/', json={'time': f'21:{minute}', 'message': 'Test'})
+    assert manager.breaker.state == 'open'
+
+
+def test_circuit_breaker_half_open_recovers(monkeypatch):
+    """Test that the breaker lets one trial call through after the reset timeout."""
+    from app.services import openai_client
+    from app.services.openai_client import CircuitBreaker, CircuitOpenError
+
+    now = [100.0]
+    monkeypatch.setattr(openai_client.time, 'monotonic', lambda: now[0])
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=10)
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+
+    try:
+        breaker.before_call()
+        assert False, "breaker should reject while open"
+    except CircuitOpenError:
+        pass
+
+    now[0] += 10
+    breaker.before_call() # trial call allowed
+    try:
+        breaker.before_call() # but only one
+        assert False, "only one trial call should be allowed"
+    except CircuitOpenError:
+        pass
+    breaker.record_success()
+    assert breaker.state == CircuitBreaker.CLOSED
+
+
+@patch('openai.OpenAI')
+def test_concurrency_limit_returns_503(MockOpenAI, app, client):
+    """Test that requests beyond the in-flight cap are rejected instead of queueing."""
+    manager = app.extensions['openai_client']
+    manager.acquire_timeout = 0
+    for _ in range(manager.max_concurrency):
+        manager._acquire() # occupy every upstream slot
+
+    response = client.post('/api/analyze/', json={'time': '21:21', 'message': 'Busy'})
+
+    assert response.status_code == 503
+    assert manager.stats()['rejected'] == 1
+    MockOpenAI.return_value.chat.completions.create.assert_not_called()
+
+
+def _stream_chunks(*tokens):
+    return [MagicMock(choices=[MagicMock(delta=MagicMock(content=token))]) for token in tokens]
+
+
+@patch('openai.OpenAI')
+def test_analyze_stream_success(MockOpenAI, app, client):
+    """Test that the streaming endpoint relays tokens as SSE events."""
+    mock_openai_instance = MockOpenAI.return_value
+    mock_openai_instance.chat.completions.create.return_value = _stream_chunks("Une ", "analyse", " simulée.")
+
+    response = client.post('/api/analyze/stream', json={
+        'time': '11:11',
+        'message': 'Message de test',
+        'language': 'fr'
+    })
+
+    assert response.status_code == 200
+    assert response.mimetype == 'text/event-stream'
+    body = response.get_data(as_text=True)
+    events = [block for block in body.split('\n\n') if block]
+    assert events[0] == 'data: {"delta": "Une "}'
+    assert events[-1] == 'event: done\ndata: {"analysis": "Une analyse simulée."}'
+
+    _, kwargs = mock_openai_instance.chat.completions.create.call_args
+    assert kwargs['stream'] is True
+    assert "Heure: 11:11" in kwargs['messages'][1]['content']
+    # The upstream slot is released once the stream ends
+    assert app.extensions['openai_client'].in_flight == 0
+
+
+@patch('openai.OpenAI')
+def test_analyze_stream_populates_cache(MockOpenAI, client):
+    """Test that a completed stream is cached and replayed by both endpoints."""
+    mock_openai_instance = MockOpenAI.return_value
+    mock_openai_instance.chat.completions.create.return_value = _stream_chunks("Streamed ", "analysis.")
+
+    client.post('/api/analyze/stream', json={'time': '22:22', 'message': 'Test'}).get_data()
+    response = client.post('/api/analyze/', json={'time': '22:22', 'message': 'Test'})
+
+    assert response.get_json()['analysis'] == "Streamed analysis."
+    mock_openai_instance.chat.completions.create.assert_called_once()
+
+
+@patch('openai.OpenAI')
+def test_analyze_stream_error_before_first_token(MockOpenAI, client):
+    """Test that an upstream failure before streaming starts returns a JSON error."""
+    from openai import APIError
+    mock_openai_instance = MockOpenAI.return_value
+    mock_openai_instance.chat.completions.create.side_effect = APIError("Simulated API Error", request=None, body=None)
+
+    response = client.post('/api/analyze/stream', json={'time': '23:23', 'message': 'Test'})
+
+    assert response.status_code == 503
+    assert 'Failed to get analysis from OpenAI due to API error.' in response.get_json()['message']
+
+
+@patch('openai.OpenAI')
+def test_analyze_stream_error_mid_stream(MockOpenAI, app, client):
+    """Test that a failure after the first token is reported as an SSE error event."""
+    def broken_stream():
+        yield from _stream_chunks("Partial")
+        raise Exception("Connection reset")
+
+    mock_openai_instance = MockOpenAI.return_value
+    mock_openai_instance.chat.completions.create.return_value = broken_stream()
+
+    response = client.post('/api/analyze/stream', json={'time': '23:32', 'message': 'Test'})
+
+    body = response.get_data(as_text=True)
+    assert 'data: {"delta": "Partial"}' in body
+    assert 'event: error' in body
+    assert app.extensions['openai_client'].in_flight == 0
+
+
+def test_analyze_stream_missing_time(client):
+    """Test streaming call with missing 'time' field."""
+    response = client.post('/api/analyze/stream', json={'message': 'Test message'})
+    assert response.status_code == 400
+    assert response.get_json()['message'] == 'Missing required field: time'
+
+
+@patch('openai.OpenAI')
+def test_analyze_batch_success(MockOpenAI, client):
+    """Test that batch results come back in input order with per-item errors."""
+    def fake_create(**kwargs):
+        prompt = kwargs['messages'][1]['content']
+        if "Time: 13:13" in prompt:
+            raise Exception("Generic unexpected error")
+        completion = MagicMock()
+        completion.choices = [MagicMock(message=MagicMock(content=f"Analysis for {prompt.splitlines()[2]}"))]
+        return completion
+
+    mock_openai_instance = MockOpenAI.return_value
+    mock_openai_instance.chat.completions.create.side_effect = fake_create
+
+    response = client.post('/api/analyze/batch', json={'items': [
+        {'time': '10:10', 'message': 'First'},
+        {'message': 'No time'},
+        {'time': '13:13', 'message': 'Fails'},
+        {'time': '12:12', 'message': 'Last'},
+        {'time': '10:10', 'message': 'first'}, # duplicate of the first item after normalization
+    ]})
+
+    assert response.status_code == 200
+    results = response.get_json()['results']
+    assert [result['index'] for result in results] == [0, 1, 2, 3, 4]
+    assert results[0]['analysis'] == "Analysis for Time: 10:10"
+    assert results[1]['status'] == 400
+    assert results[1]['error']['message'] == 'Missing required field: time'
+    assert results[2]['status'] == 500
+    assert "Generic unexpected error" in results[2]['error']['error']
+    assert results[3]['analysis'] == "Analysis for Time: 12:12"
+    assert results[4]['analysis'] == results[0]['analysis']
+    # The duplicate shares one upstream call
+    assert mock_openai_instance.chat.completions.create.call_count == 3
+
+
+def test_analyze_batch_invalid_body(client, app):
+    """Test batch validation of the request body and its size."""
+    response = client.post('/api/analyze/batch', json={'items': []})
+    assert response.status_code == 400
+
+    app.config['ANALYSIS_BATCH_MAX_ITEMS'] = 2
+    response = client.post('/api/analyze/batch', json=[{'time': '01:01'}] * 3)
+    assert response.status_code == 400
+    assert response.get_json()['message'] == 'Too many items in batch (maximum is 2)'
+
+
+@patch('openai.OpenAI')
+def test_analyze_canonical_time_served_locally(MockOpenAI, client):
+    """Test that a canonical time without a message is answered from hours.json."""
+    response = client.post('/api/analyze/', json={'time': '11:11'})
+
+    assert response.status_code == 200
+    data = response.get_json()
+    assert data['source'] == 'local'
+    assert data['analysis']
+    assert set(data['interpretation']) == {'spiritual', 'angel', 'numerology'}
+    MockOpenAI.assert_not_called()
+
+    response = client.post('/api/analyze/', json={'time': '1:01', 'language': 'fr'})
+    assert response.get_json()['interpretation']['spiritual']['title'] == 'Nouveaux Départs'
+    MockOpenAI.assert_not_called()
+
+
+@patch('openai.OpenAI')
+def test_analyze_local_fast_path_falls_back_to_openai(MockOpenAI, client):
+    """Test that messages, non-canonical times and missing translations still go upstream."""
+    mock_completion_instance = MagicMock()
+    mock_completion_instance.choices = [MagicMock(message=MagicMock(content="LLM analysis."))]
+    mock_openai_instance = MockOpenAI.return_value
+    mock_openai_instance.chat.completions.create.return_value = mock_completion_instance
+
+    for payload in ({'time': '11:11', 'message': 'Free text'},
+                    {'time': '14:41'},
+                    {'time': '22:22', 'language': 'fr'}): # hours.fr.json has no 22:22
+        response = client.post('/api/analyze/', json=payload)
+        assert response.get_json()['analysis'] == "LLM analysis."
+
+    assert mock_openai_instance.chat.completions.create.call_count == 3
+
+
+def test_hours_index_is_read_only(app):
+    """Test that the loaded index cannot be mutated."""
+    index = app.extensions['hours_index']
+    assert ('00:00', 'en') in index
+    with pytest.raises(TypeError):
+        index[('00:00', 'en')] = {}
+    with pytest.raises(TypeError):
+        index[('00:00', 'en')]['spiritual']['title'] = 'Changed'
+
+
+@patch('openai.OpenAI')
+def test_concurrent_identical_requests_are_coalesced(MockOpenAI, app):
+    """Test that identical in-flight requests share one upstream call."""
+    import threading
+    import time
+
+    release = threading.Event()
+    mock_completion_instance = MagicMock()
+    mock_completion_instance.choices = [MagicMock(message=MagicMock(content="Shared analysis."))]
+
+    def slow_create(**kwargs):
+        release.wait(5)
+        return mock_completion_instance
+
+    mock_openai_instance = MockOpenAI.return_value
+    mock_openai_instance.chat.completions.create.side_effect = slow_create
+
+    flight = app.extensions['analysis_flight']
+    responses = []
+
+    def post():
+        with app.test_client() as thread_client:
+            responses.append(thread_client.post('/api/analyze/', json={'time': '11:11', 'message': 'Trending'}))
+
+    threads = [threading.Thread(target=post) for _ in range(5)]
+    for thread in threads:
+        thread.start()
+    deadline = time.monotonic() + 5
+    while flight.stats()['coalesced'] < 4 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    release.set()
+    for thread in threads:
+        thread.join(5)
+
+    assert [response.get_json()['analysis'] for response in responses] == ["Shared analysis."] * 5
+    assert mock_openai_instance.chat.completions.create.call_count == 1
+    assert flight.stats() == {'in_flight': 0, 'leaders': 1, 'coalesced': 4}
+
+
+def test_single_flight_propagates_errors():
+    """Test that waiters receive the leader's exception and the key is released afterwards."""
+    import threading
+    from app.services.singleflight import SingleFlight
+
+    flight = SingleFlight()
+    started = threading.Event()
+    release = threading.Event()
+    errors = []
+
+    def failing():
+        started.set()
+        release.wait(5)
+        raise ValueError("upstream failed")
+
+    def call():
+        try:
+            flight.do('key', failing)
+        except ValueError as e:
+            errors.append(e)
+
+    leader = threading.Thread(target=call)
+    leader.start()
+    started.wait(5)
+    follower = threading.Thread(target=call)
+    follower.start()
+    while flight.stats()['coalesced'] < 1:
+        pass
+    release.set()
+    leader.join(5)
+    follower.join(5)
+
+    assert len(errors) == 2
+    assert flight.in_flight() == 0
+    assert flight.do('key', lambda: 'fresh') == 'fresh'
+
+
+@patch('openai.OpenAI')
+def test_analysis_job_lifecycle(MockOpenAI, app, client):
+    """Test that a queued job runs in the background and its result can be polled."""
+    mock_completion_instance = MagicMock()
+    mock_completion_instance.choices = [MagicMock(message=MagicMock(content="Background analysis."))]
+    mock_openai_instance = MockOpenAI.return_value
+    mock_openai_instance.chat.completions.create.return_value = mock_completion_instance
+
+    response = client.post('/api/analyze/jobs', json={'time': '10:01', 'message': 'Later'})
+    assert response.status_code == 202
+    data = response.get_json()
+    assert data['status'] == 'queued'
+    assert response.headers['Location'] == data['statusUrl'] == f"/api/analyze/jobs/{data['jobId']}"
+
+    app.extensions['analysis_jobs'].join()
+
+    response = client.get(data['statusUrl'])
+    assert response.status_code == 200
+    assert response.get_json() == {
+        'jobId': data['jobId'],
+        'status': 'done',
+        'result': {'analysis': "Background analysis."},
+    }
+
+
+@patch('openai.OpenAI')
+def test_analysis_job_failure_is_reported(MockOpenAI, app, client):
+    """Test that an upstream error is stored on the job."""
+    from openai import APIError
+    mock_openai_instance = MockOpenAI.return_value
+    mock_openai_instance.chat.completions.create.side_effect = APIError("Simulated API Error", request=None, body=None)
+
+    job_id = client.post('/api/analyze/jobs', json={'time': '10:02', 'message': 'Fails'}).get_json()['jobId']
+    app.extensions['analysis_jobs'].join()
+
+    data = client.get(f'/api/analyze/jobs/{job_id}').get_json()
+    assert data['status'] == 'failed'
+    assert data['statusCode'] == 503
+    assert "Simulated API Error" in data['error']['error']
+
+
+def test_analysis_job_queue_full():
+    """Test that a full job queue answers 429."""
+    from app import create_app
+    app = create_app(test_config={
+        'TESTING': True,
+        'SQLALCHEMY_DATABASE_URI': 'sqlite:///:memory:',
+        'ANALYSIS_JOB_WORKERS': 0, # nothing drains the queue
+        'ANALYSIS_JOB_QUEUE_SIZE': 1,
+    })
+    test_client = app.test_client()
+
+    assert test_client.post('/api/analyze/jobs', json={'time': '10:03'}).status_code == 202
+    response = test_client.post('/api/analyze/jobs', json={'time': '10:04'})
+    assert response.status_code == 429
+    assert app.extensions['analysis_jobs'].stats()['rejected'] == 1
+
+
+def test_analysis_job_not_found(client):
+    """Test polling an unknown job id."""
+    response = client.get('/api/analyze/jobs/doesnotexist')
+    assert response.status_code == 404
+    assert response.get_json()['message'] == 'Analysis job doesnotexist not found'
+
+
+def _completion_for_prompt(**kwargs):
+    prompt = kwargs['messages'][1]['content']
+    completion = MagicMock()
+    completion.choices = [MagicMock(message=MagicMock(content=f"Stored {prompt.splitlines()[2]}"))]
+    return completion
+
+
+@patch('openai.OpenAI')
+def test_pregenerate_command_is_resumable(MockOpenAI, app, runner):
+    """Test that the CLI fills the store and skips entries that already exist."""
+    from manage import pregenerate_analyses_command
+    from app.models import PregeneratedAnalysis
+    mock_openai_instance = MockOpenAI.return_value
+    mock_openai_instance.chat.completions.create.side_effect = _completion_for_prompt
+
+    result = runner.invoke(pregenerate_analyses_command, ['--language', 'en', '--limit', '3'])
+    assert result.exit_code == 0, result.output
+    assert 'Generated 3 interpretations' in result.output
+
+    result = runner.invoke(pregenerate_analyses_command, ['--language', 'en', '--limit', '2'])
+    assert '3 entries already stored' in result.output
+
+    with app.app_context():
+        times = sorted(entry.time for entry in PregeneratedAnalysis.query.all())
+    # 00:00 is canonical (served from hours.json) and is skipped
+    assert times == ['00:01', '00:02', '00:03', '00:04', '00:05']
+    assert mock_openai_instance.chat.completions.create.call_count == 5
+
+
+@patch('openai.OpenAI')
+def test_analyze_serves_message_less_time_from_store(MockOpenAI, app, client):
+    """Test that stored entries answer message-less requests without OpenAI."""
+    from app.models import PregeneratedAnalysis
+    with app.app_context():
+        db.session.add(PregeneratedAnalysis(time='07:42', language='fr', analysis='Analyse stockée.'))
+        db.session.commit()
+
+    response = client.post('/api/analyze/', json={'time': '7:42', 'language': 'fr'})
+
+    assert response.get_json() == {'analysis': 'Analyse stockée.', 'source': 'store'}
+    MockOpenAI.assert_not_called()
+
+
+@pytest.fixture
+def fake_openai():
+    """A local OpenAI-compatible server (see loadtest/fake_openai.py)."""
+    from loadtest.fake_openai import FakeOpenAIConfig, FakeOpenAIServer
+    server = FakeOpenAIServer(config=FakeOpenAIConfig(latency_ms=0, tokens_per_second=0)).start()
+    yield server
+    server.stop()
+
+
+def _app_for(base_url, **config):
+    from app import create_app
+    return create_app(test_config={
+        'TESTING': True,
+        'SQLALCHEMY_DATABASE_URI': 'sqlite:///:memory:',
+        'OPENAI_BASE_URL': base_url,
+        **config,
+    })
+
+
+def test_analyze_against_fake_openai_server(fake_openai, monkeypatch):
+    """Test the real OpenAI client end to end against the bundled fake server."""
+    monkeypatch.setenv("OPENAI_API_KEY", "fake-key")
+    test_client = _app_for(fake_openai.base_url).test_client()
+
+    response = test_client.post('/api/analyze/', json={'time': '10:20', 'message': 'Load test'})
+    assert response.status_code == 200
+    assert response.get_json()['analysis'].startswith("The mirror hour")
+
+    body = test_client.post('/api/analyze/stream', json={'time': '10:21', 'message': 'Load test'}).get_data(as_text=True)
+    assert 'event: done' in body
+    assert fake_openai.stats['completions'] == 2
+
+
+def test_fake_openai_server_injects_rate_limits(fake_openai, monkeypatch):
+    """Test that injected 429s surface as a 503 from /api/analyze/."""
+    monkeypatch.setenv("OPENAI_API_KEY", "fake-key")
+    fake_openai.config.rate_limit_rate = 1.0
+    app = _app_for(fake_openai.base_url)
+    # No SDK retries by default, so the single injected 429 reaches the client
+    response = app.test_client().post('/api/analyze/', json={'time': '10:22', 'message': 'Throttled'})
+
+    assert response.status_code == 503
+    assert fake_openai.stats['rate_limited'] == 1
+
+
+def test_load_generator_nearest_rank_percentile():
+    """Test that the load generator reports nearest-rank percentiles."""
+    from loadtest.load_analyze import percentile
+    values = list(range(1, 101))
+    assert [percentile(values, fraction) for fraction in (0.5, 0.95, 0.99, 1.0)] == [50, 95, 99, 100]
+    assert percentile([7], 0.5) == 7
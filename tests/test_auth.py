@@ -104,6 +104,8 @@ def test_login_success(client, app):
     assert 'user' in data
     assert data['user']['username'] == 'loginuser'
     assert 'password' not in data['user']
+    assert data['expiresIn'] == app.config['SESSION_TOKEN_MAX_AGE']
+    assert app.extensions['session_tokens'].verify(data['token']) == data['user']['id']
 
 def test_login_incorrect_username(client):
     """Test login with an incorrect username."""
@@ -144,3 +146,145 @@ def test_login_missing_fields(client):
     assert response.status_code == 400
     data = response.get_json()
     assert data['message'] == 'Missing username or password'
+
+
+def test_login_upgrades_outdated_hash(client, app):
+    """Test that a successful login re-hashes a password stored with an older method."""
+    from app.services.passwords import PasswordHasher
+    app.extensions['password_hasher'] = PasswordHasher(method='pbkdf2:sha256', iterations=2000, workers=0)
+    with app.app_context():
+        user = User(username='olduser', email='old@example.com', password=generate_password_hash('secret', 'pbkdf2:sha256:1000'))
+        db.session.add(user)
+        db.session.commit()
+
+    assert client.post('/api/users/login', json={'username': 'olduser', 'password': 'wrong'}).status_code == 401
+    with app.app_context():
+        assert User.query.filter_by(username='olduser').first().password.startswith('pbkdf2:sha256:1000$')
+
+    assert client.post('/api/users/login', json={'username': 'olduser', 'password': 'secret'}).status_code == 200
+    with app.app_context():
+        assert User.query.filter_by(username='olduser').first().password.startswith('pbkdf2:sha256:2000$')
+    assert client.post('/api/users/login', json={'username': 'olduser', 'password': 'secret'}).status_code == 200
+    assert app.extensions['password_hasher'].stats()['rehashed'] == 1
+
+
+def test_password_hashing_runs_in_process_pool():
+    """Test hashing and verification through the worker processes."""
+    from app.services.passwords import PasswordHasher
+    hasher = PasswordHasher(method='pbkdf2', iterations=1000, workers=1)
+    try:
+        pwhash = hasher.hash('secret')
+        assert pwhash.startswith('pbkdf2:sha256:1000$')
+        assert hasher.verify(pwhash, 'secret') and not hasher.verify(pwhash, 'other')
+        assert not hasher.needs_rehash(pwhash)
+        assert hasher.stats()['verified'] == 2
+    finally:
+        hasher.shutdown()
+
+
+def test_password_hasher_replaces_broken_pool(client, app):
+    """Test that a killed worker process costs a pool restart, not every later login."""
+    import os
+    import signal
+    from unittest.mock import MagicMock, patch
+    from concurrent.futures.process import BrokenProcessPool
+    from app.services.passwords import PasswordHasher
+    hasher = PasswordHasher(method='pbkdf2', iterations=1000, workers=1)
+    app.extensions['password_hasher'] = hasher
+    try:
+        pwhash = hasher.hash('secret')
+        with app.app_context():
+            db.session.add(User(username='poolkill', email='poolkill@example.com', password=pwhash))
+            db.session.commit()
+        for pid in list(hasher._executor._processes):
+            os.kill(pid, signal.SIGKILL)
+
+        response = client.post('/api/users/login', json={'username': 'poolkill', 'password': 'secret'})
+        assert response.status_code == 200
+        assert hasher.stats()['restarts'] == 1
+
+        # A pool that keeps breaking is a 503, like a full queue
+        broken = MagicMock()
+        broken.submit.side_effect = BrokenProcessPool('dead')
+        with patch.object(PasswordHasher, '_get_executor', return_value=broken):
+            response = client.post('/api/users/login', json={'username': 'poolkill', 'password': 'secret'})
+        assert response.status_code == 503
+        assert response.headers['Retry-After'] == '1'
+    finally:
+        hasher.shutdown()
+
+
+def test_login_rejected_when_hash_queue_full(client, app):
+    """Test that login answers 503 instead of queueing behind a burst of hashes."""
+    from app.services.passwords import PasswordHasher
+    hasher = PasswordHasher(workers=1, max_pending=1, queue_timeout=0)
+    app.extensions['password_hasher'] = hasher
+    with app.app_context():
+        db.session.add(User(username='busyuser', email='busy@example.com', password=generate_password_hash('secret')))
+        db.session.commit()
+
+    hasher._slots.acquire() # a hash already in progress
+    response = client.post('/api/users/login', json={'username': 'busyuser', 'password': 'secret'})
+    assert response.status_code == 503
+    assert response.headers['Retry-After'] == '1'
+    assert hasher.stats()['rejected'] == 1
+
+
+def test_normalize_hash_method():
+    """Test the method strings that stored hashes are compared against."""
+    import pytest
+    from app.services.passwords import normalize_method
+    assert normalize_method('pbkdf2:sha256', 600000) == 'pbkdf2:sha256:600000'
+    assert normalize_method('pbkdf2:sha512:1000', 5) == 'pbkdf2:sha512:1000'
+    assert normalize_method('scrypt') == 'scrypt:32768:8:1'
+    assert normalize_method('scrypt', 16384) == 'scrypt:16384:8:1'
+    with pytest.raises(ValueError):
+        normalize_method('md5')
+
+
+def test_login_throttled_before_password_check(client, app):
+    """Test that attempts over the per-username budget get 429 without a lookup or hash."""
+    from unittest.mock import patch
+    from app.services.throttle import TokenBucketLimiter
+    app.extensions['login_throttle']['username'] = TokenBucketLimiter(rate=1 / 60, burst=2)
+    hasher = app.extensions['password_hasher']
+
+    for _ in range(2):
+        assert client.post('/api/users/login', json={'username': 'Victim', 'password': 'guess'}).status_code == 401
+
+    with patch.object(hasher, 'verify') as verify:
+        response = client.post('/api/users/login', json={'username': ' victim', 'password': 'guess'})
+    assert response.status_code == 429
+    assert 1 <= int(response.headers['Retry-After']) <= 60
+    verify.assert_not_called()
+    # Other usernames are unaffected
+    assert client.post('/api/users/login', json={'username': 'someoneelse', 'password': 'guess'}).status_code == 401
+    assert 'login_throttled_total{scope="username"} 1' in client.get('/metrics').get_data(as_text=True)
+
+
+def test_login_throttled_per_ip(client, app):
+    """Test the per-IP bucket across different usernames."""
+    from app.services.throttle import TokenBucketLimiter
+    app.extensions['login_throttle']['ip'] = TokenBucketLimiter(rate=1, burst=3)
+    for i in range(3):
+        assert client.post('/api/users/login', json={'username': f'user{i}', 'password': 'x'}).status_code == 401
+    assert client.post('/api/users/login', json={'username': 'user9', 'password': 'x'}).status_code == 429
+    other_ip = client.post('/api/users/login', json={'username': 'user9', 'password': 'x'},
+                           environ_base={'REMOTE_ADDR': '10.0.0.2'})
+    assert other_ip.status_code == 401
+
+
+def test_token_bucket_refill_and_eviction(monkeypatch):
+    """Test token refill over time and the bounded key map."""
+    from app.services import throttle
+    now = [100.0]
+    monkeypatch.setattr(throttle.time, 'monotonic', lambda: now[0])
+    limiter = throttle.TokenBucketLimiter(rate=0.5, burst=2, maxsize=2)
+    assert limiter.acquire('a') == 0 and limiter.acquire('a') == 0
+    assert limiter.acquire('a') == 2.0 # one token takes 2 seconds
+    now[0] += 2
+    assert limiter.acquire('a') == 0
+    limiter.acquire('b')
+    limiter.acquire('c') # evicts 'a'
+    assert limiter.stats()['keys'] == 2 and limiter.stats()['evictions'] == 1
+    assert limiter.acquire('a') == 0 # forgotten, so a fresh bucket
@@ -1,4 +1,6 @@
 import json
+import pytest
+import time
 from app.models import User, HistoryItem
 from app import db
 from werkzeug.security import generate_password_hash # For creating test users
@@ -138,3 +140,812 @@ def test_delete_history_item_non_existent(client):
     assert response.status_code == 404
     data = response.get_json()
     assert data['message'] == 'History item with ID 9999 not found'
+
+
+# Helper returning only the new user's id, so it can be used after the app context closes
+def create_test_user_id(app, username='pageuser', email='page@example.com'):
+    with app.app_context():
+        user = User(username=username, email=email, password=generate_password_hash('password'))
+        db.session.add(user)
+        db.session.commit()
+        return user.id
+
+
+def add_history_items(app, user_id, count, saved_at=None):
+    """Insert `count` items; with `saved_at`, all share that timestamp (ties are broken by id)."""
+    from datetime import timedelta
+    base = datetime(2025, 1, 1, 12, 0, 0)
+    with app.app_context():
+        items = [HistoryItem(user_id=user_id, time=f"{i % 24:02d}:{i % 24:02d}", type="Mirror Hour",
+                             thoughts=f"thought {i}", saved_at=saved_at or base + timedelta(minutes=i))
+                 for i in range(count)]
+        db.session.add_all(items)
+        db.session.commit()
+        return [item.id for item in items]
+
+
+def test_get_history_paginated(client, app):
+    """Test walking a user's history page by page with next_cursor."""
+    user_id = create_test_user_id(app)
+    ids = add_history_items(app, user_id, 5)
+
+    response = client.get(f'/api/history/{user_id}?limit=2')
+    assert response.status_code == 200
+    page = response.get_json()
+    assert [item['id'] for item in page['items']] == [ids[4], ids[3]]
+
+    seen = [item['id'] for item in page['items']]
+    while page['next_cursor']:
+        page = client.get(f"/api/history/{user_id}?limit=2&after={page['next_cursor']}").get_json()
+        seen.extend(item['id'] for item in page['items'])
+    assert seen == list(reversed(ids))
+
+
+def test_get_history_paginated_ties_on_saved_at(client, app):
+    """Test that items sharing a saved_at are neither skipped nor repeated."""
+    user_id = create_test_user_id(app)
+    ids = add_history_items(app, user_id, 4, saved_at=datetime(2025, 5, 1, 8, 0, 0))
+
+    first = client.get(f'/api/history/{user_id}?limit=3').get_json()
+    second = client.get(f"/api/history/{user_id}?limit=3&after={first['next_cursor']}").get_json()
+
+    assert [item['id'] for item in first['items'] + second['items']] == sorted(ids, reverse=True)
+    assert second['next_cursor'] is None
+
+
+def test_get_history_pagination_validation(client, app):
+    """Test bad limit and cursor values."""
+    user_id = create_test_user_id(app)
+    assert client.get(f'/api/history/{user_id}?limit=abc').status_code == 400
+    assert client.get(f'/api/history/{user_id}?limit=0').status_code == 400
+    response = client.get(f'/api/history/{user_id}?after=not-a-cursor')
+    assert response.status_code == 400
+    assert response.get_json()['message'].startswith('Invalid cursor')
+
+
+def test_get_history_unpaginated_compat(client, app):
+    """Test that callers without paging parameters still get the full list, unless compat is off."""
+    user_id = create_test_user_id(app)
+    add_history_items(app, user_id, 3)
+
+    assert len(client.get(f'/api/history/{user_id}').get_json()) == 3
+
+    app.config['HISTORY_UNPAGINATED_COMPAT'] = False
+    app.config['HISTORY_PAGE_DEFAULT_LIMIT'] = 2
+    data = client.get(f'/api/history/{user_id}').get_json()
+    assert len(data['items']) == 2
+    assert data['next_cursor'] is not None
+
+
+def test_migrate_schema_adds_missing_index(app, runner):
+    """Test that migrate-schema creates the history index on an existing table, keeping its rows."""
+    from sqlalchemy import inspect, text
+    from manage import migrate_schema_command
+    user_id = create_test_user_id(app)
+    add_history_items(app, user_id, 2)
+    with app.app_context():
+        db.session.execute(text('DROP INDEX ix_history_items_user_saved_at_id'))
+        db.session.commit()
+
+    result = runner.invoke(migrate_schema_command, ['--dry-run'])
+    assert 'Pending: create index ix_history_items_user_saved_at_id on history_items' in result.output
+
+    result = runner.invoke(migrate_schema_command)
+    assert result.exit_code == 0, result.output
+    assert 'Applied: create index ix_history_items_user_saved_at_id on history_items' in result.output
+
+    with app.app_context():
+        indexes = {index['name']: index['column_names'] for index in inspect(db.engine).get_indexes('history_items')}
+        assert indexes['ix_history_items_user_saved_at_id'] == ['user_id', 'saved_at', 'id']
+        assert HistoryItem.query.count() == 2
+
+    result = runner.invoke(migrate_schema_command)
+    assert 'Database schema is up to date.' in result.output
+
+
+def test_create_history_items_batch(client, app):
+    """Test creating several items in one request and one INSERT."""
+    user_id = create_test_user_id(app)
+    statements = []
+
+    from sqlalchemy import event
+    with app.app_context():
+        engine = db.engine
+    listener = lambda conn, cursor, statement, *args: statements.append(statement)
+    event.listen(engine, 'before_cursor_execute', listener)
+    try:
+        response = client.post('/api/history/batch', json={'userId': user_id, 'items': [
+            {'time': '11:11', 'type': 'Mirror Hour', 'thoughts': 'first', 'details': {'a': 1}},
+            {'time': '12:21', 'type': 'Reversed Hour'},
+            {'time': '22:22', 'type': 'Mirror Hour', 'thoughts': 'third'},
+        ]})
+    finally:
+        event.remove(engine, 'before_cursor_execute', listener)
+
+    assert response.status_code == 201
+    items = response.get_json()['items']
+    assert [item['time'] for item in items] == ['11:11', '12:21', '22:22']
+    assert json.loads(items[0]['details']) == {'a': 1}
+    assert len({item['id'] for item in items}) == 3
+    assert sum(1 for statement in statements if statement.lstrip().startswith('INSERT INTO history_items ')) == 1
+
+    with app.app_context():
+        stored = {item.id: item.thoughts for item in HistoryItem.query.filter_by(user_id=user_id)}
+    assert stored == {items[0]['id']: 'first', items[1]['id']: None, items[2]['id']: 'third'}
+
+
+def test_create_history_items_batch_validation(client, app):
+    """Test that an invalid item or unknown user rejects the whole batch."""
+    user_id = create_test_user_id(app)
+
+    response = client.post('/api/history/batch', json={'userId': user_id, 'items': [
+        {'time': '11:11', 'type': 'Mirror Hour'},
+        {'time': '12:12'},
+    ]})
+    assert response.status_code == 400
+    assert response.get_json()['invalidIndexes'] == [1]
+
+    response = client.post('/api/history/batch', json={'userId': 997, 'items': [{'time': '11:11', 'type': 'Mirror Hour'}]})
+    assert response.status_code == 404
+
+    with app.app_context():
+        assert HistoryItem.query.count() == 0
+
+
+def test_delete_history_items_batch(client, app):
+    """Test deleting several items at once, ignoring other users' ids."""
+    user_id = create_test_user_id(app)
+    other_id = create_test_user_id(app, username='otheruser', email='other@example.com')
+    ids = add_history_items(app, user_id, 3)
+    other_ids = add_history_items(app, other_id, 1)
+
+    response = client.delete('/api/history/batch', json={'userId': user_id, 'ids': ids[:2] + other_ids + [99999]})
+
+    assert response.status_code == 200
+    assert response.get_json()['deleted'] == 2
+    with app.app_context():
+        remaining = sorted(item_id for (item_id,) in db.session.query(HistoryItem.id))
+    assert remaining == sorted([ids[2]] + other_ids)
+
+    response = client.delete('/api/history/batch', json={'userId': user_id, 'ids': ['x']})
+    assert response.status_code == 400
+    response = client.delete('/api/history/batch', json={'userId': user_id, 'ids': [True]})
+    assert response.status_code == 400
+
+
+def test_history_deletes_lock_users_row_first(client, app):
+    """Test that deletes update users before history_items and history_stats, like creates."""
+    user_id = create_test_user_id(app)
+    ids = add_history_items(app, user_id, 3)
+    statements = []
+    from sqlalchemy import event
+    with app.app_context():
+        engine = db.engine
+    listener = lambda conn, cursor, statement, *args: statements.append(' '.join(statement.split()))
+    event.listen(engine, 'before_cursor_execute', listener)
+    try:
+        assert client.delete(f'/api/history/{ids[0]}').status_code == 204
+        assert client.delete('/api/history/batch', json={'userId': user_id, 'ids': ids[1:]}).status_code == 200
+    finally:
+        event.remove(engine, 'before_cursor_execute', listener)
+
+    writes = [statement.split(' (')[0].split(' SET')[0].split(' WHERE')[0] for statement in statements
+              if statement.startswith(('UPDATE', 'DELETE', 'INSERT'))]
+    for first in (0, writes.index('UPDATE users', 1)):
+        assert writes[first] == 'UPDATE users'
+        assert writes[first + 1].startswith('DELETE FROM history_items')
+
+    etag = client.get(f'/api/history/{user_id}').headers['ETag']
+    assert client.delete('/api/history/batch', json={'userId': user_id, 'ids': [99999]}).status_code == 200
+    assert client.get(f'/api/history/{user_id}').headers['ETag'] == etag
+
+
+def test_export_history_ndjson(client, app):
+    """Test streaming a user's history as NDJSON with a column projection."""
+    user_id = create_test_user_id(app)
+    ids = add_history_items(app, user_id, 5)
+    app.config['HISTORY_EXPORT_BATCH_SIZE'] = 2 # several partitions
+
+    response = client.get(f'/api/history/{user_id}/export?fields=id,time,saved_at')
+
+    assert response.status_code == 200
+    assert response.mimetype == 'application/x-ndjson'
+    lines = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+    assert [line['id'] for line in lines] == list(reversed(ids))
+    assert set(lines[0]) == {'id', 'time', 'saved_at'}
+    assert lines[0]['saved_at'] == '2025-01-01T12:04:00'
+
+
+def test_export_history_pages_by_keyset(client, app):
+    """Test that exports read bounded keyset pages, also across saved_at ties."""
+    user_id = create_test_user_id(app)
+    ids = add_history_items(app, user_id, 5, saved_at=datetime(2025, 1, 1, 12, 0, 0))
+    app.config['HISTORY_EXPORT_BATCH_SIZE'] = 2
+
+    statements = []
+    from sqlalchemy import event
+    with app.app_context():
+        engine = db.engine
+    listener = lambda conn, cursor, statement, parameters, *args: statements.append((statement, parameters))
+    event.listen(engine, 'before_cursor_execute', listener)
+    try:
+        response = client.get(f'/api/history/{user_id}/export?fields=id')
+        body = response.get_data(as_text=True)
+    finally:
+        event.remove(engine, 'before_cursor_execute', listener)
+
+    assert [json.loads(line)['id'] for line in body.splitlines()] == list(reversed(ids))
+    pages = [parameters for statement, parameters in statements if 'FROM history_items' in statement]
+    # Three pages of at most two rows each, every one a LIMIT query
+    assert len(pages) == 3 and all(2 in tuple(parameters) for parameters in pages)
+
+
+def test_export_history_json_array(client, app):
+    """Test the chunked JSON array format, including the empty case."""
+    user_id = create_test_user_id(app)
+    app.config['HISTORY_EXPORT_BATCH_SIZE'] = 2
+    assert client.get(f'/api/history/{user_id}/export?format=json').get_json() == []
+
+    add_history_items(app, user_id, 3)
+    data = client.get(f'/api/history/{user_id}/export?format=json').get_json()
+    assert [item['thoughts'] for item in data] == ['thought 2', 'thought 1', 'thought 0']
+    assert data[0]['userId'] == user_id
+
+
+def test_export_history_validation(client, app):
+    """Test export errors: unknown user, format and field."""
+    user_id = create_test_user_id(app)
+    assert client.get('/api/history/996/export').status_code == 404
+    assert client.get(f'/api/history/{user_id}/export?format=xml').status_code == 400
+    response = client.get(f'/api/history/{user_id}/export?fields=id,password')
+    assert response.status_code == 400
+    assert response.get_json()['message'] == 'Unknown fields: password'
+
+
+def test_get_history_conditional(client, app):
+    """Test ETag / If-None-Match on the history list, and that writes change the ETag."""
+    user_id = create_test_user_id(app)
+    created = client.post('/api/history/', json={'userId': user_id, 'time': '11:11', 'type': 'Mirror Hour'})
+    item_id = created.get_json()['item']['id']
+
+    response = client.get(f'/api/history/{user_id}')
+    etag = response.headers['ETag']
+    assert response.status_code == 200
+    assert response.headers['Cache-Control'] == 'private, no-cache'
+
+    statements = []
+    from sqlalchemy import event
+    with app.app_context():
+        engine = db.engine
+    listener = lambda conn, cursor, statement, *args: statements.append(statement)
+    event.listen(engine, 'before_cursor_execute', listener)
+    try:
+        response = client.get(f'/api/history/{user_id}', headers={'If-None-Match': etag})
+    finally:
+        event.remove(engine, 'before_cursor_execute', listener)
+    assert response.status_code == 304
+    assert response.headers['ETag'] == etag
+    assert response.get_data() == b''
+    assert len(statements) == 1 and 'history_items' not in statements[0]
+
+    # Paging arguments are a different representation
+    assert client.get(f'/api/history/{user_id}?limit=1').headers['ETag'] != etag
+
+    client.post('/api/history/', json={'userId': user_id, 'time': '12:12', 'type': 'Mirror Hour'})
+    response = client.get(f'/api/history/{user_id}', headers={'If-None-Match': etag})
+    assert response.status_code == 200
+    assert len(response.get_json()) == 2
+    etag = response.headers['ETag']
+
+    client.delete(f'/api/history/{item_id}')
+    response = client.get(f'/api/history/{user_id}', headers={'If-None-Match': etag})
+    assert response.status_code == 200
+    etag = response.headers['ETag']
+
+    client.post('/api/history/batch', json={'userId': user_id, 'items': [{'time': '13:13', 'type': 'Mirror Hour'}]})
+    assert client.get(f'/api/history/{user_id}', headers={'If-None-Match': etag}).status_code == 200
+
+
+def test_migrate_schema_adds_history_version(app, runner):
+    """Test that migrate-schema adds users.history_version to an existing table with a 0 default."""
+    from sqlalchemy import inspect, text
+    from manage import migrate_schema_command
+    user_id = create_test_user_id(app)
+    with app.app_context():
+        db.session.execute(text('ALTER TABLE users DROP COLUMN history_version'))
+        db.session.commit()
+
+    result = runner.invoke(migrate_schema_command)
+    assert result.exit_code == 0, result.output
+    assert 'Applied: add column users.history_version' in result.output
+
+    with app.app_context():
+        assert 'history_version' in {column['name'] for column in inspect(db.engine).get_columns('users')}
+        assert db.session.query(User.history_version).filter_by(id=user_id).scalar() == 0
+
+
+def test_get_history_served_from_cache(client, app):
+    """Test that a repeat read is served from the history cache and writes invalidate it."""
+    user_id = create_test_user_id(app)
+    client.post('/api/history/', json={'userId': user_id, 'time': '11:11', 'type': 'Mirror Hour'})
+    cache = app.extensions['history_cache']
+
+    first = client.get(f'/api/history/{user_id}')
+    statements = []
+    from sqlalchemy import event
+    with app.app_context():
+        engine = db.engine
+    listener = lambda conn, cursor, statement, *args: statements.append(statement)
+    event.listen(engine, 'before_cursor_execute', listener)
+    try:
+        second = client.get(f'/api/history/{user_id}')
+    finally:
+        event.remove(engine, 'before_cursor_execute', listener)
+    assert second.get_data() == first.get_data()
+    assert second.headers['ETag'] == first.headers['ETag']
+    assert len(statements) == 1 and 'history_items' not in statements[0]
+    assert cache.stats()['hits'] == 1
+
+    client.post('/api/history/', json={'userId': user_id, 'time': '12:12', 'type': 'Mirror Hour'})
+    assert cache.stats()['invalidations'] == 1
+    assert len(client.get(f'/api/history/{user_id}').get_json()) == 2
+
+    stats = cache.stats()
+    assert stats['users'] == 1 and stats['bytes'] > 0
+    assert stats['hit_ratio'] == 1 / 3
+
+
+def test_history_cache_bounds_and_versions():
+    """Test version mismatch misses and LRU eviction on the byte bound."""
+    from app.services.history_cache import HistoryCache
+    cache = HistoryCache(maxsize=10, max_bytes=10)
+    cache.set(1, 0, 'all', b'aaaa')
+    cache.set(1, 0, '1:', b'bb')
+    assert cache.get(1, 0) == b'aaaa'
+    assert cache.get(1, 1) is None # the user's history changed elsewhere
+    cache.set(2, 0, 'all', b'cccc')
+    assert cache.stats()['bytes'] == 10
+    cache.get(1, 0)
+    cache.set(3, 0, 'all', b'dd') # over the byte bound: evicts user 2, the least recently used
+    assert cache.get(2, 0) is None
+    assert cache.get(1, 0, '1:') == b'bb'
+    assert cache.stats()['evictions'] == 1
+    cache.set(4, 0, 'all', b'x' * 11) # larger than the whole cache: not stored
+    assert cache.get(4, 0) is None and cache.stats()['bytes'] == 8
+
+
+def test_history_details_as_json(client, app):
+    """Test returning stored JSON details as embedded objects rather than strings."""
+    user_id = create_test_user_id(app)
+    client.post('/api/history/', json={'userId': user_id, 'time': '11:11', 'type': 'Mirror Hour',
+                                       'details': {'note': 'été', 'tags': [1, 2]}})
+    client.post('/api/history/', json={'userId': user_id, 'time': '12:12', 'type': 'Mirror Hour',
+                                       'details': '[not json'})
+
+    items = client.get(f'/api/history/{user_id}').get_json()
+    assert json.loads(items[1]['details']) == {'note': 'été', 'tags': [1, 2]}
+
+    app.config['HISTORY_DETAILS_AS_JSON'] = True
+    app.extensions['history_cache'].clear()
+    items = client.get(f'/api/history/{user_id}').get_json()
+    assert items[1]['details'] == {'note': 'été', 'tags': [1, 2]}
+    assert items[0]['details'] == '[not json' # plain text stays a string
+
+
+def test_history_details_embedded_as_fragments(client, app, monkeypatch):
+    """Test that details are handed to orjson as Fragments when it has them, and still render."""
+    import types
+    from app.services import json_provider
+
+    class Fragment:
+        def __init__(self, contents):
+            self.contents = contents
+
+    real = json_provider.orjson
+    monkeypatch.setattr(json_provider, 'orjson', types.SimpleNamespace(
+        Fragment=Fragment, dumps=real.dumps, loads=real.loads, OPT_APPEND_NEWLINE=real.OPT_APPEND_NEWLINE))
+    app.config['HISTORY_DETAILS_AS_JSON'] = True
+    with app.test_request_context():
+        assert isinstance(json_provider.raw_json('{"a": [1]}'), Fragment)
+        assert json_provider.raw_json('[not json') is None
+        app.json.use_orjson = False
+        assert json_provider.raw_json('{"a": [1]}') == {'a': [1]}
+        app.json.use_orjson = True
+
+    user_id = create_test_user_id(app)
+    client.post('/api/history/', json={'userId': user_id, 'time': '11:11', 'type': 'Mirror Hour',
+                                       'details': {'note': 'été'}})
+    assert client.get(f'/api/history/{user_id}').get_json()[0]['details'] == {'note': 'été'}
+
+
+def test_json_provider_datetimes_and_fallback(app, monkeypatch):
+    """Test that datetimes serialize as ISO 8601 with orjson and with the stdlib fallback."""
+    from app.services import json_provider
+    value = {'saved_at': datetime(2025, 1, 1, 12, 0, 0, 5), 'day': datetime(2025, 1, 1).date(), 'n': [1, None]}
+    expected = {'saved_at': '2025-01-01T12:00:00.000005', 'day': '2025-01-01', 'n': [1, None]}
+
+    with app.app_context():
+        assert isinstance(app.json, json_provider.FastJSONProvider)
+        assert json.loads(app.json.dumps(value)) == expected
+        monkeypatch.setattr(json_provider, 'orjson', None)
+        assert json.loads(app.json.dumps(value)) == expected
+        assert json.loads(app.json.response(value).get_data()) == expected
+        assert app.json.loads('{"a": 1}') == {'a': 1}
+
+
+def test_history_wire_format_without_fast_provider(client, app):
+    """Test that turning orjson off changes neither response dates nor stored details."""
+    app.json.use_orjson = False
+    user_id = create_test_user_id(app)
+    created = client.post('/api/history/', json={'userId': user_id, 'time': '11:11', 'type': 'Mirror Hour',
+                                                 'details': {'a': 1, 'b': ['é']}})
+    assert created.status_code == 201
+    saved_at = created.get_json()['item']['saved_at']
+    assert datetime.fromisoformat(saved_at)
+    assert client.get(f'/api/history/{user_id}').get_json()[0]['saved_at'] == saved_at
+
+    with app.app_context():
+        assert HistoryItem.query.one().details == '{"a": 1, "b": ["é"]}'
+
+
+def test_archive_history_moves_old_items(client, app, runner):
+    """Test archive-history: old items move to compressed archive rows and stay readable."""
+    from manage import archive_history_command
+    from app.models import HistoryArchive
+    user_id = create_test_user_id(app)
+    old_ids = add_history_items(app, user_id, 5) # saved in January 2025
+    recent = client.post('/api/history/', json={'userId': user_id, 'time': '11:11', 'type': 'Mirror Hour',
+                                                'details': {'a': 1}}).get_json()['item']
+    etag = client.get(f'/api/history/{user_id}').headers['ETag']
+
+    result = runner.invoke(archive_history_command, ['--older-than-days', '30', '--dry-run'])
+    assert '5 history items from 1 users' in result.output
+    with app.app_context():
+        assert HistoryItem.query.count() == 6
+
+    result = runner.invoke(archive_history_command, ['--older-than-days', '30', '--batch-size', '2'])
+    assert result.exit_code == 0, result.output
+    assert 'Archived 5 history items into 3 archive rows.' in result.output
+
+    response = client.get(f'/api/history/{user_id}', headers={'If-None-Match': etag})
+    assert response.status_code == 200
+    assert [item['id'] for item in response.get_json()] == [recent['id']]
+
+    archives = client.get(f'/api/history/{user_id}/archives').get_json()['archives']
+    assert [archive['item_count'] for archive in archives] == [1, 2, 2]
+    assert archives[-1]['oldest_saved_at'] == '2025-01-01T12:00:00'
+
+    archived = []
+    for archive in archives:
+        response = client.get(f"/api/history/{user_id}/archives/{archive['id']}")
+        assert response.status_code == 200
+        archived += response.get_json()['items']
+    assert [item['id'] for item in archived] == list(reversed(old_ids))
+    assert archived[0]['thoughts'] == 'thought 4' and archived[0]['saved_at'] == '2025-01-01T12:04:00'
+    assert archived[0]['userId'] == user_id
+
+    with app.app_context():
+        assert HistoryArchive.query.count() == 3
+    result = runner.invoke(archive_history_command, ['--older-than-days', '30'])
+    assert 'Archived 0 history items into 0 archive rows.' in result.output
+
+
+def test_archive_payload_independent_of_json_provider():
+    """Test that archive payloads store ISO 8601 dates without an app or its JSON provider."""
+    from app.services.retention import compress_items, decompress_items
+    rows = [{'id': 1, 'time': '11:11', 'details': '{"a": "é"}', 'saved_at': datetime(2025, 1, 1, 12, 0, 0, 5)}]
+    assert decompress_items(compress_items(rows)) == [dict(rows[0], saved_at='2025-01-01T12:00:00.000005')]
+
+
+def test_history_archive_not_found(client, app):
+    """Test archive reads for unknown users and other users' archives."""
+    user_id = create_test_user_id(app)
+    assert client.get('/api/history/995/archives').status_code == 404
+    assert client.get(f'/api/history/{user_id}/archives').get_json() == {'archives': []}
+    assert client.get(f'/api/history/{user_id}/archives/1').status_code == 404
+
+
+def test_search_history_ranked_and_paginated(client, app):
+    """Test full-text search: matching, ranking, paging and other users' items."""
+    user_id = create_test_user_id(app)
+    other_id = create_test_user_id(app, 'otheruser', 'other@example.com')
+    post = lambda uid, thoughts, details=None: client.post('/api/history/', json={
+        'userId': uid, 'time': '11:11', 'type': 'Mirror Hour', 'thoughts': thoughts, 'details': details}).get_json()['item']['id']
+    career = post(user_id, 'Thinking about my career and a new job')
+    career_twice = post(user_id, 'Career, career, career: should I change career?')
+    post(user_id, 'Dinner with my family', {'mood': 'calm'})
+    in_details = post(user_id, 'Saw it again', {'note': 'Une nouvelle carrière, vraiment'})
+    post(other_id, 'My career too')
+
+    data = client.get(f'/api/history/{user_id}/search?q=career').get_json()
+    assert [item['id'] for item in data['items']] == [career_twice, career]
+    assert data['next_offset'] is None
+
+    # All words must match; accents are folded and operators are plain words
+    assert [item['id'] for item in client.get(f'/api/history/{user_id}/search?q=new+job').get_json()['items']] == [career]
+    assert [item['id'] for item in client.get(f'/api/history/{user_id}/search?q=carriere').get_json()['items']] == [in_details]
+    assert client.get(f'/api/history/{user_id}/search?q=career+-job+OR').get_json()['items'] == []
+
+    page = client.get(f'/api/history/{user_id}/search?q=career&limit=1').get_json()
+    assert [item['id'] for item in page['items']] == [career_twice] and page['next_offset'] == 1
+    page = client.get(f'/api/history/{user_id}/search?q=career&limit=1&offset=1').get_json()
+    assert [item['id'] for item in page['items']] == [career] and page['next_offset'] is None
+
+    # Deletes (single and batch) leave the index
+    client.delete(f'/api/history/{career}')
+    client.delete('/api/history/batch', json={'userId': user_id, 'ids': [career_twice]})
+    assert client.get(f'/api/history/{user_id}/search?q=career').get_json()['items'] == []
+
+
+def test_search_history_validation(client, app):
+    """Test search errors: missing query, bad paging and unknown user."""
+    user_id = create_test_user_id(app)
+    assert client.get(f'/api/history/{user_id}/search').status_code == 400
+    assert client.get(f'/api/history/{user_id}/search?q=%3F%21').status_code == 400
+    assert client.get(f'/api/history/{user_id}/search?q=a&offset=-1').status_code == 400
+    assert client.get(f'/api/history/{user_id}/search?q=a&limit=0').status_code == 400
+    assert client.get('/api/history/994/search?q=a').status_code == 404
+
+
+def test_migrate_schema_adds_fulltext_table(app, runner):
+    """Test that migrate-schema builds the FTS5 table, and indexes existing rows."""
+    from sqlalchemy import text
+    from manage import migrate_schema_command
+    user_id = create_test_user_id(app)
+    add_history_items(app, user_id, 3)
+    with app.app_context():
+        db.session.execute(text('DROP TABLE history_items_fts'))
+        for suffix in ('ai', 'ad', 'au'):
+            db.session.execute(text(f'DROP TRIGGER history_items_fts_{suffix}'))
+        db.session.commit()
+
+    result = runner.invoke(migrate_schema_command)
+    assert 'Applied: create full-text table history_items_fts' in result.output
+
+    with app.test_client() as client:
+        data = client.get(f'/api/history/{user_id}/search?q=thought').get_json()
+        assert len(data['items']) == 3
+
+
+def test_history_stats_follow_writes(client, app):
+    """Test that the stats rollups track single and batch creates and deletes."""
+    user_id = create_test_user_id(app)
+    post = lambda time_str, item_type: client.post('/api/history/', json={
+        'userId': user_id, 'time': time_str, 'type': item_type}).get_json()['item']
+    first = post('11:11', 'Mirror Hour')
+    post('11:11', 'Mirror Hour')
+    post('12:21', 'Reversed Hour')
+    batch = client.post('/api/history/batch', json={'userId': user_id, 'items': [
+        {'time': '22:22', 'type': 'Mirror Hour'}, {'time': '12:21', 'type': 'Reversed Hour'}]}).get_json()['items']
+
+    response = client.get(f'/api/history/{user_id}/stats')
+    stats = response.get_json()
+    today = first['saved_at'][:10]
+    year, week, _ = datetime.fromisoformat(today).isocalendar()
+    assert stats == {
+        'total': 5,
+        'by_time': {'11:11': 2, '12:21': 2, '22:22': 1},
+        'by_type': {'Mirror Hour': 3, 'Reversed Hour': 2},
+        'by_day': {today: 5},
+        'by_week': {f'{year}-W{week:02d}': 5},
+    }
+    assert client.get(f'/api/history/{user_id}/stats',
+                      headers={'If-None-Match': response.headers['ETag']}).status_code == 304
+
+    client.delete(f"/api/history/{first['id']}")
+    client.delete('/api/history/batch', json={'userId': user_id, 'ids': [item['id'] for item in batch] + [9999]})
+    stats = client.get(f'/api/history/{user_id}/stats').get_json()
+    assert stats['total'] == 2
+    assert stats['by_time'] == {'11:11': 1, '12:21': 1} # emptied buckets are dropped
+    assert stats['by_type'] == {'Mirror Hour': 1, 'Reversed Hour': 1}
+    assert client.get('/api/history/993/stats').status_code == 404
+
+
+def test_history_stats_accept_numeric_fields(client, app):
+    """Test that numeric time/type values are still accepted and counted as text."""
+    user_id = create_test_user_id(app)
+    assert client.post('/api/history/', json={'userId': user_id, 'time': 1111, 'type': 'Mirror Hour'}).status_code == 201
+    response = client.post('/api/history/batch', json={'userId': user_id, 'items': [{'time': 1111, 'type': 2}]})
+    assert response.status_code == 201
+    stats = client.get(f'/api/history/{user_id}/stats').get_json()
+    assert stats['by_time'] == {'1111': 2}
+    assert stats['by_type'] == {'Mirror Hour': 1, '2': 1}
+
+
+def test_backfill_history_stats(client, app, runner):
+    """Test rebuilding the rollups for rows written directly, including archived ones."""
+    from manage import archive_history_command, backfill_history_stats_command
+    user_id = create_test_user_id(app)
+    add_history_items(app, user_id, 3) # bypasses the API, so no rollups yet
+    add_history_items(app, user_id, 2, saved_at=datetime(2025, 1, 8, 9, 0, 0))
+    runner.invoke(archive_history_command, ['--older-than-days', '30', '--batch-size', '2'])
+    assert client.get(f'/api/history/{user_id}/stats').get_json()['total'] == 0
+
+    result = runner.invoke(backfill_history_stats_command)
+    assert result.exit_code == 0, result.output
+    assert 'Rebuilt history statistics for 1 users (5 items).' in result.output
+
+    stats = client.get(f'/api/history/{user_id}/stats').get_json()
+    assert stats['total'] == 5
+    assert stats['by_time'] == {'00:00': 2, '01:01': 2, '02:02': 1}
+    assert stats['by_day'] == {'2025-01-01': 3, '2025-01-08': 2}
+    assert stats['by_week'] == {'2025-W01': 3, '2025-W02': 2}
+
+    # Idempotent
+    runner.invoke(backfill_history_stats_command, ['--user-id', str(user_id)])
+    assert client.get(f'/api/history/{user_id}/stats').get_json() == stats
+
+
+def _write_behind_app(tmp_path, **config):
+    # A database file rather than :memory:, whose single shared connection would let the
+    # request thread's session teardown roll back the flusher thread's transaction
+    from app import create_app
+    app = create_app(test_config={'TESTING': True, 'SQLALCHEMY_DATABASE_URI': f"sqlite:///{tmp_path / 'history.db'}",
+                                  'HISTORY_WRITE_BEHIND': True, **config})
+    with app.app_context():
+        db.create_all()
+    return app
+
+
+def test_create_history_item_write_behind(tmp_path):
+    """Test that buffered creates answer 202 and appear after a batched flush."""
+    app = _write_behind_app(tmp_path, HISTORY_WRITE_BEHIND_INTERVAL=60) # flushed explicitly below
+    client = app.test_client()
+    user_id = create_test_user_id(app)
+    buffer = app.extensions['history_write_buffer']
+
+    response = client.post('/api/history/', json={'userId': user_id, 'time': '11:11', 'type': 'Mirror Hour',
+                                                  'details': {'a': 1}})
+    assert response.status_code == 202
+    item = response.get_json()['item']
+    assert item['id'] is None and item['provisionalId'].startswith('pending-')
+    client.post('/api/history/', json={'userId': user_id, 'time': '12:12', 'type': 'Mirror Hour'})
+    assert client.get(f'/api/history/{user_id}').get_json() == []
+    assert buffer.stats()['depth'] == 2
+
+    assert buffer.flush() == 2
+    items = client.get(f'/api/history/{user_id}').get_json()
+    assert [item['time'] for item in items] == ['12:12', '11:11']
+    assert client.get(f'/api/history/{user_id}/stats').get_json()['total'] == 2
+    stats = buffer.stats()
+    assert stats['depth'] == 0 and stats['written'] == 2 and stats['flushes'] == 1
+    assert 'history_write_buffer_depth 0' in client.get('/metrics').get_data(as_text=True)
+
+    assert client.post('/api/history/', json={'userId': 992, 'time': '1', 'type': 'x'}).status_code == 404
+    assert client.post('/api/history/', json={'userId': user_id, 'time': '1' * 81, 'type': 'x'}).status_code == 400
+    buffer.close()
+
+
+def test_write_behind_flushes_on_size_time_and_close(tmp_path):
+    """Test the time and size flush triggers and the flush on close."""
+    app = _write_behind_app(tmp_path, HISTORY_WRITE_BEHIND_BATCH=2, HISTORY_WRITE_BEHIND_INTERVAL=0.05)
+    client = app.test_client()
+    user_id = create_test_user_id(app)
+    buffer = app.extensions['history_write_buffer']
+    post = lambda: client.post('/api/history/', json={'userId': user_id, 'time': '11:11', 'type': 'Mirror Hour'})
+
+    assert post().status_code == 202
+    deadline = time.monotonic() + 5
+    while buffer.stats()['written'] < 1 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert buffer.stats()['written'] == 1 # time trigger
+
+    # Size trigger: a full batch is written without waiting for the interval
+    buffer.flush_interval = 60
+    post()
+    post()
+    deadline = time.monotonic() + 5
+    while buffer.stats()['written'] < 3 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert buffer.stats()['written'] == 3
+
+    post()
+    buffer.close() # flushes the row still pending
+    assert buffer.stats()['written'] == 4
+    with app.app_context():
+        assert HistoryItem.query.filter_by(user_id=user_id).count() == 4
+    response = post()
+    assert response.status_code == 503 and response.headers['Retry-After'] == '1'
+
+
+def test_write_behind_isolates_failing_groups(app):
+    """Test that a failing batch is retried per group so only the bad group is dropped."""
+    from app.services.write_behind import BufferFullError, WriteBehindBuffer
+    written = []
+
+    def writer(rows):
+        if any(row['user'] == 'bad' for row in rows):
+            raise RuntimeError('constraint failed')
+        written.extend(rows)
+
+    buffer = WriteBehindBuffer(app, writer, group_key=lambda row: row['user'], max_batch=10,
+                               flush_interval=60, max_depth=4)
+    for user in ('a', 'bad', 'b', 'a'):
+        buffer.append({'user': user})
+    with pytest.raises(BufferFullError):
+        buffer.append({'user': 'c'})
+    assert buffer.flush() == 3
+    assert [row['user'] for row in written] == ['a', 'a', 'b']
+    assert buffer.stats()['failed'] == 1 and buffer.stats()['rejected'] == 1
+    buffer.close()
+
+
+def _session_token(app, user_id):
+    with app.app_context():
+        return app.extensions['session_tokens'].issue(user_id)
+
+
+def test_history_with_session_token_skips_user_lookup(client, app):
+    """Test that a valid session token replaces the users-table existence check."""
+    user_id = create_test_user_id(app)
+    headers = {'Authorization': f'Bearer {_session_token(app, user_id)}'}
+
+    # userId defaults to the token's user
+    response = client.post('/api/history/batch', headers=headers,
+                           json={'items': [{'time': '11:11', 'type': 'Mirror Hour'}]})
+    assert response.status_code == 201
+
+    statements = []
+    from sqlalchemy import event
+    with app.app_context():
+        engine = db.engine
+    listener = lambda conn, cursor, statement, *args: statements.append(statement)
+    event.listen(engine, 'before_cursor_execute', listener)
+    try:
+        assert client.get(f'/api/history/{user_id}/archives', headers=headers).status_code == 200
+        assert client.get(f'/api/history/{user_id}/export', headers=headers).status_code == 200
+    finally:
+        event.remove(engine, 'before_cursor_execute', listener)
+    assert statements and not any('FROM users' in statement for statement in statements)
+
+    tokens = app.extensions['session_tokens']
+    assert tokens.stats()['hits'] >= 2
+
+
+def test_history_session_token_rejections(client, app):
+    """Test 401 for forged or expired tokens and 403 for another user's history."""
+    user_id = create_test_user_id(app)
+    other_id = create_test_user_id(app, username='other', email='other@example.com')
+    item_id = add_history_items(app, other_id, 1)[0]
+    headers = {'Authorization': f'Bearer {_session_token(app, user_id)}'}
+
+    response = client.get(f'/api/history/{user_id}', headers={'Authorization': 'Bearer not-a-token'})
+    assert response.status_code == 401
+    assert response.headers['WWW-Authenticate'].startswith('Bearer')
+
+    assert client.get(f'/api/history/{other_id}', headers=headers).status_code == 403
+    response = client.post('/api/history/', headers=headers,
+                           json={'userId': other_id, 'time': '11:11', 'type': 'Mirror Hour'})
+    assert response.status_code == 403
+    response = client.delete('/api/history/batch', headers=headers, json={'userId': other_id, 'ids': [item_id]})
+    assert response.status_code == 403
+    assert client.delete(f'/api/history/{item_id}', headers=headers).status_code == 404
+
+    from app.services.tokens import InvalidTokenError, SessionTokens
+    expired = SessionTokens('secret', max_age=-1)
+    with pytest.raises(InvalidTokenError):
+        expired.verify(expired.issue(user_id))
+    with pytest.raises(InvalidTokenError):
+        SessionTokens('other-secret').verify(SessionTokens('secret').issue(user_id))
+
+    # Tokens stay optional unless required
+    assert client.get(f'/api/history/{user_id}').status_code == 200
+    app.config['SESSION_TOKEN_REQUIRED'] = True
+    assert client.get(f'/api/history/{user_id}').status_code == 401
+    assert client.get(f'/api/history/{user_id}', headers=headers).status_code == 200
+
+
+def test_session_tokens_off_without_secret_key():
+    """Test that without SECRET_KEY no per-process key is made up outside testing."""
+    from app import create_app
+    config = {'SQLALCHEMY_DATABASE_URI': 'sqlite:///:memory:'}
+    app = create_app(test_config=config)
+    assert app.extensions['session_tokens'] is None
+    with app.app_context():
+        db.create_all()
+    response = app.test_client().get('/api/history/1', headers={'Authorization': 'Bearer from-another-worker'})
+    assert response.status_code == 404
+
+    with pytest.raises(ValueError):
+        create_app(test_config=dict(config, SESSION_TOKEN_REQUIRED=True))
+    assert create_app(test_config=dict(config, SECRET_KEY='k')).extensions['session_tokens'] is not None
@@ -0,0 +1,130 @@
+import os
+from unittest.mock import patch, MagicMock
+from app import db
+from app.models import User
+
+
+def test_metrics_endpoint_reports_request_latency(client):
+    """Test that served requests show up in the Prometheus output."""
+    client.get('/api/history/998')
+
+    response = client.get('/metrics')
+    assert response.status_code == 200
+    assert response.mimetype == 'text/plain'
+    body = response.get_data(as_text=True)
+    assert '# TYPE http_request_duration_seconds histogram' in body
+    assert 'http_request_duration_seconds_count{method="GET",route="/api/history/<int:user_id>",status="404"} 1' in body
+
+
+def test_metrics_count_sql_statements_per_request(app, client):
+    """Test that SQL statements run during a request are counted."""
+    with app.app_context():
+        user = User(username='metricsuser', email='metrics@example.com', password='password')
+        db.session.add(user)
+        db.session.commit()
+        user_id = user.id
+
+    response = client.get(f'/api/history/{user_id}')
+
+    histogram = app.extensions['metrics'].get('db_statements_per_request')
+    assert histogram.count(route='/api/history/<int:user_id>') == 1
+    body = client.get('/metrics').get_data(as_text=True)
+    # User lookup plus the history query
+    assert 'db_statements_per_request_sum{route="/api/history/<int:user_id>"} 2' in body
+    # Metrics and Server-Timing share one set of SQL hooks, so they agree
+    assert 'desc="2 queries"' in response.headers['Server-Timing']
+
+    from sqlalchemy import event
+    from app.services import sql_profile
+    with app.app_context():
+        assert event.contains(db.engine, 'after_cursor_execute', sql_profile._after_cursor_execute)
+
+
+@patch('openai.OpenAI')
+def test_metrics_record_openai_latency_and_tokens(MockOpenAI, app, client, monkeypatch):
+    """Test that upstream latency and token usage from the completion are recorded."""
+    monkeypatch.setenv("OPENAI_API_KEY", os.environ.get("OPENAI_API_KEY") or "test_api_key_value")
+    mock_completion_instance = MagicMock()
+    mock_completion_instance.choices = [MagicMock(message=MagicMock(content="Analysis."))]
+    mock_completion_instance.usage = MagicMock(prompt_tokens=42, completion_tokens=17)
+    MockOpenAI.return_value.chat.completions.create.return_value = mock_completion_instance
+
+    client.post('/api/analyze/', json={'time': '10:11', 'message': 'Metrics'})
+
+    body = client.get('/metrics').get_data(as_text=True)
+    assert 'openai_request_duration_seconds_count{mode="complete",outcome="ok"} 1' in body
+    assert 'openai_tokens_total{kind="prompt"} 42' in body
+    assert 'openai_tokens_total{kind="completion"} 17' in body
+    assert 'analysis_cache_events_total{event="misses"} 1' in body
+    assert 'openai_circuit_open 0' in body
+
+
+def test_metrics_can_be_disabled():
+    """Test that METRICS_ENABLED=False removes the endpoint."""
+    from app import create_app
+    app = create_app(test_config={
+        'TESTING': True,
+        'SQLALCHEMY_DATABASE_URI': 'sqlite:///:memory:',
+        'METRICS_ENABLED': False,
+    })
+    assert app.test_client().get('/metrics').status_code == 404
+
+
+def test_sql_profile_server_timing(app, client):
+    """Test that each response reports its SQL count and DB time in Server-Timing."""
+    with app.app_context():
+        user = User(username='timinguser', email='timing@example.com', password='password')
+        db.session.add(user)
+        db.session.commit()
+        user_id = user.id
+
+    response = client.post('/api/history/', json={'userId': user_id, 'time': '11:11', 'type': 'Mirror Hour'})
+    assert response.status_code == 201
+    timing = response.headers['Server-Timing']
+    # Version bump (also the user check), the insert and the stats upsert; no lookup or refresh SELECTs
+    assert timing.startswith('db;dur=') and 'desc="3 queries"' in timing
+    assert 'app;dur=' in timing
+    assert 'redundant' not in timing
+
+
+def test_sql_profile_flags_repeats_and_budget(app, client, caplog):
+    """Test the query budget warning and the repeated / N+1 statement detection."""
+    from sqlalchemy import text
+    app.config['SQL_QUERY_BUDGET'] = 3
+    app.config['SQL_N_PLUS_ONE_THRESHOLD'] = 3
+
+    @app.route('/_test/n_plus_one')
+    def n_plus_one():
+        db.session.execute(text('SELECT 1')).all()
+        db.session.execute(text('SELECT 1')).all()
+        for i in range(3):
+            db.session.execute(text('SELECT :i'), {'i': i}).all()
+        return ''
+
+    with caplog.at_level('WARNING'):
+        response = client.get('/_test/n_plus_one')
+
+    assert 'desc="5 queries"' in response.headers['Server-Timing']
+    assert 'db-repeated;desc="1 redundant"' in response.headers['Server-Timing']
+    assert 'db-n-plus-one;desc="1 statements"' in response.headers['Server-Timing']
+    messages = [record.getMessage() for record in caplog.records]
+    assert any('ran 5 SQL statements (budget 3)' in message for message in messages)
+    assert any('repeated an identical SQL statement 2x: SELECT 1' in message for message in messages)
+    assert any('possible N+1' in message and 'SELECT ?' in message for message in messages)
+
+
+def test_sql_profile_can_be_disabled():
+    """Test that SQL_PROFILE='off' adds no headers and bad modes are rejected."""
+    import pytest
+    from app import create_app
+    app = create_app(test_config={'TESTING': True, 'SQLALCHEMY_DATABASE_URI': 'sqlite:///:memory:',
+                                  'SQL_PROFILE': 'off'})
+    with app.app_context():
+        db.create_all()
+    assert 'Server-Timing' not in app.test_client().get('/api/history/1').headers
+    # The metrics still count statements through the profile hooks
+    assert app.extensions['metrics'].get('db_statements_per_request').count(route='/api/history/<int:user_id>') == 1
+
+    with pytest.raises(ValueError):
+        create_app(test_config={'TESTING': True, 'SQLALCHEMY_DATABASE_URI': 'sqlite:///:memory:',
+                                'SQL_PROFILE': 'verbose'})